@@ -0,0 +1,78 @@
+"""
+Benchmark del tempo di import delle GUI.
+
+Importa ogni modulo GUI in un interprete pulito (nessuna finestra viene
+creata: main() è protetto da __name__ == "__main__"), misura il tempo di
+import e verifica che nessuna dipendenza pesante venga caricata all'avvio.
+
+Uso:
+    python UI/benchmark_startup.py [--repeat 5] [--budget 1.0]
+
+Exit code 1 se un modulo pesante è importato all'avvio o se il tempo
+mediano supera il budget (secondi).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+UI_DIR = os.path.dirname(os.path.abspath(__file__))
+
+GUI_MODULES = ["gui_feature_extractor", "train_gui"]
+
+# Moduli che non devono essere importati finché non servono
+HEAVY_MODULES = ["pandas", "numpy", "arff", "sklearn", "imblearn", "joblib", "scipy", "openpyxl", "matplotlib"]
+
+_PROBE = """
+import json, sys, time
+sys.path.insert(0, {ui_dir!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"elapsed": elapsed, "heavy": heavy}}))
+"""
+
+
+def measure(module, repeat):
+    """Tempi di import (s) su `repeat` interpreti puliti e moduli pesanti caricati."""
+    times = []
+    heavy = set()
+    for _ in range(repeat):
+        code = _PROBE.format(ui_dir=UI_DIR, module=module, heavy=HEAVY_MODULES)
+        proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=UI_DIR)
+        if proc.returncode != 0:
+            raise RuntimeError(f"Import di {module} fallito:\n{proc.stderr}")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        times.append(result["elapsed"])
+        heavy.update(result["heavy"])
+    return times, sorted(heavy)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark del tempo di avvio (import) delle GUI")
+    ap.add_argument("--repeat", type=int, default=5, help="Ripetizioni per modulo (default 5)")
+    ap.add_argument("--budget", type=float, default=1.0, help="Tempo mediano massimo di import in secondi")
+    args = ap.parse_args()
+
+    failed = False
+    for module in GUI_MODULES:
+        times, heavy = measure(module, args.repeat)
+        median = statistics.median(times)
+        status = "OK"
+        if heavy:
+            status = f"FAIL (import pesanti all'avvio: {', '.join(heavy)})"
+            failed = True
+        elif median > args.budget:
+            status = f"FAIL (oltre il budget di {args.budget:.2f}s)"
+            failed = True
+        print(f"{module:<24} mediana {median*1000:7.1f} ms  (min {min(times)*1000:.1f} ms)  {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
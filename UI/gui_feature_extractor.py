@@ -1,31 +1,55 @@
-import time
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
 import sys
 import json
-import glob
+import queue
+import threading
 
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
 # Try absolute import (runtime), fallback to relative import for editors/type-checkers
+# Moduli leggeri (solo stdlib): importati subito
 try:
-    from feature_extractors.csv_extract_eGeMAPS_FUNCTION import extract_egemaps_features, egemaps_features_v2
-    from feature_extractors.extract_features_custom import extract_custom_features
+    from feature_extractors.egemaps_feature_sets import egemaps_features_v2
+    from feature_extractors.progress import JsonlProgressLogger, combine_callbacks, format_eta
+    from feature_extractors.cancellation import CancellationToken, OperationCancelled
+    from feature_extractors.config_service import ConfigService
 except Exception:
-    from ..feature_extractors.csv_extract_eGeMAPS_FUNCTION import extract_egemaps_features, egemaps_features_v2
-    from ..feature_extractors.extract_features_custom import extract_custom_features
+    from ..feature_extractors.egemaps_feature_sets import egemaps_features_v2
+    from ..feature_extractors.progress import JsonlProgressLogger, combine_callbacks, format_eta
+    from ..feature_extractors.cancellation import CancellationToken, OperationCancelled
+    from ..feature_extractors.config_service import ConfigService
 
-try:
-    from excel_script.excel_converter import convert_single_csv_to_excel
-except Exception:
-    from ..excel_script.excel_converter import convert_single_csv_to_excel
-    # Fallback se il modulo non è trovato
-    def convert_single_csv_to_excel(csv_path):
+
+# Estrattori e convertitore Excel (pandas, numpy, liac-arff, openpyxl) importati
+# al primo uso, così la finestra appare subito. Gli import restano espliciti
+# (e quindi visibili a PyInstaller) dentro le funzioni.
+def extract_egemaps_features(*args, **kwargs):
+    from feature_extractors.csv_extract_eGeMAPS_FUNCTION import extract_egemaps_features as impl
+    return impl(*args, **kwargs)
+
+
+def extract_custom_features(*args, **kwargs):
+    from feature_extractors.extract_features_custom import extract_custom_features as impl
+    return impl(*args, **kwargs)
+
+
+def extract_combined_features(*args, **kwargs):
+    from feature_extractors.combined_extraction import extract_combined_features as impl
+    return impl(*args, **kwargs)
+
+
+def convert_single_csv_to_excel(csv_path):
+    try:
+        from excel_script.excel_converter import convert_single_csv_to_excel as impl
+    except Exception:
+        # Fallback se il modulo non è trovato
         print(f"Warning: csv_to_excel_converter not found, skipping Excel conversion")
         return None
+    return impl(csv_path)
 
 
 
@@ -215,6 +239,11 @@ class AudioFeatureExtractorGUI:
             # Se è eseguito da Python direttamente (sviluppo)
             self.config_file = os.path.join(os.path.dirname(__file__), 'gui_config.json')
 
+        # Config condivisa con gli estrattori (riletta solo se il file cambia)
+        self.config_service = ConfigService(self.config_file)
+
+        # Log JSON-lines degli eventi di progresso (capacity planning)
+        self.progress_log_file = os.path.join(os.path.dirname(self.config_file), 'extraction_events.jsonl')
         
         # Variables
         self.selected_path = tk.StringVar()
@@ -227,6 +256,11 @@ class AudioFeatureExtractorGUI:
         # AGGIUNTO: Traccia le feature selezionate
         self.selected_egemaps_features = []
         self.selected_custom_features = []
+
+        # Estrazione in background: il worker non tocca Tk, comunica via coda
+        self.extraction_thread = None
+        self.ui_queue = queue.Queue()
+        self.cancel_token = None
         
         # Load configuration from JSON
         self.config = self.load_config()
@@ -671,11 +705,29 @@ class AudioFeatureExtractorGUI:
             activeforeground=self.colors['white']
         )
         self.extract_button.pack()
+
+        # Cancel button (attivo solo durante l'estrazione)
+        self.cancel_button = tk.Button(
+            action_content,
+            text="⏹ Cancel",
+            command=self.cancel_extraction,
+            bg=self.colors['danger'],
+            fg=self.colors['white'],
+            font=('Segoe UI', 10, 'bold'),
+            relief='flat',
+            padx=30,
+            pady=6,
+            cursor='hand2',
+            activebackground='#c0392b',
+            activeforeground=self.colors['white'],
+            state='disabled'
+        )
+        self.cancel_button.pack(pady=(8, 0))
         
         # Keyboard shortcut label
         shortcut_label = tk.Label(
             action_content,
-            text="Shortcut: Ctrl+E",
+            text="Shortcut: Ctrl+E  |  Esc: Cancel",
             bg=self.colors['bg'],
             fg='#95a5a6',
             font=('Segoe UI', 8)
@@ -685,6 +737,7 @@ class AudioFeatureExtractorGUI:
         # Bind keyboard shortcuts
         self.root.bind('<Control-e>', lambda e: self.extract_features())
         self.root.bind('<Control-E>', lambda e: self.extract_features())
+        self.root.bind('<Escape>', lambda e: self.cancel_extraction())
 
 
         # Status bar
@@ -1114,51 +1167,36 @@ class AudioFeatureExtractorGUI:
         y = (dialog.winfo_screenheight() // 2) - (dialog.winfo_height() // 2)
         dialog.geometry(f"+{x}+{y}")
 
-    def cleanup_lld_files(self, path):
-        """Delete all LLD files created during feature extraction"""
-        try:
-            # Attendi che i processi rilascino i file
-            time.sleep(0.5)
-            self.root.update()
-            
-            if os.path.isfile(path):
-                base_dir = os.path.dirname(path)
-                pattern = os.path.join(base_dir, '*LLD.csv')
-            else:
-                pattern = os.path.join(path, '**', '*LLD.csv')
-            
-            lld_files = glob.glob(pattern, recursive=True)
-            deleted_count = 0
-            failed_files = []
-            
-            for lld_file in lld_files:
-                # Prova fino a 3 volte con delay
-                for attempt in range(3):
-                    try:
-                        if os.path.exists(lld_file):
-                            os.remove(lld_file)
-                            deleted_count += 1
-                            print(f"Deleted: {lld_file}")
-                        break
-                    except PermissionError:
-                        if attempt < 2:
-                            time.sleep(0.3)
-                        else:
-                            failed_files.append(os.path.basename(lld_file))
-                            print(f"Could not delete (permission denied): {lld_file}")
-                    except Exception as e:
-                        failed_files.append(os.path.basename(lld_file))
-                        print(f"Error deleting {lld_file}: {e}")
-                        break
-            
-            if failed_files:
-                print(f"Warning: Could not delete {len(failed_files)} file(s): {', '.join(failed_files[:3])}")
-                
-        except Exception as e:
-            print(f"Warning: Error during LLD cleanup: {e}")
+    def cleanup_created_files(self, created_files):
+        """Delete the intermediate files (LLD) created by this extraction run.
+
+        Only the paths in the manifest returned by the extractors are removed:
+        no tree walk, and LLD files the user already had are left untouched.
+        SMILExtract has already exited when a path is listed, so no wait is needed.
+        """
+        deleted_count = 0
+        failed_files = []
+        for lld_file in created_files:
+            try:
+                os.remove(lld_file)
+                deleted_count += 1
+                print(f"Deleted: {lld_file}")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                failed_files.append(os.path.basename(lld_file))
+                print(f"Error deleting {lld_file}: {e}")
+
+        if failed_files:
+            print(f"Warning: Could not delete {len(failed_files)} file(s): {', '.join(failed_files[:3])}")
+        return deleted_count
 
     def extract_features(self):
-        """Main extraction function with improved error handling"""
+        """Main extraction function: validates input, asks output paths, starts the worker"""
+        if self.extraction_thread is not None and self.extraction_thread.is_alive():
+            self.set_status("Extraction already running...", "warning")
+            return
+
         path = self.selected_path.get()
         
         if not path:
@@ -1178,70 +1216,143 @@ class AudioFeatureExtractorGUI:
             self.set_status("openSMILE not configured - Click Settings first", "error")
             return
 
+        # I dialog Tk vanno aperti sul main thread: chiedi subito i path di output
+        out_egemaps = None
+        if self.extract_egemaps.get():
+            out_egemaps = filedialog.asksaveasfilename(
+                defaultextension=".csv",
+                filetypes=[("CSV files", "*.csv")],
+                initialfile="extracted_features_eGeMAPS.csv"
+            )
+            if not out_egemaps:
+                self.set_status("Operation cancelled by user", "warning")
+                return
+
+        out_custom = None
+        if self.extract_custom.get():
+            out_custom = filedialog.asksaveasfilename(
+                defaultextension=".csv",
+                filetypes=[("CSV files", "*.csv")],
+                initialfile="extracted_features_custom.csv"
+            )
+            if not out_custom:
+                self.set_status("Operation cancelled by user", "warning")
+                return
+
+        # MODIFICATO: Determina cosa passare allo script
+        if self.selected_egemaps_features == "all":
+            egemaps_features = "all"
+        elif isinstance(self.selected_egemaps_features, list):
+            egemaps_features = self.selected_egemaps_features
+        else:
+            egemaps_features = None
+
+        # Snapshot delle opzioni: il worker non legge variabili Tk
+        job = {
+            'path': path,
+            'out_egemaps': out_egemaps,
+            'out_custom': out_custom,
+            'egemaps_features': egemaps_features,
+            'custom_features': self.selected_custom_features,
+            'convert_to_excel': self.convert_to_excel.get(),
+        }
 
-        # Disable button and start progress
+        # Disable button and start progress (indeterminato finché non arriva il totale)
+        self.cancel_token = CancellationToken()
+        job['cancel_token'] = self.cancel_token
         self.extract_button.config(state='disabled', bg='#95a5a6')
+        self.cancel_button.config(state='normal')
+        self.progress.config(mode='indeterminate', value=0)
         self.progress.start(10)
-        self.root.update()
 
+        self.extraction_thread = threading.Thread(
+            target=self._extraction_worker, args=(job,), daemon=True
+        )
+        self.extraction_thread.start()
+        self.root.after(100, self._poll_extraction_queue)
 
+    def cancel_extraction(self):
+        """Richiede la cancellazione: termina subito l'eventuale SMILExtract in corso"""
+        if self.cancel_token is None or self.cancel_token.cancelled:
+            return
+        self.cancel_token.cancel()
+        self.cancel_button.config(state='disabled')
+        self.set_status("Cancelling extraction...", "warning")
+
+    def _post(self, kind, *payload):
+        """Invia un messaggio dal worker alla GUI (thread-safe)"""
+        self.ui_queue.put((kind, payload))
+
+    def _extraction_worker(self, job):
+        """Esegue l'estrazione in background; comunica solo tramite self.ui_queue"""
+        path = job['path']
+        # Manifest dei file intermedi creati da questo run (pulizia mirata nel finally)
+        created_files = []
+        progress = combine_callbacks(
+            lambda event: self._post('progress', event),
+            JsonlProgressLogger(self.progress_log_file)
+        )
         try:
-            # eGeMAPS extraction
-            if self.extract_egemaps.get():
-                out_egemaps = filedialog.asksaveasfilename(
-                    defaultextension=".csv",
-                    filetypes=[("CSV files", "*.csv")],
-                    initialfile="extracted_features_eGeMAPS.csv"
+            out_egemaps = job['out_egemaps']
+            out_custom = job['out_custom']
+
+            # Entrambi i set: un solo pool condiviso per eGeMAPS e LLD/custom
+            if out_egemaps and out_custom:
+                for out_path in (out_egemaps, out_custom):
+                    if os.path.exists(out_path):
+                        try:
+                            os.remove(out_path)
+                        except Exception as e:
+                            self._post('status', f"Warning: Could not remove existing file: {e}", "warning")
+
+                self._post('status', "Extracting eGeMAPS and custom features in parallel...", "progress")
+                extract_combined_features(
+                    path, out_egemaps, out_custom,
+                    egemaps_features=job['egemaps_features'],
+                    custom_features=job['custom_features'],
+                    voicing_thr=0.55,
+                    min_pause=0.20,
+                    long_pause_thr=1.5,
+                    smooth_win_ms=50,
+                    hysteresis=True,
+                    progress_callback=progress,
+                    cancel_token=job['cancel_token'],
+                    created_files=created_files,
+                    config=self.config_service
                 )
-                if not out_egemaps:
-                    self.set_status("Operation cancelled by user", "warning")
-                    return
-                
+                self._post('status', "eGeMAPS and custom extraction completed successfully", "success")
+
+                if job['convert_to_excel']:
+                    self._convert_to_excel(out_egemaps, "eGeMAPS")
+                    self._convert_to_excel(out_custom, "custom")
+
+                # Già estratti entrambi: salta i passi singoli
+                out_egemaps = out_custom = None
+
+            # eGeMAPS extraction
+            if out_egemaps:
                 # Rimuovi file esistente se presente
                 if os.path.exists(out_egemaps):
                     try:
                         os.remove(out_egemaps)
-                        self.set_status(f"Removed existing file: {os.path.basename(out_egemaps)}", "info")
+                        self._post('status', f"Removed existing file: {os.path.basename(out_egemaps)}", "info")
                     except Exception as e:
-                        self.set_status(f"Warning: Could not remove existing file: {e}", "warning")
+                        self._post('status', f"Warning: Could not remove existing file: {e}", "warning")
                     
-                self.set_status("Extracting eGeMAPS features...", "progress")
-                
-                # MODIFICATO: Determina cosa passare allo script
-                if self.selected_egemaps_features == "all":
-                    features_to_extract = "all"
-                elif isinstance(self.selected_egemaps_features, list):
-                    features_to_extract = self.selected_egemaps_features
-                else:
-                    features_to_extract = None
-                
-                extract_egemaps_features(path, out_egemaps, selected_features=features_to_extract)
-                self.set_status("eGeMAPS extraction completed successfully", "success")
+                self._post('status', "Extracting eGeMAPS features...", "progress")
+                extract_egemaps_features(path, out_egemaps, selected_features=job['egemaps_features'],
+                                         progress_callback=progress, cancel_token=job['cancel_token'],
+                                         config=self.config_service)
+                self._post('status', "eGeMAPS extraction completed successfully", "success")
 
                 # NUOVO: Conversione Excel
-                if self.convert_to_excel.get():
-                    self.set_status("Converting eGeMAPS CSV to Excel...", "progress")
-                    try:
-                        excel_path = convert_single_csv_to_excel(out_egemaps)
-                        if excel_path:
-                            self.set_status(f"Excel created: {os.path.basename(excel_path)}", "success")
-                    except Exception as e:
-                        self.set_status(f"Excel conversion failed: {e}", "warning")
+                if job['convert_to_excel']:
+                    self._convert_to_excel(out_egemaps, "eGeMAPS")
 
+            job['cancel_token'].raise_if_cancelled()
 
             # Custom extraction
-            # Custom extraction
-            if self.extract_custom.get():
-                out_custom = filedialog.asksaveasfilename(
-                    defaultextension=".csv",
-                    filetypes=[("CSV files", "*.csv")],
-                    initialfile="extracted_features_custom.csv"
-                )
-                if not out_custom:
-                    self.extract_button.config(state='normal', bg=self.colors['success'])
-                    self.progress.stop()
-                    return
-                
+            if out_custom:
                 # Rimuovi file esistente se presente
                 if os.path.exists(out_custom):
                     try:
@@ -1249,7 +1360,7 @@ class AudioFeatureExtractorGUI:
                     except:
                         pass
                 
-                self.set_status("Extracting custom features (LLD will be generated if needed)...", "progress")
+                self._post('status', "Extracting custom features (LLD will be generated if needed)...", "progress")
                 
                 # extract_custom_features si occupa di tutto: cerca LLD, li genera se necessario, ed estrae le feature
                 extract_custom_features(
@@ -1260,38 +1371,91 @@ class AudioFeatureExtractorGUI:
                     smooth_win_ms=50,
                     hysteresis=True,
                     output_path=out_custom, 
-                    selected_features=self.selected_custom_features
+                    selected_features=job['custom_features'],
+                    progress_callback=progress,
+                    cancel_token=job['cancel_token'],
+                    created_files=created_files,
+                    config=self.config_service
                 )
                 
-                self.set_status("Custom extraction completed successfully", "success")
+                self._post('status', "Custom extraction completed successfully", "success")
 
                 # NUOVO: Conversione Excel
-                if self.convert_to_excel.get():
-                    self.set_status("Converting custom CSV to Excel...", "progress")
-                    try:
-                        excel_path = convert_single_csv_to_excel(out_custom)
-                        if excel_path:
-                            self.set_status(f"Excel created: {os.path.basename(excel_path)}", "success")
-                    except Exception as e:
-                        self.set_status(f"Excel conversion failed: {e}", "warning")
+                if job['convert_to_excel']:
+                    self._convert_to_excel(out_custom, "custom")
 
             # Messaggio finale di successo
-            self.set_status("All feature extraction completed successfully!", "success")
+            self._post('status', "All feature extraction completed successfully!", "success")
 
-            
+        except OperationCancelled:
+            self._post('status', "Extraction cancelled - no CSV written for the interrupted step", "warning")
         except Exception as e:
-            self.set_status(f"Error during extraction: {str(e)}", "error")
+            self._post('status', f"Error during extraction: {str(e)}", "error")
         finally:
-            # Assicurati che cleanup_lld_files sia chiamato
+            # Elimina solo gli LLD creati da questo run (anche se interrotto)
             try:
-                self.cleanup_lld_files(path)
+                self.cleanup_created_files(created_files)
             except Exception as e:
                 print(f"Warning: Error during LLD cleanup: {e}")
-            
-            # Re-enable button and stop progress
-            self.extract_button.config(state='normal', bg=self.colors['success'])
+            self._post('done')
+
+    def _convert_to_excel(self, csv_path, label):
+        """Conversione Excel di un CSV di output (eseguita nel worker)"""
+        self._post('status', f"Converting {label} CSV to Excel...", "progress")
+        try:
+            excel_path = convert_single_csv_to_excel(csv_path)
+            if excel_path:
+                self._post('status', f"Excel created: {os.path.basename(excel_path)}", "success")
+        except Exception as e:
+            self._post('status', f"Excel conversion failed: {e}", "warning")
+
+    def _poll_extraction_queue(self):
+        """Svuota la coda del worker sul main thread e si ri-schedula finché non termina"""
+        # Gli eventi di progresso sono accorpati: si mostra solo l'ultimo del giro
+        last_progress = None
+        try:
+            while True:
+                kind, payload = self.ui_queue.get_nowait()
+                if kind == 'progress':
+                    if payload[0]['event'] != 'file_started':
+                        last_progress = payload[0]
+                elif kind == 'status':
+                    if last_progress is not None:
+                        self._show_progress(last_progress)
+                        last_progress = None
+                    self.set_status(*payload)
+                elif kind == 'done':
+                    # Re-enable button and stop progress
+                    self.extract_button.config(state='normal', bg=self.colors['success'])
+                    self.cancel_button.config(state='disabled')
+                    self.progress.stop()
+                    self.cancel_token = None
+                    return
+        except queue.Empty:
+            pass
+        if last_progress is not None:
+            self._show_progress(last_progress)
+        self.root.after(100, self._poll_extraction_queue)
+
+    def _show_progress(self, event):
+        """Barra determinata + file/s ed ETA da un evento di progresso"""
+        stage_names = {'egemaps': 'eGeMAPS', 'lld': 'LLD generation', 'custom': 'Custom features',
+                       'combined': 'eGeMAPS + custom tasks'}
+        total = event.get('total') or 0
+        done = event.get('done', 0)
+
+        if str(self.progress['mode']) != 'determinate':
             self.progress.stop()
-            self.root.update()
+            self.progress.config(mode='determinate')
+        self.progress.config(maximum=max(total, 1), value=done)
+
+        stage = stage_names.get(event['stage'], event['stage'])
+        if event['event'] == 'batch_finished':
+            self.set_status(f"{stage}: {done}/{total} files in {format_eta(event['elapsed'])} "
+                            f"({event['files_per_sec']:.2f} files/s)", "progress")
+        else:
+            self.set_status(f"{stage}: {done}/{total} files | {event['files_per_sec']:.2f} files/s | "
+                            f"ETA {format_eta(event['eta_seconds'])}", "progress")
 
 
 
@@ -1,7 +1,10 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
+import queue
 import json
+import math
+import statistics
 import os
 import sys
 from pathlib import Path
@@ -14,12 +17,13 @@ train_dir = os.path.join(project_root, "train")
 if train_dir not in sys.path:
     sys.path.insert(0, train_dir)
 
-# Import delle funzioni dal train.py
+# Import della configurazione modelli (leggera: nessun import di sklearn).
+# train.py (sklearn, imblearn, joblib) è importato al primo training.
 try:
-    from train import main as train_main, MODEL_CONFIGS
+    from model_configs import MODEL_CONFIGS
 except ImportError as e:
     print(f"Errore nell'importazione dei moduli: {e}")
-    print("Assicurati che train.py sia nella stessa directory e che tutti i pacchetti siano installati.")
+    print("Assicurati che model_configs.py sia nella cartella train.")
     sys.exit(1)
 
 class StatusBar(ttk.Frame):
@@ -72,6 +76,12 @@ class StatusBar(ttk.Frame):
         self.timer = None
 
 class TrainingGUI:
+    # Log: flush a intervalli regolari e numero massimo di righe nel widget
+    LOG_FLUSH_MS = 100
+    LOG_MAX_LINES = 5000
+    # Dashboard Monte-Carlo: intervallo di aggiornamento della tabella
+    FOLD_POLL_MS = 250
+
     def __init__(self, root):
         self.root = root
         self.root.title("ML Trainer - Speech Analysis")
@@ -125,6 +135,13 @@ class TrainingGUI:
         self.training_in_progress = False
         self.training_thread = None
         self.stop_training_flag = False
+
+        # Coda dei messaggi di log: scritta da qualsiasi thread, svuotata dal main thread
+        self.log_queue = queue.Queue()
+
+        # Score per fold pubblicati da train.main (dashboard live)
+        self.fold_queue = queue.Queue()
+        self.fold_scores = {}
         
         # Applica stile moderno PRIMA di setup_ui
         self.apply_modern_style()
@@ -135,6 +152,10 @@ class TrainingGUI:
         # Aggiorna i parametri predefiniti in base al modello
         self.update_default_estimators()
 
+        # Avvia il flush periodico del log e della dashboard
+        self.root.after(self.LOG_FLUSH_MS, self._flush_log_queue)
+        self.root.after(self.FOLD_POLL_MS, self._poll_fold_queue)
+
     def load_config(self):
         """Carica la configurazione dal file JSON"""
         if os.path.exists(self.config_file):
@@ -380,8 +401,26 @@ class TrainingGUI:
         right_panel = ttk.Frame(main_frame, style="Card.TFrame")
         right_panel.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
         
+        # Dashboard Monte-Carlo live: media ± IC 95% per valore della griglia
+        mc_label = ttk.Label(right_panel, text="Monte-Carlo CV (live)", style="Header.TLabel")
+        mc_label.pack(anchor=tk.W, padx=15, pady=(15, 10))
+
+        mc_columns = ("param", "folds", "mean", "ci", "range")
+        self.mc_tree = ttk.Treeview(right_panel, columns=mc_columns, show="headings", height=5)
+        for col, heading, width in (
+            ("param", "Parametro", 110),
+            ("folds", "Fold", 70),
+            ("mean", "Balanced acc. ± IC95%", 170),
+            ("ci", "IC 95%", 130),
+            ("range", "Min – Max", 110),
+        ):
+            self.mc_tree.heading(col, text=heading)
+            self.mc_tree.column(col, width=width, anchor=tk.CENTER)
+        self.mc_tree.tag_configure("best", background="#d5f5e3")
+        self.mc_tree.pack(fill=tk.X, padx=15, pady=(0, 10))
+
         output_label = ttk.Label(right_panel, text="Output Training", style="Header.TLabel")
-        output_label.pack(anchor=tk.W, padx=15, pady=(15, 10))
+        output_label.pack(anchor=tk.W, padx=15, pady=(5, 10))
         
         self.output_text = scrolledtext.ScrolledText(
             right_panel,
@@ -547,13 +586,13 @@ class TrainingGUI:
         
         self.create_path_selector(input_frame, "Custom Dataset:", self.dataset_custom, "csv")
         self.create_path_selector(input_frame, "eGeMAPS Features:", self.dataset_egemaps, "csv")
-        self.create_path_selector(input_frame, "Dataset Index:", self.dataset_index, "xlsx")
+        self.create_path_selector(input_frame, "Dataset Index:", self.dataset_index, "index")
         
         # Dataset merged
         merged_frame = ttk.LabelFrame(scrollable_frame, text="Dataset Merged (Modalità Merged)", padding=15)
         merged_frame.pack(fill=tk.X, pady=(0, 15))
         
-        self.create_path_selector(merged_frame, "Merged Dataset:", self.merged_dataset, "csv")
+        self.create_path_selector(merged_frame, "Merged Dataset:", self.merged_dataset, "dataset")
         
         # Target column
         target_frame = ttk.Frame(merged_frame)
@@ -620,7 +659,11 @@ class TrainingGUI:
         """Apre il dialog per selezionare un file"""
         file_types = {
             "csv": [("CSV files", "*.csv"), ("All files", "*.*")],
+            "dataset": [("Dataset files", "*.csv *.parquet"), ("CSV files", "*.csv"),
+                        ("Parquet files", "*.parquet"), ("All files", "*.*")],
             "xlsx": [("Excel files", "*.xlsx"), ("All files", "*.*")],
+            "index": [("Dataset index", "*.sqlite *.db *.xlsx"), ("SQLite index", "*.sqlite *.db"),
+                      ("Excel files", "*.xlsx"), ("All files", "*.*")],
             "pkl": [("Pickle files", "*.pkl"), ("All files", "*.*")],
             "json": [("JSON files", "*.json"), ("All files", "*.*")]
         }
@@ -672,15 +715,105 @@ class TrainingGUI:
 
     def clear_output(self):
         """Pulisce l'output della console"""
+        # Scarta anche i messaggi ancora in coda
+        try:
+            while True:
+                self.log_queue.get_nowait()
+        except queue.Empty:
+            pass
         self.output_text.delete(1.0, tk.END)
         if not self.training_in_progress:
             self.status_bar.set_message("Output pulito", "info", 2000)
 
     def log_output(self, message):
-        """Aggiunge un messaggio all'output"""
-        self.output_text.insert(tk.END, message + "\n")
-        self.output_text.see(tk.END)
-        self.root.update_idletasks()
+        """Accoda un messaggio per l'output (thread-safe, nessuna chiamata Tk)"""
+        self.log_queue.put(message + "\n")
+
+    def _flush_log_queue(self):
+        """Scrive in un solo insert i messaggi accodati e limita le righe del widget"""
+        chunks = []
+        try:
+            while True:
+                chunks.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if chunks:
+            self.output_text.insert(tk.END, "".join(chunks))
+
+            # Ring buffer: elimina le righe più vecchie oltre LOG_MAX_LINES
+            line_count = int(self.output_text.index('end-1c').split('.')[0])
+            excess = line_count - self.LOG_MAX_LINES
+            if excess > 0:
+                self.output_text.delete('1.0', f'{excess + 1}.0')
+
+            self.output_text.see(tk.END)
+
+        self.root.after(self.LOG_FLUSH_MS, self._flush_log_queue)
+
+    def reset_mc_dashboard(self):
+        """Svuota la dashboard Monte-Carlo"""
+        try:
+            while True:
+                self.fold_queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.fold_scores = {}
+        for item in self.mc_tree.get_children():
+            self.mc_tree.delete(item)
+
+    def _poll_fold_queue(self):
+        """Applica alla tabella gli eventi per fold arrivati dal thread di training"""
+        updated = set()
+        finished = set()
+        try:
+            while True:
+                event = self.fold_queue.get_nowait()
+                key = str(event['param_value'])
+                if event['event'] == 'fold':
+                    self.fold_scores.setdefault(key, {'scores': [], 'n_splits': event['n_splits'],
+                                                      'param_name': event['param_name']})
+                    self.fold_scores[key]['scores'].append(event['score'])
+                    updated.add(key)
+                elif event['event'] == 'param_finished':
+                    finished.add(key)
+        except queue.Empty:
+            pass
+
+        for key in updated | finished:
+            if key in self.fold_scores:
+                self._render_mc_row(key, done=key in finished)
+        if updated:
+            self._highlight_best_mc_row()
+
+        self.root.after(self.FOLD_POLL_MS, self._poll_fold_queue)
+
+    def _render_mc_row(self, key, done=False):
+        """Aggiorna la riga di un valore della griglia: media ± 1.96·std/√n"""
+        entry = self.fold_scores[key]
+        scores = entry['scores']
+        n = len(scores)
+        mean = statistics.fmean(scores)
+        half_width = 1.96 * statistics.stdev(scores) / math.sqrt(n) if n > 1 else float('nan')
+
+        folds = f"{n}/{entry['n_splits']}" + (" ✓" if done else "")
+        mean_text = f"{mean:.3f} ± {half_width:.3f}" if n > 1 else f"{mean:.3f}"
+        ci_text = f"[{mean - half_width:.3f}, {mean + half_width:.3f}]" if n > 1 else "–"
+        values = (f"{entry['param_name']}={key}", folds, mean_text, ci_text,
+                  f"{min(scores):.3f} – {max(scores):.3f}")
+
+        if self.mc_tree.exists(key):
+            self.mc_tree.item(key, values=values)
+        else:
+            self.mc_tree.insert("", tk.END, iid=key, values=values)
+
+    def _highlight_best_mc_row(self):
+        """Evidenzia il valore con la media più alta finora"""
+        if not self.fold_scores:
+            return
+        best = max(self.fold_scores, key=lambda k: statistics.fmean(self.fold_scores[k]['scores']))
+        for item in self.mc_tree.get_children():
+            self.mc_tree.item(item, tags=("best",) if item == best else ())
 
     def validate_inputs(self):
         """Valida che tutti i percorsi necessari siano impostati"""
@@ -767,6 +900,7 @@ class TrainingGUI:
         self.progress.start(10)
         
         self.clear_output()
+        self.reset_mc_dashboard()
         self.log_output(f"=== Inizio Training: {model_name} ===\n")
         
         if self.use_merged_dataset.get():
@@ -795,8 +929,10 @@ class TrainingGUI:
 
     def run_training(self, estimators, model_type):
         """Esegue il training (chiamato in un thread separato)"""
+        original_stdout = sys.stdout
         try:
-            original_stdout = sys.stdout
+            # Import pesante rimandato al primo training (avvio rapido della finestra)
+            from train import main as train_main
             
             class OutputRedirector:
                 def __init__(self, callback, stop_flag_callback):
@@ -828,7 +964,9 @@ class TrainingGUI:
                     grid_param_list=estimators,
                     model_type=model_type,
                     merged_dataset_path=self.merged_dataset.get(),
-                    target_column=self.target_column.get()
+                    target_column=self.target_column.get(),
+                    fold_callback=self.fold_queue.put,
+                    should_stop=lambda: self.stop_training_flag
                 )
             else:
                 train_main(
@@ -843,7 +981,9 @@ class TrainingGUI:
                     grid_param_list=estimators,
                     model_type=model_type,
                     merged_dataset_path=None,
-                    target_column=self.target_column.get()
+                    target_column=self.target_column.get(),
+                    fold_callback=self.fold_queue.put,
+                    should_stop=lambda: self.stop_training_flag
                 )
             
             sys.stdout = original_stdout
@@ -859,7 +999,9 @@ class TrainingGUI:
         
         except Exception as e:
             sys.stdout = original_stdout
-            self.root.after(0, self.training_complete, False, str(e))
+            # TrainingStopped (should_stop) arriva qui: trattalo come interruzione
+            error_msg = "Training interrotto dall'utente" if self.stop_training_flag else str(e)
+            self.root.after(0, self.training_complete, False, error_msg)
 
     def training_complete(self, success, error_msg):
         """Chiamato quando il training è completato"""
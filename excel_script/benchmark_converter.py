@@ -0,0 +1,94 @@
+"""
+Benchmark della lettura CSV del convertitore Excel.
+
+Genera CSV sintetici simili ai file di feature (filename, subjectId e colonne
+float, separatore ';') di alcuni MB e confronta:
+  - robust_read_csv: campione di byte + un solo parsing con engine C
+  - cascata legacy: encoding x separatori con engine python (_cascade_read_csv)
+Con --export misura anche la conversione XLSX in streaming (stream_csv_to_excel).
+
+Uso:
+    python excel_script/benchmark_converter.py [--sizes 5 20 50] [--repeat 3] [--skip-legacy] [--export]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from excel_converter import robust_read_csv, stream_csv_to_excel, _cascade_read_csv, CANDIDATE_ENCODINGS
+
+
+def write_feature_csv(path, size_mb, n_features=88, sep=";", encoding="utf-8", seed=0):
+    """Scrive un CSV di feature di circa size_mb MB; ritorna il numero di righe."""
+    rng = random.Random(seed)
+    header = ["filename", "subjectId"] + [f"feature_{i}" for i in range(n_features)]
+    target = size_mb * 1024 * 1024
+    rows = 0
+    written = 0
+    with open(path, "w", encoding=encoding, newline="") as f:
+        line = sep.join(header) + "\n"
+        f.write(line)
+        written += len(line)
+        while written < target:
+            values = [f"registrazione_è_{rows}.wav", str(rng.randrange(2**31 - 1))]
+            values += [f"{rng.gauss(0, 1):.6f}" for _ in range(n_features)]
+            line = sep.join(values) + "\n"
+            f.write(line)
+            written += len(line)
+            rows += 1
+    return rows
+
+
+def timed(func, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark della lettura CSV (excel_converter)")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[5, 20], help="Dimensioni dei CSV in MB (default 5 20)")
+    ap.add_argument("--encodings", nargs="+", default=["utf-8", "cp1252"], help="Encoding dei CSV generati")
+    ap.add_argument("--repeat", type=int, default=3, help="Ripetizioni per misura (mediana)")
+    ap.add_argument("--skip-legacy", action="store_true", help="Non misurare la cascata legacy (lenta)")
+    ap.add_argument("--export", action="store_true", help="Misura anche l'export XLSX in streaming")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_mb in args.sizes:
+            for encoding in args.encodings:
+                path = os.path.join(tmp, f"features_{size_mb}mb_{encoding}.csv")
+                rows = write_feature_csv(path, size_mb, encoding=encoding)
+
+                fast_time, (df, enc, sep) = timed(lambda: robust_read_csv(path), args.repeat)
+                line = (f"{size_mb:>4} MB {encoding:<7} {rows:>8} righe | "
+                        f"robust_read_csv {fast_time:7.2f}s ({enc}, sep {sep!r}, {df.shape[1]} col)")
+
+                if not args.skip_legacy:
+                    legacy_time, (df_legacy, _, _) = timed(
+                        lambda: _cascade_read_csv(path, CANDIDATE_ENCODINGS), 1)
+                    same = df_legacy.shape == df.shape
+                    line += f" | legacy {legacy_time:7.2f}s (x{legacy_time / fast_time:.1f})"
+                    if not same:
+                        line += f" ⚠ shape diversa {df_legacy.shape} vs {df.shape}"
+
+                if args.export:
+                    xlsx = os.path.splitext(path)[0] + ".xlsx"
+                    export_time, info = timed(lambda: stream_csv_to_excel(path, xlsx), 1)
+                    line += (f" | xlsx {export_time:7.2f}s ({os.path.getsize(xlsx) / 2**20:.1f} MB, "
+                             f"{len(info['sheets'])} fogli)")
+                print(line, flush=True)
+
+
+if __name__ == "__main__":
+    main()
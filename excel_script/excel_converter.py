@@ -1,5 +1,10 @@
 import os
 import csv
+import json
+import time
+import codecs
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import pandas as pd
 
 CANDIDATE_ENCODINGS = [
@@ -8,6 +13,18 @@ CANDIDATE_ENCODINGS = [
 ]
 CANDIDATE_SEPARATORS = [",", ";", "\t", "|"]
 
+# Byte letti per determinare encoding e separatore (il file viene poi letto una volta sola)
+SAMPLE_BYTES = 65536
+
+# Limiti di un foglio Excel e righe per blocco nell'export in streaming
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_COLS = 16384
+EXPORT_CHUNK_ROWS = 5000
+EXPORT_CHUNK_CELLS = 1_000_000  # tabelle larghe (ComParE): meno righe per blocco
+
+# Manifest (in ogni excel_output) con mtime/size dei CSV già convertiti
+MANIFEST_NAME = ".conversion_manifest.json"
+
 
 def sniff_delimiter(sample_text, default=";"):
     """Prova a indovinare il delimitatore."""
@@ -21,25 +38,105 @@ def sniff_delimiter(sample_text, default=";"):
         return best if counts.get(best, 0) > 0 else default
 
 
-def robust_read_csv(csv_path):
-    """Legge il CSV provando vari encoding e separatori."""
+def detect_encoding(raw, complete=False):
+    """
+    Determina l'encoding da un campione di byte (BOM, poi decodifica stretta).
+    complete=False: il campione può troncare un carattere multibyte alla fine.
+    """
+    if raw.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if raw.startswith(codecs.BOM_UTF16_LE) or raw.startswith(codecs.BOM_UTF16_BE):
+        return "utf-16"
+    # UTF-16 senza BOM: un byte nullo ogni due nei caratteri ASCII
+    if raw and raw.count(b"\x00") * 4 >= len(raw):
+        return "utf-16-le" if raw[1::2].count(b"\x00") > raw[0::2].count(b"\x00") else "utf-16-be"
+
+    for enc in ("utf-8", "cp1252"):
+        try:
+            codecs.getincrementaldecoder(enc)().decode(raw, final=complete)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return "latin1"  # decodifica qualsiasi byte
+
+
+def detect_delimiter(sample_text, default=";"):
+    """
+    Sceglie il separatore presente con lo stesso numero di occorrenze (> 0) in tutte
+    le righe complete del campione; a parità vince il più frequente.
+    """
+    lines = [line for line in sample_text.splitlines()[:50] if line.strip()]
+    if len(lines) > 1 and not sample_text.endswith(("\n", "\r")):
+        lines = lines[:-1]  # l'ultima riga del campione può essere troncata
+    if not lines:
+        return default
+
+    best, best_count = None, 0
+    for sep in CANDIDATE_SEPARATORS:
+        counts = {line.count(sep) for line in lines}
+        if len(counts) == 1:
+            count = counts.pop()
+            if count > best_count:
+                best, best_count = sep, count
+    return best or sniff_delimiter("\n".join(lines), default=default)
+
+
+def detect_csv_format(csv_path, sample_bytes=SAMPLE_BYTES):
+    """
+    Determina encoding e separatore da un campione di `sample_bytes` byte.
+
+    Returns:
+        (encoding, separatore, campione_completo) - campione_completo è True se il
+        campione contiene l'intero file
+    """
     with open(csv_path, "rb") as f:
-        raw = f.read(32768)
+        raw = f.read(sample_bytes)
+        complete = not f.read(1)
+
+    enc = detect_encoding(raw, complete=complete)
+    sample_text = codecs.getincrementaldecoder(enc)(errors="replace").decode(raw, final=complete)
+    return enc, detect_delimiter(sample_text, default=";"), complete
+
+
+def robust_read_csv(csv_path, sample_bytes=SAMPLE_BYTES):
+    """
+    Legge il CSV con un solo parsing: encoding e separatore sono determinati una
+    volta da un campione di `sample_bytes` byte, poi pandas (engine C) legge il file.
+    La cascata di tentativi (_cascade_read_csv) parte solo se questo parsing fallisce.
+
+    Returns:
+        (DataFrame, encoding, separatore)
+    """
+    enc, sep, complete = detect_csv_format(csv_path, sample_bytes)
 
-    sample_decoded = None
-    enc_for_sample = None
-    for enc in CANDIDATE_ENCODINGS:
+    # Campione ASCII ma byte cp1252 più avanti nel file: un solo secondo tentativo veloce
+    attempts = [enc, "cp1252"] if enc == "utf-8" and not complete else [enc]
+    for attempt_enc in attempts:
         try:
-            sample_decoded = raw.decode(enc)
-            enc_for_sample = enc
+            df = pd.read_csv(csv_path, encoding=attempt_enc, sep=sep, engine="c", low_memory=False)
+            if df.shape[1] > 1:
+                return df, attempt_enc, sep
             break
-        except Exception:
+        except UnicodeDecodeError:
+            continue
+        except Exception as e:
+            print(f"⚠️  Lettura veloce fallita ({attempt_enc}, sep {sep!r}): {e}. Provo gli altri formati...")
+            break
+
+    return _cascade_read_csv(csv_path, [enc] + [e for e in CANDIDATE_ENCODINGS if e != enc])
+
+
+def _cascade_read_csv(csv_path, encodings):
+    """Fallback lento: prova encoding e separatori con l'engine python."""
+    with open(csv_path, "rb") as f:
+        raw = f.read(SAMPLE_BYTES)
+
+    for enc in encodings:
+        try:
+            sample_decoded = raw.decode(enc, errors="replace")
+        except LookupError:
             continue
-    if sample_decoded is None:
-        sample_decoded = raw.decode("latin1", errors="replace")
-        enc_for_sample = "latin1(replace)"
 
-    for enc in [enc_for_sample] + [e for e in CANDIDATE_ENCODINGS if e != enc_for_sample]:
         try:
             df = pd.read_csv(csv_path, encoding=enc, sep=None, engine="python")
             if df.shape[1] > 1:
@@ -67,10 +164,132 @@ def robust_read_csv(csv_path):
     return df, "latin1(on_bad_lines=skip)", "inferred/1col"
 
 
+# ===============================================
+# EXPORT XLSX IN STREAMING
+# ===============================================
+class _StreamingXlsxWriter:
+    """
+    Scrive righe su un workbook openpyxl in modalità write-only (memoria costante).
+
+    Oltre i limiti di Excel le righe proseguono su nuovi fogli: le colonne oltre
+    EXCEL_MAX_COLS vanno su fogli "_c2", "_c3", ... (con la prima colonna, l'id del
+    file, ripetuta), le righe oltre EXCEL_MAX_ROWS su fogli "_r2", "_r3", ...
+    """
+
+    def __init__(self, excel_file, header, sheet_name="Sheet1"):
+        from openpyxl import Workbook
+
+        self.excel_file = excel_file
+        self.header = list(header)
+        self.sheet_name = sheet_name
+        self.workbook = Workbook(write_only=True)
+        self.sheet_names = []
+        self.rows = 0
+
+        # Blocchi di colonne: il primo con le prime EXCEL_MAX_COLS, gli altri con la
+        # colonna 0 ripetuta + le successive
+        n = len(self.header)
+        self.blocks = [list(range(min(n, EXCEL_MAX_COLS)))]
+        start = EXCEL_MAX_COLS
+        while start < n:
+            end = min(n, start + EXCEL_MAX_COLS - 1)
+            self.blocks.append([0] + list(range(start, end)))
+            start = end
+
+        self._part = 0
+        self._rows_in_part = 0
+        self._sheets = []
+        self._new_part()
+
+    def _new_part(self):
+        self._part += 1
+        self._rows_in_part = 0
+        self._sheets = []
+        for b, columns in enumerate(self.blocks, start=1):
+            name = self.sheet_name
+            if self._part > 1:
+                name += f"_r{self._part}"
+            if b > 1:
+                name += f"_c{b}"
+            sheet = self.workbook.create_sheet(title=name[:31])
+            sheet.append([self.header[i] for i in columns])
+            self._sheets.append(sheet)
+            self.sheet_names.append(sheet.title)
+
+    def append(self, row):
+        if self._rows_in_part >= EXCEL_MAX_ROWS - 1:  # -1: riga di intestazione
+            self._new_part()
+        if len(self.blocks) == 1:
+            self._sheets[0].append(row)
+        else:
+            for sheet, columns in zip(self._sheets, self.blocks):
+                sheet.append([row[i] for i in columns])
+        self._rows_in_part += 1
+        self.rows += 1
+
+    def append_frame(self, df):
+        # NaN -> cella vuota (openpyxl scriverebbe un valore non valido per Excel)
+        values = df.astype(object).where(df.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            self.append(row)
+
+    def save(self):
+        self.workbook.save(self.excel_file)
+
+
+def _iter_frame_chunks(df, chunk_rows):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def stream_csv_to_excel(csv_path, excel_file, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Converte un CSV in XLSX a memoria costante: il CSV è letto a blocchi di al più
+    `chunk_rows` righe ed EXPORT_CHUNK_CELLS celle (engine C, formato dal campione)
+    e ogni blocco è scritto subito nel workbook write-only. Se la lettura a blocchi fallisce si riparte
+    con robust_read_csv (cascata completa) sul file intero.
+
+    Returns:
+        dict con 'encoding', 'sep', 'rows', 'columns', 'sheets'
+    """
+    enc, sep, _ = detect_csv_format(csv_path)
+    try:
+        n_columns = len(pd.read_csv(csv_path, encoding=enc, sep=sep, engine="c", nrows=0).columns)
+        chunk_rows = max(1, min(chunk_rows, EXPORT_CHUNK_CELLS // max(n_columns, 1)))
+        reader = pd.read_csv(csv_path, encoding=enc, sep=sep, engine="c", chunksize=chunk_rows)
+        writer = None
+        for chunk in reader:
+            if writer is None:
+                if chunk.shape[1] <= 1:
+                    raise ValueError("una sola colonna: separatore non riconosciuto")
+                writer = _StreamingXlsxWriter(excel_file, chunk.columns)
+            writer.append_frame(chunk)
+        if writer is None:
+            raise ValueError("CSV vuoto")
+    except Exception as e:
+        print(f"⚠️  Lettura a blocchi fallita ({enc}, sep {sep!r}): {e}. Uso la lettura robusta...")
+        df, enc, sep = robust_read_csv(csv_path)
+        writer = _StreamingXlsxWriter(excel_file, df.columns)
+        chunk_rows = max(1, min(chunk_rows, EXPORT_CHUNK_CELLS // max(df.shape[1], 1)))
+        for chunk in _iter_frame_chunks(df, chunk_rows):
+            writer.append_frame(chunk)
+
+    writer.save()
+    return {
+        'encoding': enc,
+        'sep': sep,
+        'rows': writer.rows,
+        'columns': len(writer.header),
+        'sheets': writer.sheet_names,
+    }
+
+
 def convert_single_csv_to_excel(csv_path):
     """
     Converte un singolo file CSV in Excel.
     Crea una sottocartella 'excel_output' nella stessa directory del CSV.
+    La scrittura è in streaming (vedi stream_csv_to_excel): tabelle oltre i limiti
+    di Excel vengono divise su più fogli.
     
     Args:
         csv_path (str): Percorso completo del file CSV
@@ -90,51 +309,157 @@ def convert_single_csv_to_excel(csv_path):
     excel_file = os.path.join(excel_folder, os.path.splitext(filename)[0] + ".xlsx")
     
     try:
-        df, enc, sep = robust_read_csv(csv_path)
-        df.to_excel(excel_file, index=False)
-        print(f"✅ Convertito: {csv_path} → {excel_file}  (encoding: {enc} | sep: {sep} | cols: {df.shape[1]})")
+        info = stream_csv_to_excel(csv_path, excel_file)
+        sheets = f" | fogli: {len(info['sheets'])}" if len(info['sheets']) > 1 else ""
+        print(f"✅ Convertito: {csv_path} → {excel_file}  (encoding: {info['encoding']} | sep: {info['sep']} | "
+              f"cols: {info['columns']} | righe: {info['rows']}{sheets})")
         return excel_file
     except Exception as e:
         print(f"❌ ERRORE su {csv_path}: {e}")
         return None
 
 
-# FUNZIONE ORIGINALE modificata per usare convert_single_csv_to_excel
-def convert_csv_to_excel(path):
+# ===============================================
+# CONVERSIONE BATCH (POOL DI PROCESSI)
+# ===============================================
+def _excel_path_for(csv_path):
+    dirpath, filename = os.path.split(csv_path)
+    return os.path.join(dirpath, "excel_output", os.path.splitext(filename)[0] + ".xlsx")
+
+
+def _source_signature(csv_path):
+    st = os.stat(csv_path)
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+def load_manifest(excel_folder):
+    """Manifest {nome_csv: {mtime_ns, size}} delle conversioni già fatte in excel_folder."""
+    manifest_path = os.path.join(excel_folder, MANIFEST_NAME)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(excel_folder, manifest):
+    manifest_path = os.path.join(excel_folder, MANIFEST_NAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def needs_conversion(csv_path, manifest):
+    """
+    True se l'Excel manca o il CSV sorgente è cambiato (mtime/size diversi dal manifest).
+    Un Excel senza voce nel manifest (conversioni precedenti) è considerato aggiornato
+    se non è più vecchio del CSV.
+    """
+    excel_file = _excel_path_for(csv_path)
+    if not os.path.exists(excel_file):
+        return True
+    entry = manifest.get(os.path.basename(csv_path))
+    if entry is not None:
+        return entry != _source_signature(csv_path)
+    return os.stat(excel_file).st_mtime_ns < os.stat(csv_path).st_mtime_ns
+
+
+def _convert_job(csv_path):
+    """Task del pool: converte un CSV e ne misura il tempo."""
+    signature = _source_signature(csv_path)
+    start = time.perf_counter()
+    excel_file = convert_single_csv_to_excel(csv_path)
+    return csv_path, excel_file, time.perf_counter() - start, signature
+
+
+def convert_csv_to_excel(path, workers=None):
     """
     Converte CSV in Excel. Supporta sia file singolo che directory.
+
+    Per una directory i CSV da (ri)convertire sono scelti con il manifest di ogni
+    cartella excel_output (mtime/size del sorgente): i workbook obsoleti vengono
+    rigenerati, quelli aggiornati non vengono toccati. Le conversioni sono
+    indipendenti e girano in un pool di processi.
     
     Args:
         path (str): Percorso del file CSV o directory contenente CSV
+        workers (int): Processi del pool (default: core logici; 1 = sequenziale)
+
+    Returns:
+        dict con 'converted', 'skipped', 'failed', 'elapsed'
     """
+    summary = {"converted": [], "skipped": [], "failed": [], "elapsed": 0.0}
+
     if os.path.isfile(path) and path.lower().endswith(".csv"):
         # Caso singolo file CSV
-        convert_single_csv_to_excel(path)
-        
+        csv_files = [path]
     elif os.path.isdir(path):
-        # Caso directory
-        for dirpath, _, files in os.walk(path):
-            excel_folder = os.path.join(dirpath, "excel_output")
-            csv_files = [f for f in files if f.lower().endswith(".csv")]
-            if not csv_files:
-                continue
-
-            os.makedirs(excel_folder, exist_ok=True)
+        csv_files = []
+        for dirpath, dirnames, files in os.walk(path):
+            dirnames[:] = [d for d in dirnames if d != "excel_output"]
+            csv_files.extend(os.path.join(dirpath, f) for f in files if f.lower().endswith(".csv"))
+    else:
+        print("❌ Il percorso specificato non è valido (né file .csv né directory).")
+        return summary
 
-            for file in csv_files:
-                csv_file = os.path.join(dirpath, file)
-                excel_file = os.path.join(excel_folder, os.path.splitext(file)[0] + ".xlsx")
+    # Manifest per cartella di output
+    manifests = {}
+    jobs = []
+    for csv_file in csv_files:
+        excel_folder = os.path.dirname(_excel_path_for(csv_file))
+        if excel_folder not in manifests:
+            manifests[excel_folder] = load_manifest(excel_folder)
+        if needs_conversion(csv_file, manifests[excel_folder]):
+            jobs.append(csv_file)
+        else:
+            summary["skipped"].append(csv_file)
+            print(f"⚠️  Excel aggiornato, salto: {_excel_path_for(csv_file)}")
 
-                if os.path.exists(excel_file):
-                    print(f"⚠️  Excel già esiste, salto: {excel_file}")
-                    continue
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs) or 1))
+    if jobs:
+        print(f"Conversione di {len(jobs)} CSV con {workers} worker ({len(summary['skipped'])} saltati)")
 
-                convert_single_csv_to_excel(csv_file)
+    start = time.perf_counter()
+    if workers == 1:
+        results = (_convert_job(csv_file) for csv_file in jobs)
+        executor = None
     else:
-        print("❌ Il percorso specificato non è valido (né file .csv né directory).")
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = (future.result() for future in as_completed(
+            [executor.submit(_convert_job, csv_file) for csv_file in jobs]))
+    try:
+        for csv_file, excel_file, elapsed, signature in results:
+            excel_folder = os.path.dirname(_excel_path_for(csv_file))
+            if excel_file:
+                manifests[excel_folder][os.path.basename(csv_file)] = signature
+                summary["converted"].append(csv_file)
+                print(f"⏱ {os.path.basename(csv_file)}: {elapsed:.2f}s")
+            else:
+                # Voce rimossa: il file verrà ritentato al prossimo batch
+                manifests[excel_folder].pop(os.path.basename(csv_file), None)
+                summary["failed"].append(csv_file)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for excel_folder, manifest in manifests.items():
+            if os.path.isdir(excel_folder):
+                save_manifest(excel_folder, manifest)
+
+    summary["elapsed"] = time.perf_counter() - start
+    if jobs:
+        print(f"✅ Convertiti {len(summary['converted'])}/{len(jobs)} CSV in {summary['elapsed']:.1f}s "
+              f"({len(summary['failed'])} errori, {len(summary['skipped'])} saltati)")
+    return summary
 
 
 # Per uso standalone
 if __name__ == "__main__":
-    csv_root = r"C:\Users"  # Modifica questo path
-    convert_csv_to_excel(csv_root)
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Converte CSV in Excel (file singolo o cartella, in parallelo)")
+    ap.add_argument("path", help="File CSV o cartella da convertire")
+    ap.add_argument("--workers", type=int, default=None, help="Processi di conversione (default: core logici)")
+    args = ap.parse_args()
+    convert_csv_to_excel(args.path, workers=args.workers)
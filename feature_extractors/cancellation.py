@@ -0,0 +1,83 @@
+"""
+Cancellazione cooperativa dei batch di estrazione.
+
+Un CancellationToken è condiviso tra chi avvia il batch (GUI/CLI) e le
+funzioni di estrazione: cancel() imposta il flag e termina subito i
+processi SMILExtract registrati, senza attendere il prossimo file.
+"""
+
+import subprocess
+import threading
+from contextlib import contextmanager
+
+
+class OperationCancelled(Exception):
+    """Sollevata quando un'operazione viene interrotta tramite CancellationToken."""
+
+
+class CancellationToken:
+    """Flag di cancellazione thread-safe con kill dei sottoprocessi in corso."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """Richiede la cancellazione e termina i sottoprocessi registrati."""
+        self._event.set()
+        with self._lock:
+            processes = list(self._processes)
+        for proc in processes:
+            _kill(proc)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCancelled("Operation cancelled by user")
+
+    def wait(self, timeout):
+        """Attende fino a `timeout` secondi; ritorna True se cancellato nel frattempo."""
+        return self._event.wait(timeout)
+
+    @contextmanager
+    def register(self, proc):
+        """Associa un sottoprocesso al token per la durata del blocco."""
+        with self._lock:
+            self._processes.add(proc)
+        try:
+            # Cancellazione arrivata prima della registrazione
+            if self._event.is_set():
+                _kill(proc)
+            yield proc
+        finally:
+            with self._lock:
+                self._processes.discard(proc)
+
+
+def _kill(proc):
+    try:
+        if proc.poll() is None:
+            proc.kill()
+    except Exception:
+        pass
+
+
+def run_cancellable(cmd, cancel_token=None, **popen_kwargs):
+    """
+    Come subprocess.run(cmd, capture_output=True, text=True), ma il processo
+    viene terminato appena il token è cancellato (OperationCancelled).
+    """
+    if cancel_token is None:
+        return subprocess.run(cmd, capture_output=True, text=True, **popen_kwargs)
+
+    cancel_token.raise_if_cancelled()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, **popen_kwargs)
+    with cancel_token.register(proc):
+        # communicate() ritorna appena cancel() termina il processo
+        stdout, stderr = proc.communicate()
+    cancel_token.raise_if_cancelled()
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
@@ -0,0 +1,439 @@
+"""
+Catalogo SQLite della pipeline: audio -> LLD -> feature -> etichette.
+
+Un solo file .sqlite registra per ogni registrazione:
+  - recordings   path, size/mtime, hash del contenuto (sha1), subjectId
+                 (stesso hash polinomiale di build_index e degli estrattori)
+  - artifacts    file intermedi (LLD, ...) con i parametri di estrazione
+  - feature_sets set di feature estratti (egemaps / custom) con i parametri
+  - features     valori in formato long (recording, set, nome, valore)
+  - labels       etichette (es. 'Tipo audio', 'Tipo soggetto') dal dataset index
+
+Gli estrattori registrano qui i risultati (parametro `catalog`) e train.py
+legge la matrice feature + target con lookup indicizzati (feature_frame),
+senza tree walk né merge su filename.split('Italian').
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    recording_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    file_name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    subject_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recordings_file_name ON recordings(file_name);
+CREATE INDEX IF NOT EXISTS idx_recordings_subject ON recordings(subject_id);
+CREATE INDEX IF NOT EXISTS idx_recordings_hash ON recordings(content_hash);
+
+CREATE TABLE IF NOT EXISTS artifacts (
+    recording_id INTEGER NOT NULL REFERENCES recordings(recording_id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    params TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (recording_id, kind)
+);
+
+CREATE TABLE IF NOT EXISTS feature_sets (
+    recording_id INTEGER NOT NULL REFERENCES recordings(recording_id) ON DELETE CASCADE,
+    feature_set TEXT NOT NULL,
+    params TEXT NOT NULL,
+    extracted_at REAL NOT NULL,
+    source_name TEXT,
+    PRIMARY KEY (recording_id, feature_set)
+);
+
+CREATE TABLE IF NOT EXISTS features (
+    recording_id INTEGER NOT NULL,
+    feature_set TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (recording_id, feature_set, name),
+    FOREIGN KEY (recording_id, feature_set)
+        REFERENCES feature_sets(recording_id, feature_set) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_features_set ON features(feature_set, name);
+
+CREATE TABLE IF NOT EXISTS labels (
+    recording_id INTEGER NOT NULL REFERENCES recordings(recording_id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (recording_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_labels_name ON labels(name, value);
+"""
+
+# Colonne delle righe di output degli estrattori che non sono feature
+NON_FEATURE_COLUMNS = ('filename', 'subjectId', 'name', 'frameTime', 'class')
+
+HASH_BLOCK = 1024 * 1024
+
+
+def subject_id_for(path):
+    """subjectId: hash polinomiale del nome senza estensione (come build_index)."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    h = 0
+    for ch in name:
+        h = (h * 131 + ord(ch)) % (2**31 - 1)
+    return str(h)
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    """sha1 del contenuto di un file di configurazione (None se manca): entra nei parametri di estrazione."""
+    if not path or not os.path.isfile(path):
+        return None
+    return file_sha1(path)
+
+
+def egemaps_params(config_path, selected_features):
+    """Parametri del set 'egemaps': fingerprint del config openSMILE + feature selezionate."""
+    return {'config': file_fingerprint(config_path), 'features': selected_features}
+
+
+def custom_params(lld_config_path, selected_features, voicing_thr, min_pause, long_pause_thr,
+                  smooth_win_ms, hysteresis, lld_backend='opensmile', engine_version=None):
+    """
+    Parametri del set 'custom': config LLD, feature selezionate e soglie di voicing/pause.
+    Con il backend 'numpy' la sorgente degli LLD è la versione del motore invece del config.
+    """
+    params = {
+        'lld_config': file_fingerprint(lld_config_path),
+        'features': list(selected_features),
+        'voicing_thr': voicing_thr,
+        'min_pause': min_pause,
+        'long_pause_thr': long_pause_thr,
+        'smooth_win_ms': smooth_win_ms,
+        'hysteresis': hysteresis,
+    }
+    if lld_backend != 'opensmile':
+        params['lld_config'] = None
+        params['lld_backend'] = f"{lld_backend}-{engine_version}"
+    return params
+
+
+def _params_json(params):
+    return json.dumps(params or {}, sort_keys=True, default=str)
+
+
+class Catalog:
+    """Accesso al catalogo (thread-safe: una connessione protetta da lock)."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------------------------------------------
+    # Registrazioni
+    # ---------------------------------------------
+    def register_recording(self, path):
+        """
+        Registra (o aggiorna) un file audio e ritorna il recording_id.
+        L'hash del contenuto è ricalcolato solo se size/mtime sono cambiati;
+        artefatti e feature sono invalidati solo se l'hash è diverso
+        (un semplice touch/copia aggiorna solo size/mtime).
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT recording_id, size, mtime_ns, content_hash FROM recordings WHERE path = ?",
+                (path,)).fetchone()
+            if row is not None and (row[1], row[2]) == (st.st_size, st.st_mtime_ns):
+                return row[0]
+            content_hash = file_sha1(path)
+            if row is not None and row[3] == content_hash:
+                self._conn.execute(
+                    "UPDATE recordings SET size = ?, mtime_ns = ? WHERE recording_id = ?",
+                    (st.st_size, st.st_mtime_ns, row[0]))
+                return row[0]
+            if row is None:
+                cur = self._conn.execute(
+                    "INSERT INTO recordings (path, file_name, size, mtime_ns, content_hash, subject_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (path, os.path.basename(path), st.st_size, st.st_mtime_ns, content_hash, subject_id_for(path)))
+                return cur.lastrowid
+            # Contenuto cambiato: artefatti e feature precedenti non sono più validi
+            self._conn.execute("DELETE FROM artifacts WHERE recording_id = ?", (row[0],))
+            self._conn.execute("DELETE FROM feature_sets WHERE recording_id = ?", (row[0],))
+            self._conn.execute(
+                "UPDATE recordings SET size = ?, mtime_ns = ?, content_hash = ? WHERE recording_id = ?",
+                (st.st_size, st.st_mtime_ns, content_hash, row[0]))
+            return row[0]
+
+    def recording(self, path):
+        """Riga di recordings (dict) per path, o None."""
+        with self._lock:
+            cur = self._conn.execute("SELECT * FROM recordings WHERE path = ?", (os.path.abspath(path),))
+            row = cur.fetchone()
+            return None if row is None else dict(zip([d[0] for d in cur.description], row))
+
+    def recording_paths(self, root=None):
+        """Path registrati (opzionalmente solo sotto root), ordinati."""
+        with self._lock:
+            if root is None:
+                return [r[0] for r in self._conn.execute("SELECT path FROM recordings ORDER BY path")]
+            prefix = os.path.join(os.path.abspath(root), "")
+            return [r[0] for r in self._conn.execute(
+                "SELECT path FROM recordings WHERE substr(path, 1, ?) = ? ORDER BY path", (len(prefix), prefix))]
+
+    def forget_recordings(self, paths):
+        """Rimuove registrazioni (e in cascata artefatti, feature, etichette)."""
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM recordings WHERE path = ?",
+                                   [(os.path.abspath(p),) for p in paths])
+
+    def recordings_by_file_name(self, file_name):
+        with self._lock:
+            return [r[0] for r in self._conn.execute(
+                "SELECT path FROM recordings WHERE file_name = ?", (file_name,))]
+
+    # ---------------------------------------------
+    # Artefatti e feature
+    # ---------------------------------------------
+    def add_artifact(self, recording_path, kind, artifact_path, params=None):
+        recording_id = self.register_recording(recording_path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?)",
+                (recording_id, kind, os.path.abspath(artifact_path), _params_json(params), time.time()))
+
+    def artifact(self, recording_path, kind, params=None):
+        """Path dell'artefatto se registrato, ancora su disco e (se indicati) con gli stessi parametri."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT a.path, a.params FROM artifacts a JOIN recordings r USING (recording_id) "
+                "WHERE r.path = ? AND a.kind = ?", (os.path.abspath(recording_path), kind)).fetchone()
+        if row is None or not os.path.exists(row[0]):
+            return None
+        if params is not None and row[1] != _params_json(params):
+            return None
+        return row[0]
+
+    def store_features(self, recording_path, feature_set, row, params=None):
+        """
+        Salva una riga di output di un estrattore (dict colonna -> valore) in
+        formato long; le colonne non numeriche (filename, subjectId, ...) sono escluse.
+        """
+        recording_id = self.register_recording(recording_path)
+        values = []
+        for position, (name, value) in enumerate(row.items()):
+            if name in NON_FEATURE_COLUMNS:
+                continue
+            try:
+                value = None if value is None else float(value)
+            except (TypeError, ValueError):
+                continue
+            values.append((recording_id, feature_set, position, name, value))
+        with self._lock, self._conn:
+            # Le feature del set precedente sono rimosse in cascata
+            self._conn.execute("DELETE FROM feature_sets WHERE recording_id = ? AND feature_set = ?",
+                               (recording_id, feature_set))
+            self._conn.execute(
+                "INSERT INTO feature_sets (recording_id, feature_set, params, extracted_at, source_name) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (recording_id, feature_set, _params_json(params), time.time(), row.get('filename')))
+            self._conn.executemany("INSERT INTO features VALUES (?, ?, ?, ?, ?)", values)
+
+    def has_features(self, recording_path, feature_set, params=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT s.params FROM feature_sets s JOIN recordings r USING (recording_id) "
+                "WHERE r.path = ? AND s.feature_set = ?", (os.path.abspath(recording_path), feature_set)).fetchone()
+        return row is not None and (params is None or row[0] == _params_json(params))
+
+    def stale_recordings(self, paths, feature_set, params=None):
+        """
+        Path (tra quelli dati) senza il set di feature o estratti con parametri
+        diversi da `params`: sono gli unici da ricalcolare.
+        """
+        with self._lock:
+            stored = dict(self._conn.execute(
+                "SELECT r.path, s.params FROM feature_sets s JOIN recordings r USING (recording_id) "
+                "WHERE s.feature_set = ?", (feature_set,)))
+        expected = _params_json(params)
+        return [p for p in paths if stored.get(os.path.abspath(p)) != expected]
+
+    def feature_table(self, feature_set, paths=None):
+        """
+        Tabella di un set di feature nel formato CSV degli estrattori (filename,
+        subjectId, feature...), una riga per registrazione ordinata per path.
+        """
+        import pandas as pd
+
+        with self._lock:
+            meta = pd.read_sql_query(
+                "SELECT r.recording_id, r.path, s.source_name AS filename, r.subject_id AS subjectId "
+                "FROM feature_sets s JOIN recordings r USING (recording_id) "
+                "WHERE s.feature_set = ? ORDER BY r.path", self._conn, params=(feature_set,))
+            long = pd.read_sql_query(
+                "SELECT recording_id, position, name, value FROM features WHERE feature_set = ?",
+                self._conn, params=(feature_set,))
+
+        if paths is not None:
+            meta = meta[meta['path'].isin({os.path.abspath(p) for p in paths})]
+        columns = long.groupby('name')['position'].min().sort_values().index.tolist()
+        wide = long.pivot_table(index='recording_id', columns='name', values='value', aggfunc='first',
+                                dropna=False).reindex(index=meta['recording_id'], columns=columns)
+        wide.columns.name = None
+        table = pd.concat([meta[['filename', 'subjectId']].reset_index(drop=True),
+                           wide.reset_index(drop=True)], axis=1)
+        return table
+
+    # ---------------------------------------------
+    # Etichette
+    # ---------------------------------------------
+    def set_labels(self, recording_path, labels):
+        recording_id = self.register_recording(recording_path)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO labels VALUES (?, ?, ?)",
+                [(recording_id, name, None if value is None else str(value)) for name, value in labels.items()])
+
+    def import_labels(self, index_df, file_column='FileName', label_columns=('Tipo audio', 'Tipo soggetto')):
+        """
+        Importa le etichette dal dataset index (DataFrame di build_index) abbinando
+        FileName al nome dei file registrati. Ritorna il numero di registrazioni etichettate.
+        """
+        label_columns = [c for c in label_columns if c in index_df.columns]
+        labelled = 0
+        with self._lock, self._conn:
+            for record in index_df[[file_column] + label_columns].itertuples(index=False, name=None):
+                ids = [r[0] for r in self._conn.execute(
+                    "SELECT recording_id FROM recordings WHERE file_name = ?", (record[0],))]
+                for recording_id in ids:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO labels VALUES (?, ?, ?)",
+                        [(recording_id, name, None if value is None else str(value))
+                         for name, value in zip(label_columns, record[1:])])
+                labelled += len(ids)
+        return labelled
+
+    # ---------------------------------------------
+    # Lettura per il training
+    # ---------------------------------------------
+    def feature_frame(self, feature_sets=('egemaps', 'custom'), label='Tipo soggetto',
+                      filters=(('Tipo audio', 'Free'),)):
+        """
+        Matrice feature + target: una riga per registrazione con tutti i feature_sets
+        e l'etichetta `label`, filtrata sulle etichette in `filters`. Le colonne
+        seguono l'ordine dei set e delle feature nell'output degli estrattori.
+        """
+        import pandas as pd
+
+        feature_sets = list(feature_sets)
+        set_marks = ", ".join("?" for _ in feature_sets)
+        conditions = ["l.name = ?"]
+        params = [label]
+        for i, (name, value) in enumerate(filters):
+            conditions.append(f"EXISTS (SELECT 1 FROM labels f{i} WHERE f{i}.recording_id = r.recording_id "
+                              f"AND f{i}.name = ? AND f{i}.value = ?)")
+            params += [name, value]
+        # Solo le registrazioni con tutti i set richiesti (come il merge inner)
+        conditions.append(f"(SELECT COUNT(*) FROM feature_sets s WHERE s.recording_id = r.recording_id "
+                          f"AND s.feature_set IN ({set_marks})) = ?")
+        params += feature_sets + [len(feature_sets)]
+
+        with self._lock:
+            targets = pd.read_sql_query(
+                f"SELECT r.recording_id, l.value AS target FROM recordings r "
+                f"JOIN labels l ON l.recording_id = r.recording_id "
+                f"WHERE {' AND '.join(conditions)} ORDER BY r.path", self._conn, params=params)
+            long = pd.read_sql_query(
+                f"SELECT recording_id, feature_set, position, name, value FROM features "
+                f"WHERE feature_set IN ({set_marks})", self._conn, params=feature_sets)
+
+        long = long[long['recording_id'].isin(targets['recording_id'])]
+        order = {name: i for i, name in enumerate(feature_sets)}
+        columns = (long.assign(set_order=long['feature_set'].map(order))
+                   .groupby('name')[['set_order', 'position']].min()
+                   .sort_values(['set_order', 'position']).index.tolist())
+        wide = long.pivot_table(index='recording_id', columns='name', values='value', aggfunc='first',
+                                dropna=False)
+        wide = wide.reindex(index=targets['recording_id'], columns=columns)
+        wide.columns.name = None
+        frame = wide.reset_index(drop=True)
+        frame[label] = targets['target'].to_numpy()
+        return frame
+
+    def summary(self):
+        with self._lock:
+            counts = {table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                      for table in ('recordings', 'artifacts', 'feature_sets', 'features', 'labels')}
+        return counts
+
+
+def record_extraction(catalog, recording_path, feature_set, row, params=None, lld_csv=None, lld_params=None):
+    """
+    Registra nel catalogo il risultato di un estrattore (riga dict) ed eventualmente
+    l'LLD usato. Un errore del catalogo non interrompe l'estrazione (solo warning).
+    """
+    if catalog is None or not row:
+        return
+    try:
+        if lld_csv:
+            catalog.add_artifact(recording_path, 'lld', lld_csv, lld_params)
+        catalog.store_features(recording_path, feature_set, row, params)
+    except Exception as e:
+        print(f"Warning: catalog update failed for {recording_path}: {e}")
+
+
+def open_catalog(catalog):
+    """Accetta un Catalog, un path .sqlite o None; ritorna (catalog, da_chiudere)."""
+    if catalog is None or isinstance(catalog, Catalog):
+        return catalog, False
+    return Catalog(catalog), True
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Catalogo SQLite audio -> LLD -> feature -> etichette")
+    ap.add_argument("db", help="File .sqlite del catalogo")
+    ap.add_argument("--import-index", default=None,
+                    help="Importa le etichette dal dataset index (.sqlite di build_index, .xlsx o .csv)")
+    args = ap.parse_args()
+
+    with Catalog(args.db) as catalog:
+        if args.import_index:
+            sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                         'feature_selection'))
+            from feature_matrix import read_dataset_index
+            n = catalog.import_labels(read_dataset_index(args.import_index))
+            print(f"✅ Etichette importate per {n} registrazioni")
+        for table, count in catalog.summary().items():
+            print(f"{table:<13} {count}")
@@ -0,0 +1,366 @@
+"""
+Estrazione combinata eGeMAPS + custom in un unico pool di worker.
+
+Le due pipeline SMILExtract (eGeMAPS functionals e ComParE LLD) sono
+indipendenti: per ogni WAV vengono schedulati entrambi i task nello stesso
+ThreadPoolExecutor (i thread attendono i sottoprocessi, il GIL non è un
+limite), così il tempo totale si avvicina a max(eGeMAPS, custom) invece
+che alla somma. Il task custom genera l'LLD (se manca) e calcola subito le
+feature con process_file.
+
+Se un WAV richiede entrambi i set e il suo LLD va generato, i due task
+diventano uno solo: un SMILExtract con il config combinato (vedi
+smile_config.merge_configs) legge il WAV una volta e scrive sia l'ARFF eGeMAPS
+sia l'LLD. Se il config combinato non è disponibile si torna ai due task.
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    from feature_extractors.csv_extract_eGeMAPS_FUNCTION import (
+        extract_and_save_features, egemaps_features_v2, EGEMAPS_CONFIG_KEY, egemaps_arff_path,
+        egemaps_row_from_arff, remove_arff
+    )
+    from feature_extractors.extract_feature_batch_LLD import generate_lld_for_file, LLD_CONFIG_KEY
+    from feature_extractors.extract_features_custom import (
+        process_file, ALL_CUSTOM_FEATURES, VOICING_THR_DEFAULT, MIN_PAUSE_DEFAULT, LONG_PAUSE_DEFAULT, DT,
+        resolve_lld_backend
+    )
+    from feature_extractors.lld_engine import compute_lld_frame, ENGINE_VERSION
+    from feature_extractors.progress import ProgressTracker, ConsoleProgress, JsonlProgressLogger, combine_callbacks
+    from feature_extractors.cancellation import OperationCancelled
+    from feature_extractors.config_service import get_config_service
+    from feature_extractors.smile_config import lld_settings as minimal_lld_settings, combined_settings, run_combined
+    from feature_extractors.catalog import open_catalog, record_extraction, egemaps_params, custom_params
+except Exception:
+    from .csv_extract_eGeMAPS_FUNCTION import (
+        extract_and_save_features, egemaps_features_v2, EGEMAPS_CONFIG_KEY, egemaps_arff_path,
+        egemaps_row_from_arff, remove_arff
+    )
+    from .extract_feature_batch_LLD import generate_lld_for_file, LLD_CONFIG_KEY
+    from .extract_features_custom import (
+        process_file, ALL_CUSTOM_FEATURES, VOICING_THR_DEFAULT, MIN_PAUSE_DEFAULT, LONG_PAUSE_DEFAULT, DT,
+        resolve_lld_backend
+    )
+    from .lld_engine import compute_lld_frame, ENGINE_VERSION
+    from .progress import ProgressTracker, ConsoleProgress, JsonlProgressLogger, combine_callbacks
+    from .cancellation import OperationCancelled
+    from .config_service import get_config_service
+    from .smile_config import lld_settings as minimal_lld_settings, combined_settings, run_combined
+    from .catalog import open_catalog, record_extraction, egemaps_params, custom_params
+
+
+def default_workers():
+    """Un SMILExtract per core logico."""
+    return os.cpu_count() or 4
+
+
+def _list_wavs(path):
+    if os.path.isfile(path):
+        return [path] if path.lower().endswith('.wav') else []
+    wav_paths = []
+    for dirpath, _, filenames in os.walk(path):
+        wav_paths.extend(os.path.join(dirpath, f) for f in filenames if f.lower().endswith('.wav'))
+    return wav_paths
+
+
+def _lld_path(wav):
+    base = os.path.splitext(os.path.basename(wav))[0]
+    return os.path.join(os.path.dirname(wav), base + "_LLD.csv")
+
+
+def _egemaps_task(wav, selected_features, cancel_token, settings):
+    return extract_and_save_features(wav, selected_features, cancel_token, settings)
+
+
+def _custom_task(wav, params, selected_features, cancel_token, created_files, settings, lld_backend):
+    """
+    Genera l'LLD (se manca) e calcola le feature custom. Ritorna (lld, row, frames).
+    Con il backend 'numpy' gli LLD sono calcolati in memoria e lld è None.
+    """
+    lld_csv = _lld_path(wav)
+    lld_frame = None
+    if lld_backend == 'numpy':
+        lld_frame = compute_lld_frame(wav)
+    elif not os.path.exists(lld_csv):
+        lld_csv = generate_lld_for_file(wav, cancel_token=cancel_token, created_files=created_files,
+                                        settings=settings)
+    stats = {}
+    row = process_file(lld_csv, params['voicing_thr'], params['min_pause'], params['long_pause_thr'], DT,
+                       params['smooth_win_ms'], params['hysteresis'], selected_features, stats=stats,
+                       lld_frame=lld_frame)
+    return (None if lld_frame is not None else lld_csv), row, stats.get('frames')
+
+
+def _joint_task(wav, egemaps_features, params, custom_features, cancel_token, created_files, settings):
+    """
+    Un solo SMILExtract (config combinato) per ARFF eGeMAPS e LLD, poi le feature custom.
+    Ritorna {'egemaps': (row, cols), 'custom': (lld, row, frames)}.
+    """
+    lld_csv = _lld_path(wav)
+    arff_file = egemaps_arff_path(wav)
+    try:
+        try:
+            run_combined(settings, settings.config_path, wav, arff_file, lld_csv, cancel_token)
+        except Exception:
+            # LLD scritto a metà: rimuovilo, verrà rigenerato al prossimo run
+            if os.path.exists(lld_csv):
+                try:
+                    os.remove(lld_csv)
+                except OSError as e:
+                    print(f"⚠️ LLD parziale non rimosso: {lld_csv} ({e})")
+            raise
+        if os.path.exists(lld_csv):
+            created_files.append(lld_csv)
+        egemaps_result = egemaps_row_from_arff(arff_file, os.path.basename(wav), egemaps_features)
+    finally:
+        remove_arff(arff_file)
+
+    stats = {}
+    row = process_file(lld_csv, params['voicing_thr'], params['min_pause'], params['long_pause_thr'], DT,
+                       params['smooth_win_ms'], params['hysteresis'], custom_features, stats=stats)
+    return {'egemaps': egemaps_result, 'custom': (lld_csv, row, stats.get('frames'))}
+
+
+def extract_combined_features(path, egemaps_output_path, custom_output_path,
+                              egemaps_features=None, custom_features=None,
+                              voicing_thr=VOICING_THR_DEFAULT, min_pause=MIN_PAUSE_DEFAULT,
+                              long_pause_thr=LONG_PAUSE_DEFAULT, smooth_win_ms=50, hysteresis=True,
+                              max_workers=None, progress_callback=None, cancel_token=None,
+                              created_files=None, config=None, catalog=None, wav_tasks=None,
+                              lld_backend=None, single_pass=True):
+    """
+    Estrae eGeMAPS e feature custom per ogni WAV in un unico pool condiviso.
+
+    Args:
+        path (str): file WAV o cartella
+        egemaps_output_path (str): CSV di output eGeMAPS (None: solo catalogo)
+        custom_output_path (str): CSV di output custom (None: solo catalogo)
+        egemaps_features (list|str): feature eGeMAPS, "all" per tutte, None = v2 (48)
+        custom_features (list): feature custom (None = tutte)
+        max_workers (int): SMILExtract concorrenti (default: core logici)
+        progress_callback (callable): eventi di progresso, stage 'combined'
+            (un evento file_finished per task, con campo 'task' = 'egemaps' | 'custom')
+        cancel_token (CancellationToken): cancella i task in coda e termina quelli in corso
+        created_files (list): manifest dei file intermedi (LLD) creati da questa chiamata,
+            riempito man mano (valido anche se l'estrazione fallisce o viene cancellata)
+        config (ConfigService): sorgente dei path openSMILE, validati una volta prima
+            di avviare il pool (default: gui_config.json condiviso)
+        catalog (Catalog|str): catalogo SQLite (o suo path) dove registrare registrazioni,
+            LLD e feature estratte (vedi catalog.py)
+        wav_tasks (dict): WAV -> task da eseguire ('egemaps', 'custom') al posto
+            della scansione di `path` (usato dal runner incrementale per i soli
+            file e set da ricalcolare)
+        lld_backend (str): 'opensmile' o 'numpy' (vedi extract_custom_features)
+        single_pass (bool): per i WAV con entrambi i task e l'LLD da generare usa un
+            solo SMILExtract con il config combinato eGeMAPS + LLD (se disponibile)
+
+    Returns:
+        dict con 'egemaps_rows', 'custom_rows', 'lld_files' (LLD usati/generati)
+        e 'created_files' (solo quelli creati da questa chiamata)
+    """
+    if created_files is None:
+        created_files = []
+    if catalog is None and (not egemaps_output_path or not custom_output_path):
+        raise ValueError("egemaps_output_path and custom_output_path must be provided")
+    if egemaps_features is None:
+        egemaps_features = egemaps_features_v2
+    if custom_features is None:
+        custom_features = ALL_CUSTOM_FEATURES
+
+    params = {
+        'voicing_thr': voicing_thr,
+        'min_pause': min_pause,
+        'long_pause_thr': long_pause_thr,
+        'smooth_win_ms': smooth_win_ms,
+        'hysteresis': hysteresis,
+    }
+
+    if wav_tasks is None:
+        wav_tasks = {wav: ('egemaps', 'custom') for wav in _list_wavs(path)}
+    wav_paths = list(wav_tasks)
+    if not wav_paths:
+        raise ValueError(f"Nessun file WAV trovato in {path}")
+    n_tasks = sum(len(tasks) for tasks in wav_tasks.values())
+
+    # Path openSMILE validati una volta per batch (il config LLD solo se c'è un LLD da generare)
+    config = config or get_config_service()
+    egemaps_settings = None
+    if any('egemaps' in tasks for tasks in wav_tasks.values()):
+        egemaps_settings = config.smile_settings(EGEMAPS_CONFIG_KEY)
+    lld_backend = resolve_lld_backend(lld_backend, config)
+    lld_settings = None
+    if lld_backend == 'opensmile' and not all(
+            os.path.exists(_lld_path(wav)) for wav, tasks in wav_tasks.items() if 'custom' in tasks):
+        lld_settings = minimal_lld_settings(config)
+
+    # WAV con entrambi i set e l'LLD da generare: un solo SMILExtract (config combinato)
+    joint = set()
+    if single_pass and lld_settings is not None:
+        joint = {wav for wav, tasks in wav_tasks.items()
+                 if 'egemaps' in tasks and 'custom' in tasks and not os.path.exists(_lld_path(wav))}
+    joint_settings = combined_settings(config) if joint else None
+    if joint_settings is None:
+        joint = set()
+
+    workers = max_workers or default_workers()
+    print(f"Estrazione combinata: {len(wav_paths)} WAV, {workers} worker (eGeMAPS + LLD/custom)")
+    if joint:
+        print(f"   {len(joint)} WAV con un solo SMILExtract (config combinato)")
+
+    egemaps_rows = [None] * len(wav_paths)
+    egemaps_columns = None
+    custom_rows = [None] * len(wav_paths)
+    lld_files = []
+
+    tracker = ProgressTracker('combined', n_tasks, progress_callback)
+    tracker.start()
+    start = time.perf_counter()
+
+    # Parametri registrati nel catalogo insieme alle feature
+    catalog, close_catalog = open_catalog(catalog)
+    egemaps_catalog_params = custom_catalog_params = lld_params = None
+    if catalog is not None:
+        egemaps_catalog_params = egemaps_params(config.load().get(EGEMAPS_CONFIG_KEY), egemaps_features)
+        custom_catalog_params = custom_params(config.load().get(LLD_CONFIG_KEY), custom_features, **params,
+                                              lld_backend=lld_backend, engine_version=ENGINE_VERSION)
+        lld_params = {'config': custom_catalog_params['lld_config']}
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {}
+        # Task interleaved per WAV: i primi file producono subito entrambi gli output
+        for index, wav in enumerate(wav_paths):
+            if wav in joint:
+                futures[executor.submit(_joint_task, wav, egemaps_features, params, custom_features,
+                                        cancel_token, created_files, joint_settings)] = ('joint', index)
+                continue
+            if 'egemaps' in wav_tasks[wav]:
+                futures[executor.submit(_egemaps_task, wav, egemaps_features, cancel_token,
+                                        egemaps_settings)] = ('egemaps', index)
+            if 'custom' in wav_tasks[wav]:
+                futures[executor.submit(_custom_task, wav, params, custom_features, cancel_token,
+                                        created_files, lld_settings, lld_backend)] = ('custom', index)
+
+        for future in as_completed(futures):
+            kind, index = futures[future]
+            wav = wav_paths[index]
+            file = os.path.basename(wav)
+            tasks = ('egemaps', 'custom') if kind == 'joint' else (kind,)
+            try:
+                result = future.result()
+                results = result if kind == 'joint' else {kind: result}
+            except OperationCancelled:
+                raise
+            except Exception as e:
+                results = {task: e for task in tasks}
+            for task in tasks:
+                try:
+                    if isinstance(results[task], Exception):
+                        raise results[task]
+                    if task == 'egemaps':
+                        row, cols = results[task]
+                        egemaps_rows[index] = row
+                        if row and egemaps_columns is None:
+                            egemaps_columns = cols
+                        if row:
+                            record_extraction(catalog, wav, 'egemaps', dict(zip(cols, row)), egemaps_catalog_params)
+                        frames = None
+                    else:
+                        lld_csv, row, frames = results[task]
+                        if lld_csv:
+                            lld_files.append(lld_csv)
+                        custom_rows[index] = row
+                        record_extraction(catalog, wav, 'custom', row, custom_catalog_params,
+                                          lld_csv=lld_csv, lld_params=lld_params)
+                    ok = bool(row)
+                    print(f"[{'OK' if ok else 'SKIP'}] {task} {file}")
+                    tracker.file_finished(wav, index, ok=ok, frames=frames, task=task)
+                except Exception as e:
+                    print(f"[ERROR] {task} {file}: {e}")
+                    tracker.file_finished(wav, index, ok=False, error=e, task=task)
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+    except OperationCancelled:
+        # Scarta i task in coda; quelli in corso terminano con il kill di SMILExtract
+        executor.shutdown(wait=True, cancel_futures=True)
+        print(f"\n⚠ Estrazione combinata interrotta ({tracker.done}/{tracker.total} task), CSV non scritti")
+        tracker.finish(cancelled=True)
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        if close_catalog:
+            catalog.close()
+
+    tracker.finish()
+
+    # Scrivi i due CSV nell'ordine dei WAV
+    egemaps_rows = [r for r in egemaps_rows if r]
+    custom_rows = [r for r in custom_rows if r]
+    if not egemaps_output_path:
+        pass  # solo catalogo
+    elif egemaps_rows and egemaps_columns:
+        pd.DataFrame(egemaps_rows, columns=egemaps_columns).to_csv(
+            egemaps_output_path, index=False, sep=';', mode='w')
+        print(f"\n✅ Salvato: {egemaps_output_path} ({len(egemaps_rows)} file)")
+    else:
+        print("\n⚠ Nessuna feature eGeMAPS estratta")
+    if not custom_output_path:
+        pass
+    elif custom_rows:
+        pd.DataFrame(custom_rows).to_csv(custom_output_path, index=False, sep=';', mode='w')
+        print(f"✅ Salvato: {custom_output_path} ({len(custom_rows)} file)")
+    else:
+        print("⚠ Nessuna feature custom estratta")
+
+    print(f"⏱ Tempo totale: {time.perf_counter() - start:.1f}s")
+    return {
+        'egemaps_rows': len(egemaps_rows),
+        'custom_rows': len(custom_rows),
+        'lld_files': lld_files,
+        'created_files': created_files,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Estrazione concorrente eGeMAPS + feature custom da file WAV")
+    ap.add_argument("root", help="Cartella o file WAV da processare")
+    ap.add_argument("--egemaps-out", help="CSV eGeMAPS (default: extracted_features_eGeMAPS.csv nella cartella input)")
+    ap.add_argument("--custom-out", help="CSV custom (default: extracted_features_custom.csv nella cartella input)")
+    ap.add_argument("--all", action="store_true", help="Estrai tutte le 88 feature eGeMAPS invece delle 48 standard")
+    ap.add_argument("--workers", type=int, default=None, help="SMILExtract concorrenti (default: core logici)")
+    ap.add_argument("--progress-log", default=None, help="File JSON-lines dove registrare gli eventi di progresso")
+    ap.add_argument("--catalog", default=None, help="Catalogo SQLite dove registrare registrazioni, LLD e feature")
+    ap.add_argument("--lld-backend", choices=("opensmile", "numpy"), default=None,
+                    help="Sorgente degli LLD per le feature custom (default: gui_config.json, altrimenti opensmile)")
+    ap.add_argument("--no-single-pass", action="store_true",
+                    help="Due SMILExtract per file (eGeMAPS e LLD) invece del config combinato")
+    args = ap.parse_args()
+
+    out_dir = os.path.dirname(args.root) if os.path.isfile(args.root) else args.root
+    egemaps_out = args.egemaps_out or os.path.join(out_dir, "extracted_features_eGeMAPS.csv")
+    custom_out = args.custom_out or os.path.join(out_dir, "extracted_features_custom.csv")
+
+    print(f"Input: {args.root}")
+    print(f"Output: {egemaps_out}, {custom_out}")
+    extract_combined_features(
+        args.root, egemaps_out, custom_out,
+        egemaps_features="all" if args.all else None,
+        max_workers=args.workers,
+        catalog=args.catalog,
+        lld_backend=args.lld_backend,
+        single_pass=not args.no_single_pass,
+        progress_callback=combine_callbacks(
+            ConsoleProgress(),
+            JsonlProgressLogger(args.progress_log) if args.progress_log else None
+        )
+    )
@@ -0,0 +1,107 @@
+"""
+Configurazione condivisa dei moduli di estrazione (gui_config.json).
+
+Il file viene letto una sola volta e riletto solo quando cambia il suo mtime
+(es. dopo un salvataggio dai Settings della GUI): i batch non riaprono più
+il JSON per ogni WAV. I path di openSMILE vengono validati una volta per
+batch con smile_settings() e il risultato (SmileSettings) viene passato
+esplicitamente alle funzioni per-file.
+"""
+
+import json
+import os
+import sys
+import threading
+from collections import namedtuple
+
+
+# Chiavi dei config openSMILE in gui_config.json
+EGEMAPS_CONFIG_KEY = 'eGeMAPS_config_path'
+LLD_CONFIG_KEY = 'Compare2016_config_path'
+# Backend degli LLD per le feature custom: 'opensmile' (SMILExtract + ComParE) o 'numpy' (lld_engine.py)
+LLD_BACKEND_KEY = 'lld_backend'
+# Config usato per generare gli LLD: 'minimal' (ridotto alle colonne richieste, smile_config.py) o 'full'
+LLD_CONFIG_MODE_KEY = 'lld_config_mode'
+# WAV brevi per SMILExtract (concatenati, vedi smile_batch.py); 0 o 1 = un processo per file
+SMILE_BATCH_KEY = 'smile_batch_files'
+
+# Path di SMILExtract e del config già validati, con cwd/env pronti per il sottoprocesso
+SmileSettings = namedtuple('SmileSettings', ['smile_path', 'config_path', 'cwd', 'env'])
+
+
+def default_config_file():
+    """gui_config.json: nella home dell'utente per l'exe, nella cartella UI altrimenti"""
+    if getattr(sys, 'frozen', False):
+        app_data_dir = os.path.join(os.path.expanduser('~'), '.voice_feature_extractor')
+        return os.path.join(app_data_dir, 'gui_config.json')
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'UI', 'gui_config.json'))
+
+
+class ConfigService:
+    """Cache di gui_config.json invalidata sul mtime del file."""
+
+    def __init__(self, config_file=None):
+        self.config_file = config_file or default_config_file()
+        self._lock = threading.Lock()
+        self._config = {}
+        self._mtime = None
+
+    def load(self):
+        """Ritorna la configurazione (copia), rileggendo il file solo se è cambiato."""
+        try:
+            mtime = os.stat(self.config_file).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime != self._mtime:
+                self._config = self._read() if mtime is not None else {}
+                self._mtime = mtime
+            return dict(self._config)
+
+    def _read(self):
+        try:
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Warning: Could not load gui_config.json: {e}")
+            return {}
+
+    def get(self, key, default=''):
+        return self.load().get(key, default) or default
+
+    def smile_settings(self, config_key, smile_path=None, config_path=None):
+        """
+        Valida SMILExtract e il config openSMILE indicato da config_key
+        ('eGeMAPS_config_path' o 'Compare2016_config_path'); da chiamare una
+        volta per batch. smile_path/config_path espliciti hanno la precedenza.
+        """
+        config = self.load()
+        smile_path = smile_path or config.get('SMILE_path', '')
+        config_path = config_path or config.get(config_key, '')
+
+        if not smile_path or not os.path.exists(smile_path):
+            raise RuntimeError(f"SMILExtract executable not found: {smile_path}. "
+                               f"Please configure openSMILE in GUI Settings.")
+        if not config_path or not os.path.exists(config_path):
+            raise RuntimeError(f"Config file not found: {config_path}. "
+                               f"Please configure openSMILE in GUI Settings.")
+
+        # SMILExtract trova le sue dipendenze runtime se eseguito dalla sua cartella
+        smile_dir = os.path.dirname(smile_path) if os.path.isabs(smile_path) else None
+        env = os.environ.copy()
+        if smile_dir:
+            env['PATH'] = smile_dir + os.pathsep + env.get('PATH', '')
+        return SmileSettings(smile_path, config_path, smile_dir, env)
+
+
+_default_service = None
+_default_lock = threading.Lock()
+
+
+def get_config_service():
+    """Istanza condivisa sul gui_config.json di default."""
+    global _default_service
+    with _default_lock:
+        if _default_service is None:
+            _default_service = ConfigService()
+        return _default_service
@@ -1,191 +1,165 @@
 import os
-import subprocess
+import tempfile
 import time
 import pandas as pd
 import arff
 import sys
-import json
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-# NUOVO: Carica i path dal JSON della GUI
-def load_paths_from_gui_config():
-    """Carica i path dal file gui_config.json"""
-    # Gestisci sia exe che Python normale
-    if getattr(sys, 'frozen', False):
-        # Exe: il config è nella home dell'utente
-        app_data_dir = os.path.join(os.path.expanduser('~'), '.voice_feature_extractor')
-        config_file = os.path.join(app_data_dir, 'gui_config.json')
-    else:
-        # Python: nella cartella UI
-        config_file = os.path.join(os.path.dirname(__file__), '..', 'UI', 'gui_config.json')
+try:
+    from feature_extractors.progress import ProgressTracker, ConsoleProgress, JsonlProgressLogger, combine_callbacks
+    from feature_extractors.cancellation import OperationCancelled, run_cancellable
+    from feature_extractors.egemaps_feature_sets import egemaps_features_v2
+    from feature_extractors.config_service import get_config_service, EGEMAPS_CONFIG_KEY
+    from feature_extractors.catalog import open_catalog, record_extraction, egemaps_params
+    from feature_extractors.result_sink import ResultSink, resume_key
+    from feature_extractors.smile_batch import resolve_batch_files, plan_batches, write_batch_wav
+    from feature_extractors.smile_config import segment_egemaps_settings, run_segments
+except Exception:
+    from .progress import ProgressTracker, ConsoleProgress, JsonlProgressLogger, combine_callbacks
+    from .cancellation import OperationCancelled, run_cancellable
+    from .egemaps_feature_sets import egemaps_features_v2
+    from .config_service import get_config_service, EGEMAPS_CONFIG_KEY
+    from .catalog import open_catalog, record_extraction, egemaps_params
+    from .result_sink import ResultSink, resume_key
+    from .smile_batch import resolve_batch_files, plan_batches, write_batch_wav
+    from .smile_config import segment_egemaps_settings, run_segments
+
+# Nell'estrazione singola gli LLD a frame brevi (20 ms) si fermano all'ultimo
+# frame completo: nel batch i segmenti finiscono prima di altrettanto, così i
+# frame a cavallo del silenzio successivo non entrano nei functionals
+SEGMENT_END_TRIM_SECONDS = 0.02
+
+def egemaps_arff_path(input_audio_file):
+    """ARFF temporaneo scritto da SMILExtract accanto al WAV."""
+    base_name = os.path.splitext(os.path.basename(input_audio_file))[0]
+    return os.path.join(os.path.dirname(input_audio_file), base_name + "_eGeMAPS_v2.arff")
+
+
+def _generate_id_from_filename(s: str, base: int = 131, mod: int = 2**31 - 1) -> int:
+    h = 0
+    for ch in s:
+        h = (h * base + ord(ch)) % mod
+    return h
+
+
+def egemaps_rows_from_arff(arff_file, file_names, selected_features):
+    """Legge l'ARFF di SMILExtract (una riga per file, nell'ordine di file_names) e ritorna (righe, colonne)."""
+    with open(arff_file, 'r', encoding='utf-8', errors='ignore') as f:
+        arff_data = arff.load(f)
+    df = pd.DataFrame(arff_data['data'], columns=[attr[0] for attr in arff_data['attributes']])
+    if len(df) < len(file_names):
+        raise RuntimeError(f"ARFF con {len(df)} righe per {len(file_names)} file")
+
+    # MODIFICATO: Gestisci "all" per estrarre tutte le feature
+    if isinstance(selected_features, str) and selected_features.lower() == "all":
+        # Estrai TUTTE le colonne tranne 'name' , 'frameTime' , 'class'
+        exclude_cols = ['name', 'frameTime', 'class']
+        all_feature_cols = [col for col in df.columns if col not in exclude_cols]
+        selected_features = all_feature_cols
+        print(f"[INFO] Extracting ALL {len(all_feature_cols)} eGeMAPS features")
 
-    if os.path.exists(config_file):
+    rows = []
+    for position, file_name in enumerate(file_names):
+        # Genera ID
+        base_name = os.path.splitext(file_name)[0]
+        subject_id = str(_generate_id_from_filename(base_name))
+
+        features_row = [file_name, subject_id]
+        for feature in selected_features:
+            if feature in df.columns:
+                features_row.append(df[feature].values[position])
+            else:
+                features_row.append(None)
+        rows.append(features_row)
+
+    columns = ["filename", "subjectId"] + list(selected_features)
+    return rows, columns
+
+
+def egemaps_row_from_arff(arff_file, file_name, selected_features):
+    """Legge l'ARFF di SMILExtract e ritorna (riga, colonne) per il CSV eGeMAPS."""
+    rows, columns = egemaps_rows_from_arff(arff_file, [file_name], selected_features)
+    return rows[0], columns
+
+
+def remove_arff(arff_file):
+    """Cleanup ARFF (SMILExtract è già terminato: ritenta solo se il file è bloccato)."""
+    for attempt in range(5):
         try:
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                return {
-                    'SMILE_path': config.get('SMILE_path', ''),
-                    'eGeMAPS_config_path': config.get('eGeMAPS_config_path', ''),
-                    'root_folder_path': config.get('root_folder_path', '')
-                }
-        except Exception as e:
-            print(f"Warning: Could not load gui_config.json: {e}")
-    
-    return {
-        'SMILE_path': '',
-        'eGeMAPS_config_path': '',
-        'root_folder_path': ''
-    }
+            if os.path.exists(arff_file):
+                os.remove(arff_file)
+                break
+        except PermissionError:
+            if attempt < 4:
+                time.sleep(0.5)
+        except Exception:
+            break
 
-# Definisci le 48 caratteristiche più pertinenti (versione 2.0 standard)
-egemaps_features_v2 = [
-    "F0semitoneFrom27.5Hz_sma3nz_amean",
-    "F0semitoneFrom27.5Hz_sma3nz_stddevNorm",
-    "F0semitoneFrom27.5Hz_sma3nz_percentile50.0",
-    "loudness_sma3_amean",
-    "loudness_sma3_stddevNorm",
-    "loudness_sma3_percentile50.0",
-    "jitterLocal_sma3nz_amean",
-    "jitterLocal_sma3nz_stddevNorm",
-    "shimmerLocaldB_sma3nz_amean",
-    "shimmerLocaldB_sma3nz_stddevNorm",
-    "HNRdBACF_sma3nz_amean",
-    "HNRdBACF_sma3nz_stddevNorm",
-    "mfcc1_sma3_stddevNorm",
-    "mfcc2_sma3_stddevNorm",
-    "mfcc3_sma3_stddevNorm",
-    "VoicedSegmentsPerSec",
-    "MeanVoicedSegmentLengthSec",
-    "loudness_sma3_percentile20.0",
-    "mfcc2_sma3_amean",
-    "mfcc1_sma3_amean",
-    "mfcc3_sma3_amean",
-    "loudness_sma3_percentile80.0",
-    "loudness_sma3_pctlrange0-2",
-    "loudness_sma3_meanRisingSlope",
-    "loudness_sma3_meanFallingSlope",
-    "loudness_sma3_stddevFallingSlope",
-    "spectralFlux_sma3_amean",
-    "spectralFlux_sma3_stddevNorm",
-    "F0semitoneFrom27.5Hz_sma3nz_percentile20.0",
-    "F0semitoneFrom27.5Hz_sma3nz_percentile80.0",
-    "F0semitoneFrom27.5Hz_sma3nz_pctlrange0-2",
-    "F0semitoneFrom27.5Hz_sma3nz_meanRisingSlope",
-    "F0semitoneFrom27.5Hz_sma3nz_stddevRisingSlope",
-    "F0semitoneFrom27.5Hz_sma3nz_meanFallingSlope",
-    "F0semitoneFrom27.5Hz_sma3nz_stddevFallingSlope",
-    "mfcc4_sma3_amean",
-    "mfcc4_sma3_stddevNorm",
-    "F1frequency_sma3nz_amean",
-    "F1frequency_sma3nz_stddevNorm",
-    "F2frequency_sma3nz_amean",
-    "F2frequency_sma3nz_stddevNorm",
-    "F3frequency_sma3nz_amean",
-    "F3frequency_sma3nz_stddevNorm",
-    "alphaRatioV_sma3nz_amean",
-    "hammarbergIndexV_sma3nz_amean",
-    "slopeV0-500_sma3nz_amean",
-    "slopeV500-1500_sma3nz_amean",
-    "StddevVoicedSegmentLengthSec"
-]
 
-def extract_and_save_features(input_audio_file, selected_features=None):
+def extract_and_save_features(input_audio_file, selected_features=None, cancel_token=None, settings=None):
     if selected_features is None:
         selected_features = egemaps_features_v2
     
-    # RICARICA I PATH OGNI VOLTA
-    config = load_paths_from_gui_config()
-    SMILE_path = config['SMILE_path']
-    eGeMAPS_config_path = config['eGeMAPS_config_path']
-
-    # Validazione
-    if not SMILE_path or not os.path.exists(SMILE_path):
-        raise ValueError(f"SMILExtract not configured. Please configure paths in GUI Settings.")
-    if not eGeMAPS_config_path or not os.path.exists(eGeMAPS_config_path):
-        raise ValueError(f"eGeMAPS config not found: {eGeMAPS_config_path}")
+    # Path openSMILE validati una volta per batch (se non passati: solo per questo file)
+    if settings is None:
+        settings = get_config_service().smile_settings(EGEMAPS_CONFIG_KEY)
     
     file_name = os.path.basename(input_audio_file)
-    base_name = os.path.splitext(file_name)[0]
-    arff_file = os.path.join(os.path.dirname(input_audio_file), base_name + "_eGeMAPS_v2.arff")
+    arff_file = egemaps_arff_path(input_audio_file)
 
     features_row = None
     columns = None
     
     try:
-        # Setup environment
-        smile_dir = os.path.dirname(SMILE_path) if SMILE_path and os.path.isabs(SMILE_path) else None
-        env = os.environ.copy()
-        if smile_dir:
-            env['PATH'] = smile_dir + os.pathsep + env.get('PATH', '')
-        
-        proc = subprocess.run(
-            [SMILE_path, "-C", eGeMAPS_config_path, "-I", input_audio_file, "-O", arff_file],
-            cwd=smile_dir,
-            env=env,
-            capture_output=True,
-            text=True
+        proc = run_cancellable(
+            [settings.smile_path, "-C", settings.config_path, "-I", input_audio_file, "-O", arff_file],
+            cancel_token,
+            cwd=settings.cwd,
+            env=settings.env
         )
         
         if proc.returncode != 0:
             stderr = proc.stderr or proc.stdout or f"exit code {proc.returncode}"
             raise RuntimeError(f"SMILExtract failed: {stderr}")
 
-        time.sleep(0.2)
-        
         # Leggi ARFF
-        with open(arff_file, 'r', encoding='utf-8', errors='ignore') as f:
-            arff_data = arff.load(f)
-        df = pd.DataFrame(arff_data['data'], columns=[attr[0] for attr in arff_data['attributes']])
-
-        # Genera ID
-        def _generate_id_from_filename(s: str, base: int = 131, mod: int = 2**31 - 1) -> int:
-            h = 0
-            for ch in s:
-                h = (h * base + ord(ch)) % mod
-            return h
-
-        subject_id = str(_generate_id_from_filename(base_name))
-        
-        # MODIFICATO: Gestisci "all" per estrarre tutte le feature
-        if isinstance(selected_features, str) and selected_features.lower() == "all":
-            # Estrai TUTTE le colonne tranne 'name' , 'frameTime' , 'class'
-            exclude_cols = ['name', 'frameTime', 'class']
-            all_feature_cols = [col for col in df.columns if col not in exclude_cols]
-            selected_features = all_feature_cols
-            print(f"[INFO] Extracting ALL {len(all_feature_cols)} eGeMAPS features")
-        
-        features_row = [file_name, subject_id]
-
-        for feature in selected_features:
-            if feature in df.columns:
-                features_row.append(df[feature].values[0])
-            else:
-                features_row.append(None)
-
-        columns = ["filename", "subjectId"] + selected_features
+        features_row, columns = egemaps_row_from_arff(arff_file, file_name, selected_features)
         
+    except OperationCancelled:
+        raise
     except Exception as e:
         print(f"[ERROR] extract_and_save_features: {e}")
         raise
         
     finally:
-        # Cleanup ARFF
-        time.sleep(0.3)
-        for attempt in range(5):
-            try:
-                if os.path.exists(arff_file):
-                    os.remove(arff_file)
-                    break
-            except PermissionError:
-                if attempt < 4:
-                    time.sleep(0.5)
-            except Exception:
-                break
+        remove_arff(arff_file)
     
     return features_row, columns
 
-def extract_egemaps_features(path, output_path=None, selected_features=None):
+def extract_features_batch(input_audio_files, selected_features, cancel_token, settings):
+    """
+    Feature eGeMAPS di più WAV brevi con un solo SMILExtract: i WAV vengono
+    concatenati (smile_batch.py) e il config a segmenti (settings, vedi
+    smile_config.segment_egemaps_settings) scrive una riga ARFF per file.
+    Ritorna [(riga, colonne)] nell'ordine di input_audio_files.
+    """
+    if selected_features is None:
+        selected_features = egemaps_features_v2
+    with tempfile.TemporaryDirectory(prefix="smile_batch_") as tmp:
+        batch_wav = os.path.join(tmp, "batch.wav")
+        arff_file = os.path.join(tmp, "batch_eGeMAPS_v2.arff")
+        segments = [(start, max(start, end - SEGMENT_END_TRIM_SECONDS))
+                    for start, end in write_batch_wav(input_audio_files, batch_wav)]
+        run_segments(settings, settings.config_path, batch_wav, arff_file, segments, cancel_token)
+        rows, columns = egemaps_rows_from_arff(
+            arff_file, [os.path.basename(f) for f in input_audio_files], selected_features)
+    return [(row, columns) for row in rows]
+
+
+def extract_egemaps_features(path, output_path=None, selected_features=None, progress_callback=None,
+                             cancel_token=None, config=None, catalog=None, resume=True, batch_files=None):
     """
     Estrae le feature eGeMAPS da un file audio o da una cartella
     
@@ -193,9 +167,22 @@ def extract_egemaps_features(path, output_path=None, selected_features=None):
         path (str): Percorso al file audio o alla cartella
         output_path (str): Percorso del file CSV di output
         selected_features (list|str): Lista delle feature da estrarre, "all" per tutte, None = v2 (48)
+        progress_callback (callable): riceve gli eventi di progresso (vedi progress.py), stage 'egemaps'
+        cancel_token (CancellationToken): se cancellato, termina SMILExtract in corso e solleva
+            OperationCancelled (le righe già estratte restano nel CSV, riprendibile)
+        config (ConfigService): sorgente dei path openSMILE, validati una volta per batch
+            (default: gui_config.json condiviso)
+        catalog (Catalog|str): catalogo SQLite (o suo path) dove registrare le feature estratte
+        resume (bool): se un'esecuzione precedente con gli stessi parametri è stata
+            interrotta, salta i file già presenti nell'output (per path relativo a `path`, vedi result_sink.py)
+        batch_files (int): WAV brevi per SMILExtract, concatenati e divisi con il config
+            a segmenti (vedi smile_batch.py); default 'smile_batch_files' di gui_config.json,
+            0 = un SMILExtract per file. Un batch non riuscito viene ripetuto file per file
     """
     if not output_path:
         raise ValueError("output_path must be provided to extract_egemaps_features")
+    config = config or get_config_service()
+    settings = config.smile_settings(EGEMAPS_CONFIG_KEY)
     
     # MODIFICATO: Gestisci "all"
     if selected_features is None:
@@ -204,49 +191,93 @@ def extract_egemaps_features(path, output_path=None, selected_features=None):
         # Passa "all" alla funzione extract_and_save_features
         pass
     
-    all_rows = []
-    columns = None  # Sarà definito dalla prima estrazione
-    
+    # Elenco dei WAV prima di iniziare: serve il totale per progresso ed ETA
     if os.path.isfile(path):
-        if path.lower().endswith('.wav'):
-            try:
-                row, cols = extract_and_save_features(path, selected_features)
-                if row:
-                    all_rows.append(row)
-                    columns = cols
-                    print(f"[OK] Extracted {len(row)-2} features from: {row[0]}")
-            except Exception as e:
-                print(f"[ERROR] Exception caught: {e}")
-                import traceback
-                traceback.print_exc()
+        wav_paths = [path] if path.lower().endswith('.wav') else []
     else:
+        wav_paths = []
         for dirpath, _, filenames in os.walk(path):
-            wav_files = [f for f in filenames if f.lower().endswith(".wav")]
-            for file in wav_files:
-                input_file = os.path.join(dirpath, file)
+            wav_paths.extend(os.path.join(dirpath, f) for f in filenames if f.lower().endswith(".wav"))
+
+    # Parametri dell'estrazione: identificano l'output per la ripresa e nel catalogo
+    run_params = egemaps_params(settings.config_path, selected_features)
+
+    catalog, close_catalog = open_catalog(catalog)
+    # Righe accodate al CSV a blocchi man mano che i file terminano
+    sink = ResultSink(output_path, run_params, resume=resume)
+    try:
+        with sink:
+            tracker = ProgressTracker('egemaps', len(wav_paths), progress_callback)
+            tracker.start()
+            pending = []
+            for index, input_file in enumerate(wav_paths):
+                if resume_key(input_file, path) in sink.done:
+                    tracker.file_started(input_file, index)
+                    tracker.file_finished(input_file, index, ok=True)
+                else:
+                    pending.append(index)
+
+            # Più WAV brevi per SMILExtract solo se il config a segmenti è disponibile
+            batch_files = resolve_batch_files(batch_files, config) if pending else 0
+            segment_settings = segment_egemaps_settings(config, settings) if batch_files > 1 else None
+            index_of = {wav_paths[index]: index for index in pending}
+            groups = plan_batches([wav_paths[index] for index in pending],
+                                  batch_files if segment_settings else 0)
+            for group in groups:
+                for input_file in group:
+                    tracker.file_started(input_file, index_of[input_file])
                 try:
-                    row, cols = extract_and_save_features(input_file, selected_features)
-                    if row:
-                        all_rows.append(row)
-                        if columns is None:
-                            columns = cols
-                        print(f"[OK] {file}")
-                except Exception as e:
-                    print(f"[ERROR] {file}: {e}")
-    
-    # Scrivi tutto alla fine
-    time.sleep(0.5)
+                    if cancel_token is not None:
+                        cancel_token.raise_if_cancelled()
+                    results = None
+                    if len(group) > 1:
+                        try:
+                            results = extract_features_batch(group, selected_features, cancel_token,
+                                                             segment_settings)
+                        except OperationCancelled:
+                            raise
+                        except Exception as e:
+                            print(f"⚠ Batch di {len(group)} file non riuscito ({e}): un SMILExtract per file")
+                    for position, input_file in enumerate(group):
+                        index = index_of[input_file]
+                        file = os.path.basename(input_file)
+                        try:
+                            if results is not None:
+                                row, cols = results[position]
+                            else:
+                                if cancel_token is not None:
+                                    cancel_token.raise_if_cancelled()
+                                row, cols = extract_and_save_features(input_file, selected_features,
+                                                                      cancel_token, settings)
+                            if row:
+                                sink.add(row, cols, key=resume_key(input_file, path))
+                                record_extraction(catalog, input_file, 'egemaps', dict(zip(cols, row)), run_params)
+                                print(f"[OK] {file}")
+                            tracker.file_finished(input_file, index, ok=bool(row))
+                        except OperationCancelled:
+                            raise
+                        except Exception as e:
+                            print(f"[ERROR] {file}: {e}")
+                            tracker.file_finished(input_file, index, ok=False, error=e)
+                except OperationCancelled:
+                    print(f"\n⚠ Estrazione eGeMAPS interrotta ({tracker.done}/{len(wav_paths)} file), "
+                          f"righe estratte salvate in {output_path} (riprendibile)")
+                    tracker.finish(cancelled=True)
+                    raise
+            tracker.finish()
+    except OperationCancelled:
+        raise
+    except Exception as e:
+        print(f"\n❌ ERRORE scrittura CSV: {e}")
+        raise
+    finally:
+        if close_catalog:
+            catalog.close()
 
-    if all_rows and columns:
-        try:
-            df_output = pd.DataFrame(all_rows, columns=columns)
-            df_output.to_csv(output_path, index=False, sep=';', mode='w')
-            print(f"\n✅ Salvato: {output_path}")
-            print(f"   Features estratte: {len(columns)-2}")
-            print(f"   File processati: {len(all_rows)}")
-        except Exception as e:
-            print(f"\n❌ ERRORE scrittura CSV: {e}")
-            raise
+    if sink.rows and sink.columns:
+        print(f"\n✅ Salvato: {output_path}")
+        print(f"   Features estratte: {len(sink.columns)-2}")
+        print(f"   File processati: {sink.rows}")
     else:
         print("\n⚠ Nessuna feature estratta")
 
@@ -256,6 +287,10 @@ if __name__ == "__main__":
     ap.add_argument("root", help="Cartella o file WAV da processare")
     ap.add_argument("-o", "--out", help="Percorso del file CSV di output (default: stessa cartella input)")
     ap.add_argument("--all", action="store_true", help="Estrai tutte le 88 feature invece delle 48 standard")
+    ap.add_argument("--progress-log", default=None, help="File JSON-lines dove registrare gli eventi di progresso")
+    ap.add_argument("--no-resume", action="store_true", help="Riscrivi l'output anche se un'esecuzione precedente è stata interrotta")
+    ap.add_argument("--batch-files", type=int, default=None,
+                    help="WAV brevi per SMILExtract (default: smile_batch_files in gui_config.json, 0 = disattivato)")
     args = ap.parse_args()
     
     # Output di default nella stessa cartella dell'input
@@ -274,4 +309,9 @@ if __name__ == "__main__":
     print(f"Input: {args.root}")
     print(f"Output: {out}")
     print(f"Feature set: {'ALL (88)' if args.all else 'Standard v2 (48)'}")
-    extract_egemaps_features(args.root, out, features)
+    progress = combine_callbacks(
+        ConsoleProgress(),
+        JsonlProgressLogger(args.progress_log) if args.progress_log else None
+    )
+    extract_egemaps_features(args.root, out, features, progress_callback=progress, resume=not args.no_resume,
+                             batch_files=args.batch_files)
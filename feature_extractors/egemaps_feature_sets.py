@@ -0,0 +1,58 @@
+"""
+Set di feature eGeMAPS.
+
+Modulo senza dipendenze pesanti: la GUI può mostrare le liste di feature
+senza importare pandas/liac-arff (caricati solo all'estrazione).
+"""
+
+# Definisci le 48 caratteristiche più pertinenti (versione 2.0 standard)
+egemaps_features_v2 = [
+    "F0semitoneFrom27.5Hz_sma3nz_amean",
+    "F0semitoneFrom27.5Hz_sma3nz_stddevNorm",
+    "F0semitoneFrom27.5Hz_sma3nz_percentile50.0",
+    "loudness_sma3_amean",
+    "loudness_sma3_stddevNorm",
+    "loudness_sma3_percentile50.0",
+    "jitterLocal_sma3nz_amean",
+    "jitterLocal_sma3nz_stddevNorm",
+    "shimmerLocaldB_sma3nz_amean",
+    "shimmerLocaldB_sma3nz_stddevNorm",
+    "HNRdBACF_sma3nz_amean",
+    "HNRdBACF_sma3nz_stddevNorm",
+    "mfcc1_sma3_stddevNorm",
+    "mfcc2_sma3_stddevNorm",
+    "mfcc3_sma3_stddevNorm",
+    "VoicedSegmentsPerSec",
+    "MeanVoicedSegmentLengthSec",
+    "loudness_sma3_percentile20.0",
+    "mfcc2_sma3_amean",
+    "mfcc1_sma3_amean",
+    "mfcc3_sma3_amean",
+    "loudness_sma3_percentile80.0",
+    "loudness_sma3_pctlrange0-2",
+    "loudness_sma3_meanRisingSlope",
+    "loudness_sma3_meanFallingSlope",
+    "loudness_sma3_stddevFallingSlope",
+    "spectralFlux_sma3_amean",
+    "spectralFlux_sma3_stddevNorm",
+    "F0semitoneFrom27.5Hz_sma3nz_percentile20.0",
+    "F0semitoneFrom27.5Hz_sma3nz_percentile80.0",
+    "F0semitoneFrom27.5Hz_sma3nz_pctlrange0-2",
+    "F0semitoneFrom27.5Hz_sma3nz_meanRisingSlope",
+    "F0semitoneFrom27.5Hz_sma3nz_stddevRisingSlope",
+    "F0semitoneFrom27.5Hz_sma3nz_meanFallingSlope",
+    "F0semitoneFrom27.5Hz_sma3nz_stddevFallingSlope",
+    "mfcc4_sma3_amean",
+    "mfcc4_sma3_stddevNorm",
+    "F1frequency_sma3nz_amean",
+    "F1frequency_sma3nz_stddevNorm",
+    "F2frequency_sma3nz_amean",
+    "F2frequency_sma3nz_stddevNorm",
+    "F3frequency_sma3nz_amean",
+    "F3frequency_sma3nz_stddevNorm",
+    "alphaRatioV_sma3nz_amean",
+    "hammarbergIndexV_sma3nz_amean",
+    "slopeV0-500_sma3nz_amean",
+    "slopeV500-1500_sma3nz_amean",
+    "StddevVoicedSegmentLengthSec"
+]
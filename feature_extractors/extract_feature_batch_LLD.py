@@ -1,86 +1,73 @@
 import os
-import subprocess
+import tempfile
 import pandas as pd
-import json
 
-import os
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-# NUOVO: Carica i path dal JSON della GUI
-def load_paths_from_gui_config():
-    """Carica i path dal file gui_config.json"""
-    config_file = os.path.join(os.path.dirname(__file__), '..', 'UI', 'gui_config.json')
-    
-    if os.path.exists(config_file):
-        try:
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                return {
-                    'SMILE_path': config.get('SMILE_path', ''),
-                    'Compare2016_config_path': config.get('Compare2016_config_path', ''),
-                    'root_folder_path': config.get('root_folder_path', '')
-                }
-        except Exception as e:
-            print(f"Warning: Could not load gui_config.json: {e}")
-    
-    return {
-        'SMILE_path': '',
-        'Compare2016_config_path': '',
-        'root_folder_path': ''
-    }
-
-# Carica i path
-_config = load_paths_from_gui_config()
-SMILE_path = _config['SMILE_path']
-Compare2016_config_path = _config['Compare2016_config_path']
-root_folder_path = _config['root_folder_path']
-
-
-def generate_lld_for_file(input_file, smile_path=None, config_path=None):
+try:
+    from feature_extractors.progress import ProgressTracker, ConsoleProgress, JsonlProgressLogger, combine_callbacks
+    from feature_extractors.cancellation import OperationCancelled, run_cancellable
+    from feature_extractors.config_service import get_config_service, LLD_CONFIG_KEY
+    from feature_extractors.smile_config import lld_settings
+    from feature_extractors.smile_batch import resolve_batch_files, plan_batches, write_batch_wav, split_lld
+except Exception:
+    from .progress import ProgressTracker, ConsoleProgress, JsonlProgressLogger, combine_callbacks
+    from .cancellation import OperationCancelled, run_cancellable
+    from .config_service import get_config_service, LLD_CONFIG_KEY
+    from .smile_config import lld_settings
+    from .smile_batch import resolve_batch_files, plan_batches, write_batch_wav, split_lld
+
+
+def generate_lld_for_file(input_file, smile_path=None, config_path=None, cancel_token=None,
+                          created_files=None, settings=None):
     """Generate a single _LLD.csv for input_file using openSMILE.
 
+    If cancel_token is cancelled while SMILExtract runs, the process is killed,
+    the partial LLD file is removed and OperationCancelled is raised.
+    If created_files (list) is given, the LLD path is appended to it only when
+    this call actually created the file (pre-existing LLDs are not listed).
+    settings (SmileSettings) are the openSMILE paths validated once per batch
+    (see config_service.py); without them they are resolved for this call only,
+    using the minimal LLD config (smile_config.py) unless explicit paths are given.
     Returns the path to the generated LLD CSV, or None on failure.
     """
-    # RICARICA I PATH OGNI VOLTA
-    if smile_path is None or config_path is None:
-        config = load_paths_from_gui_config()
-        smile_path = smile_path or config['SMILE_path']
-        config_path = config_path or config['Compare2016_config_path']
-    
     base = os.path.splitext(os.path.basename(input_file))[0]
     lld_csv = os.path.join(os.path.dirname(input_file), base + "_LLD.csv")
     if os.path.exists(lld_csv):
         return lld_csv
 
     try:
-        # Ensure SMILExtract can find its runtime dependencies by using its folder as cwd
-        smile_dir = os.path.dirname(smile_path) if smile_path and os.path.isabs(smile_path) else None
-        env = os.environ.copy()
-        if smile_dir:
-            env['PATH'] = smile_dir + os.pathsep + env.get('PATH', '')
-
-        # verify SMILExtract binary exists
-        if not smile_path or not os.path.exists(smile_path):
-            raise RuntimeError(f"SMILExtract executable not found: {smile_path}. Please configure openSMILE in GUI Settings.")
-
-        # verify config exists
-        if not config_path or not os.path.exists(config_path):
-            raise RuntimeError(f"Config file not found: {config_path}. Please configure openSMILE in GUI Settings.")
-
-        proc = subprocess.run([
-            smile_path,
-            "-C", config_path,
-            "-I", input_file,
-            "-lldcsvoutput", lld_csv,
-            "-nologfile", "-loglevel", "2"
-        ], cwd=smile_dir if smile_dir else None, env=env, capture_output=True, text=True)
+        if settings is None:
+            if smile_path or config_path:
+                settings = get_config_service().smile_settings(LLD_CONFIG_KEY, smile_path, config_path)
+            else:
+                settings = lld_settings()
+
+        try:
+            proc = run_cancellable([
+                settings.smile_path,
+                "-C", settings.config_path,
+                "-I", input_file,
+                "-lldcsvoutput", lld_csv,
+                "-nologfile", "-loglevel", "2"
+            ], cancel_token, cwd=settings.cwd, env=settings.env)
+        except OperationCancelled:
+            # LLD scritto a metà: rimuovilo, verrà rigenerato al prossimo run
+            if os.path.exists(lld_csv):
+                try:
+                    os.remove(lld_csv)
+                except OSError as e:
+                    print(f"⚠️ LLD parziale non rimosso: {lld_csv} ({e})")
+            raise
 
         if proc.returncode != 0:
             stderr = proc.stderr or proc.stdout or f"exit code {proc.returncode}"
             raise RuntimeError(f"SMILExtract failed for {input_file}: {stderr}")
 
         if os.path.exists(lld_csv):
+            if created_files is not None:
+                created_files.append(lld_csv)
             try:
                 df = pd.read_csv(lld_csv, sep=';')
                 print(f"✅ Estratto: {lld_csv} | colonne: {len(df.columns)} | righe: {len(df)}")
@@ -89,35 +76,132 @@ def generate_lld_for_file(input_file, smile_path=None, config_path=None):
             return lld_csv
         else:
             raise RuntimeError(f"SMILExtract reported success but {lld_csv} was not created")
+    except OperationCancelled:
+        raise
     except Exception as e:
         print(f"Errore generazione LLD per {input_file}: {e}")
         raise
 
 
-def generate_lld_in_tree(root_folder):
+def generate_lld_for_batch(input_files, settings, cancel_token=None, created_files=None):
+    """Generate the _LLD.csv of several short WAVs with a single SMILExtract run.
+
+    The WAVs (same format) are concatenated with silence in a temporary WAV and
+    the batch LLD CSV is split back per file by frameTime (see smile_batch.py).
+    The per-file LLDs are written only after SMILExtract succeeds, so a
+    cancelled or failed batch leaves no partial files.
+    Returns the LLD CSV paths, in the order of input_files.
+    """
+    lld_paths = []
+    for input_file in input_files:
+        base = os.path.splitext(os.path.basename(input_file))[0]
+        lld_paths.append(os.path.join(os.path.dirname(input_file), base + "_LLD.csv"))
+
+    with tempfile.TemporaryDirectory(prefix="smile_batch_") as tmp:
+        batch_wav = os.path.join(tmp, "batch.wav")
+        batch_lld = os.path.join(tmp, "batch_LLD.csv")
+        segments = write_batch_wav(input_files, batch_wav)
+        proc = run_cancellable([
+            settings.smile_path,
+            "-C", settings.config_path,
+            "-I", batch_wav,
+            "-lldcsvoutput", batch_lld,
+            "-nologfile", "-loglevel", "2"
+        ], cancel_token, cwd=settings.cwd, env=settings.env)
+        if proc.returncode != 0:
+            stderr = proc.stderr or proc.stdout or f"exit code {proc.returncode}"
+            raise RuntimeError(f"SMILExtract failed for a batch of {len(input_files)} files: {stderr}")
+        if not os.path.exists(batch_lld):
+            raise RuntimeError("SMILExtract reported success but the batch LLD was not created")
+        split_lld(batch_lld, segments, lld_paths, created_files)
+    print(f"✅ Estratti {len(lld_paths)} LLD con un solo SMILExtract")
+    return lld_paths
+
+
+def generate_lld_in_tree(root_folder, progress_callback=None, cancel_token=None, created_files=None,
+                         config=None, batch_files=None):
     """Walk root_folder and generate LLD CSVs.
     
-    Returns a list of generated LLD CSV file paths.
+    progress_callback receives the progress events (see progress.py), stage 'lld'.
+    cancel_token (CancellationToken) stops the walk and kills the running
+    SMILExtract; completed LLD files are kept, so a new run resumes from there.
+    created_files (list) receives the LLD files created by this run (manifest
+    for cleanup; filled as files are created, so it is valid even on errors).
+    config (ConfigService) provides the openSMILE paths, validated once before
+    the first SMILExtract run (default: shared gui_config.json service); the
+    LLDs are generated with the minimal config unless lld_config_mode is 'full'.
+    batch_files (int) groups up to that many short WAVs per SMILExtract run
+    (see smile_batch.py; default: 'smile_batch_files' in gui_config.json, 0 = off);
+    a failed batch is retried one file at a time.
+    Returns a list of LLD CSV file paths (generated and pre-existing).
     """
-    generated = []
+    wav_paths = []
     for dirpath, _, filenames in os.walk(root_folder):
-        wav_files = [f for f in filenames if f.lower().endswith('.wav')]
-        if not wav_files:
-            continue
-
-        for file in wav_files:
-            input_file = os.path.join(dirpath, file)
-            base = os.path.splitext(file)[0]
-            lld_csv = os.path.join(dirpath, base + '_LLD.csv')
-            if os.path.exists(lld_csv):
-                generated.append(lld_csv)  # Conta anche quelli esistenti
-                continue
-            try:
-                res = generate_lld_for_file(input_file)
-                if res:
-                    generated.append(res)
-            except Exception as e:
-                print(f"Errore con {input_file}: {e}")
+        wav_paths.extend(os.path.join(dirpath, f) for f in filenames if f.lower().endswith('.wav'))
+
+    generated = []
+    settings = None
+    tracker = ProgressTracker('lld', len(wav_paths), progress_callback)
+    tracker.start()
+    pending = []
+    for index, input_file in enumerate(wav_paths):
+        base = os.path.splitext(os.path.basename(input_file))[0]
+        lld_csv = os.path.join(os.path.dirname(input_file), base + '_LLD.csv')
+        if os.path.exists(lld_csv):
+            tracker.file_started(input_file, index)
+            generated.append(lld_csv)  # Conta anche quelli esistenti
+            tracker.file_finished(input_file, index, ok=True)
+        else:
+            pending.append(index)
+
+    if pending:
+        # Validazione dei path una sola volta, prima del primo LLD da generare (errore = stop del batch)
+        try:
+            settings = lld_settings(config)
+        except Exception as e:
+            tracker.file_started(wav_paths[pending[0]], pending[0])
+            tracker.file_finished(wav_paths[pending[0]], pending[0], ok=False, error=e)
+            tracker.finish()
+            raise
+        batch_files = resolve_batch_files(batch_files, config)
+
+    index_of = {wav_paths[index]: index for index in pending}
+    for group in plan_batches([wav_paths[index] for index in pending], batch_files or 0):
+        for input_file in group:
+            tracker.file_started(input_file, index_of[input_file])
+        try:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            if len(group) > 1:
+                try:
+                    res = generate_lld_for_batch(group, settings, cancel_token, created_files)
+                    generated.extend(res)
+                    for input_file in group:
+                        tracker.file_finished(input_file, index_of[input_file], ok=True)
+                    continue
+                except OperationCancelled:
+                    raise
+                except Exception as e:
+                    print(f"⚠️ Batch di {len(group)} file non riuscito ({e}): un SMILExtract per file")
+            for input_file in group:
+                index = index_of[input_file]
+                try:
+                    if cancel_token is not None:
+                        cancel_token.raise_if_cancelled()
+                    res = generate_lld_for_file(input_file, cancel_token=cancel_token,
+                                                created_files=created_files, settings=settings)
+                    if res:
+                        generated.append(res)
+                    tracker.file_finished(input_file, index, ok=bool(res))
+                except OperationCancelled:
+                    raise
+                except Exception as e:
+                    print(f"Errore con {input_file}: {e}")
+                    tracker.file_finished(input_file, index, ok=False, error=e)
+        except OperationCancelled:
+            tracker.finish(cancelled=True)
+            raise
+    tracker.finish()
     return generated
 
 
@@ -125,9 +209,16 @@ if __name__ == '__main__':
     import argparse
 
     ap = argparse.ArgumentParser(description="Generate LLD CSV files from WAV files using openSMILE.")
-    ap.add_argument("--root", default=root_folder_path, help="Root folder to scan for WAV files.")
+    ap.add_argument("--root", default=get_config_service().get('root_folder_path'), help="Root folder to scan for WAV files.")
     ap.add_argument("--verbose", action="store_true", help="Print verbose messages.")
+    ap.add_argument("--progress-log", default=None, help="JSON-lines file where progress events are logged.")
+    ap.add_argument("--batch-files", type=int, default=None,
+                    help="Short WAVs per SMILExtract run (default: smile_batch_files in gui_config.json, 0 = off).")
     args = ap.parse_args()
 
-    gen = generate_lld_in_tree(args.root)
+    progress = combine_callbacks(
+        ConsoleProgress(),
+        JsonlProgressLogger(args.progress_log) if args.progress_log else None
+    )
+    gen = generate_lld_in_tree(args.root, progress_callback=progress, batch_files=args.batch_files)
     print(f"Generati {len(gen)} file LLD in {args.root}")
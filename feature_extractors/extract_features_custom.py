@@ -10,6 +10,21 @@ import os
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+try:
+    from feature_extractors.progress import ProgressTracker, ConsoleProgress, JsonlProgressLogger, combine_callbacks
+    from feature_extractors.cancellation import OperationCancelled
+    from feature_extractors.catalog import open_catalog, record_extraction, custom_params
+    from feature_extractors.config_service import get_config_service, LLD_CONFIG_KEY, LLD_BACKEND_KEY
+    from feature_extractors.result_sink import ResultSink, resume_key
+    from feature_extractors.lld_engine import compute_lld_frame, ENGINE_VERSION
+except Exception:
+    from .progress import ProgressTracker, ConsoleProgress, JsonlProgressLogger, combine_callbacks
+    from .cancellation import OperationCancelled
+    from .catalog import open_catalog, record_extraction, custom_params
+    from .config_service import get_config_service, LLD_CONFIG_KEY, LLD_BACKEND_KEY
+    from .result_sink import ResultSink, resume_key
+    from .lld_engine import compute_lld_frame, ENGINE_VERSION
+
 
 
 # =========================================
@@ -20,6 +35,10 @@ MIN_PAUSE_DEFAULT   = 0.20     # s, durata minima per considerare una pausa
 LONG_PAUSE_DEFAULT  = 1.5      # s, soglia per LongPauseCount
 DT                  = 0.01     # s (10 ms, frame step)
 
+# Sorgente degli LLD: SMILExtract (ComParE_2016, CSV su disco) o motore NumPy interno (lld_engine.py)
+LLD_BACKENDS = ('opensmile', 'numpy')
+LLD_BACKEND_DEFAULT = 'opensmile'
+
 
 # Colonne richieste dai CSV LLD (estendibile)
 REQUIRED_COLS = [
@@ -77,6 +96,20 @@ def load_lld_csv_min(path, usecols):
     raise RuntimeError(f"Impossibile leggere {path}: {last_err}")
 
 
+def resolve_lld_backend(lld_backend=None, config=None):
+    """Backend LLD esplicito, altrimenti 'lld_backend' di gui_config.json (default 'opensmile')."""
+    backend = lld_backend or (config or get_config_service()).get(LLD_BACKEND_KEY, LLD_BACKEND_DEFAULT)
+    if backend not in LLD_BACKENDS:
+        raise ValueError(f"Backend LLD non valido: {backend} (ammessi: {', '.join(LLD_BACKENDS)})")
+    return backend
+
+
+def lld_path_for(wav):
+    """<nome>.wav -> <nome>_LLD.csv nella stessa cartella."""
+    base = os.path.splitext(os.path.basename(wav))[0]
+    return os.path.join(os.path.dirname(wav), base + "_LLD.csv")
+
+
 
 # =========================================
 # 2) Funzioni di supporto per i calcoli
@@ -334,23 +367,29 @@ def mfcc5_std(df):
 # =========================================
 # MODIFICATO: Aggiunto parametro selected_features
 def process_file(path, voicing_thr, min_pause, long_pause_thr, dt,
-                 smooth_win_ms, use_hysteresis, selected_features=None):
+                 smooth_win_ms, use_hysteresis, selected_features=None, stats=None, lld_frame=None):
     """
     Elabora un singolo file LLD ed estrae le feature richieste.
     
     Args:
         selected_features: Lista delle feature da estrarre (None = tutte)
+        stats: dict opzionale, riceve 'frames' (numero di frame LLD letti)
+        lld_frame: LLD già calcolati (DataFrame, es. da lld_engine); il CSV in `path`
+            non viene letto e `path` serve solo per filename/subjectId
     """
     # Se non specificato, usa tutte le feature
     if selected_features is None:
         selected_features = ALL_CUSTOM_FEATURES
     
     # Lettura
-    try:
-        df = load_lld_csv_min(path, usecols=REQUIRED_COLS)
-    except Exception as e:
-        print(f"[ERR read] {path} -> {e}", file=sys.stderr)
-        return None
+    if lld_frame is not None:
+        df = lld_frame
+    else:
+        try:
+            df = load_lld_csv_min(path, usecols=REQUIRED_COLS)
+        except Exception as e:
+            print(f"[ERR read] {path} -> {e}", file=sys.stderr)
+            return None
 
     # Controllo colonne richieste
     missing = [c for c in REQUIRED_COLS if c not in df.columns]
@@ -358,6 +397,9 @@ def process_file(path, voicing_thr, min_pause, long_pause_thr, dt,
         print(f"[ERR cols] {path} -> mancano colonne {missing}", file=sys.stderr)
         return None
 
+    if stats is not None:
+        stats['frames'] = len(df)
+
     # Maschera voiced
     vmask = compute_vmask(df['voicingFinalUnclipped_sma'],
                           thr=voicing_thr,
@@ -420,7 +462,9 @@ def process_file(path, voicing_thr, min_pause, long_pause_thr, dt,
 # MODIFICATO: Aggiunto parametro selected_features
 def extract_custom_features(path, voicing_thr=VOICING_THR_DEFAULT, min_pause=MIN_PAUSE_DEFAULT,
                           long_pause_thr=LONG_PAUSE_DEFAULT, smooth_win_ms=50, hysteresis=True,
-                          output_path=None, selected_features=None):
+                          output_path=None, selected_features=None, progress_callback=None,
+                          cancel_token=None, created_files=None, config=None, catalog=None, resume=True,
+                          lld_backend=None):
     """
     Estrae le feature custom da un file audio o da una cartella contenente file audio
     
@@ -433,23 +477,55 @@ def extract_custom_features(path, voicing_thr=VOICING_THR_DEFAULT, min_pause=MIN
         hysteresis (bool): Abilita isteresi (default True)
         output_path (str): Path del file CSV di output
         selected_features (list): Lista delle feature da estrarre (None = tutte)
+        progress_callback (callable): riceve gli eventi di progresso (vedi progress.py),
+            stage 'lld' per la generazione degli LLD e 'custom' per il calcolo delle feature
+        cancel_token (CancellationToken): se cancellato, interrompe generazione LLD e calcolo
+            (OperationCancelled); le righe già calcolate restano nel CSV (riprendibile)
+        created_files (list): manifest dei file intermedi (LLD) creati da questa chiamata,
+            riempito man mano (valido anche se l'estrazione fallisce o viene cancellata)
+        config (ConfigService): sorgente dei path openSMILE per generare gli LLD mancanti
+            (default: gui_config.json condiviso)
+        catalog (Catalog|str): catalogo SQLite (o suo path) dove registrare LLD e feature;
+            la registrazione è il WAV accanto all'LLD (<nome>_LLD.csv -> <nome>.wav)
+        resume (bool): se un'esecuzione precedente con gli stessi parametri è stata
+            interrotta, salta gli LLD già presenti nell'output (per path relativo a `path`, vedi result_sink.py)
+        lld_backend (str): 'opensmile' (LLD CSV da SMILExtract) o 'numpy' (LLD calcolati
+            in memoria da lld_engine.py, senza SMILExtract né CSV intermedi);
+            None = 'lld_backend' di gui_config.json, default 'opensmile'
+
+    Returns:
+        list: i file intermedi creati (gli LLD già presenti non sono inclusi)
     """
+    if created_files is None:
+        created_files = []
     # Se non specificato, usa tutte le feature
     if selected_features is None:
         selected_features = ALL_CUSTOM_FEATURES
+    backend = resolve_lld_backend(lld_backend, config)
     
     # Import LLD generation functions
     try:
         try:
             from feature_extractors.extract_feature_batch_LLD import generate_lld_for_file, generate_lld_in_tree
+            from feature_extractors.smile_config import lld_settings
         except Exception:
             from .extract_feature_batch_LLD import generate_lld_for_file, generate_lld_in_tree
+            from .smile_config import lld_settings
     except Exception:
         generate_lld_for_file = None
         generate_lld_in_tree = None
 
     files = []
-    if os.path.isfile(path):
+    wav_sources = {}  # backend numpy: LLD (nome virtuale, per filename/subjectId) -> WAV di origine
+    if backend == 'numpy':
+        if os.path.isfile(path):
+            wavs = [path] if path.lower().endswith('.wav') else []
+        else:
+            wavs = [os.path.join(dirpath, f) for dirpath, _, filenames in os.walk(path)
+                    for f in filenames if f.lower().endswith('.wav')]
+        wav_sources = {lld_path_for(wav): wav for wav in wavs}
+        files = list(wav_sources)
+    elif os.path.isfile(path):
         base_audio = os.path.basename(path)
         base = os.path.splitext(base_audio)[0]
         expected = os.path.join(os.path.dirname(path), base + "_LLD.csv")
@@ -458,12 +534,23 @@ def extract_custom_features(path, voicing_thr=VOICING_THR_DEFAULT, min_pause=MIN
         else:
             if generate_lld_for_file:
                 print(f"LLD non trovato per {path}. Provo a generarlo -> {expected}")
+                tracker = ProgressTracker('lld', 1, progress_callback)
+                tracker.start()
+                tracker.file_started(path, 0)
                 try:
-                    res = generate_lld_for_file(path)
+                    settings = lld_settings(config) if config is not None else None
+                    res = generate_lld_for_file(path, cancel_token=cancel_token, created_files=created_files,
+                                                settings=settings)
                     if res:
                         files = [res]
+                    tracker.file_finished(path, 0, ok=bool(res))
+                except OperationCancelled:
+                    raise
                 except Exception as e:
+                    tracker.file_finished(path, 0, ok=False, error=e)
                     raise RuntimeError(f"Generazione LLD fallita per {path}: {e}")
+                finally:
+                    tracker.finish(cancelled=cancel_token is not None and cancel_token.cancelled)
     else:
         # folder
         pattern = "**/*LLD*.csv"
@@ -472,31 +559,74 @@ def extract_custom_features(path, voicing_thr=VOICING_THR_DEFAULT, min_pause=MIN
         if not files and generate_lld_in_tree:
             print(f"Nessun LLD trovato. Genero LLD per la cartella...")
             try:
-                files = generate_lld_in_tree(root)
+                files = generate_lld_in_tree(root, progress_callback=progress_callback,
+                                             cancel_token=cancel_token, created_files=created_files,
+                                             config=config)
+            except OperationCancelled:
+                raise
             except Exception as e:
                 raise RuntimeError(f"Generazione LLD nella cartella fallita: {e}")
 
     if not files:
-        raise ValueError("Nessun file LLD trovato o generato.")
-
-    rows = []
-    for fp in files:
-        # MODIFICATO: Passa selected_features a process_file
-        res = process_file(fp, voicing_thr, min_pause, long_pause_thr, DT,
-                         smooth_win_ms, hysteresis, selected_features)
-        if res is not None:
-            rows.append(res)
-            print(f"[OK] {fp}")
-        else:
-            print(f"[SKIP] {fp}", file=sys.stderr)
-
-    # Output
+        raise ValueError("Nessun file WAV trovato." if backend == 'numpy' else "Nessun file LLD trovato o generato.")
     if not output_path:
         raise ValueError("output_path must be provided to extract_custom_features")
-    out_path = output_path
-    df_output = pd.DataFrame(rows)
-    df_output.to_csv(out_path, index=False, sep=";", mode='w')
-    print(f"\n✅ Fatto. Salvato: {out_path}")
+
+    # Parametri dell'estrazione: identificano l'output per la ripresa e nel catalogo
+    lld_config_path = (config or get_config_service()).load().get(LLD_CONFIG_KEY)
+    run_params = custom_params(lld_config_path, selected_features, voicing_thr, min_pause,
+                               long_pause_thr, smooth_win_ms, hysteresis,
+                               lld_backend=backend, engine_version=ENGINE_VERSION)
+
+    catalog, close_catalog = open_catalog(catalog)
+    # Righe accodate al CSV a blocchi man mano che i file terminano
+    sink = ResultSink(output_path, run_params, resume=resume)
+    try:
+        with sink:
+            tracker = ProgressTracker('custom', len(files), progress_callback)
+            tracker.start()
+            for index, fp in enumerate(files):
+                if cancel_token is not None and cancel_token.cancelled:
+                    print(f"\n⚠ Estrazione custom interrotta ({tracker.done}/{len(files)} file), "
+                          f"righe calcolate salvate in {output_path} (riprendibile)")
+                    tracker.finish(cancelled=True)
+                    cancel_token.raise_if_cancelled()
+                tracker.file_started(fp, index)
+                if resume_key(fp, path) in sink.done:
+                    tracker.file_finished(fp, index, ok=True)
+                    continue
+                stats = {}
+                wav_source = wav_sources.get(fp)
+                try:
+                    lld_frame = compute_lld_frame(wav_source) if wav_source else None
+                except Exception as e:
+                    print(f"[ERROR] {wav_source}: {e}", file=sys.stderr)
+                    tracker.file_finished(fp, index, ok=False, error=e)
+                    continue
+                # MODIFICATO: Passa selected_features a process_file
+                res = process_file(fp, voicing_thr, min_pause, long_pause_thr, DT,
+                                 smooth_win_ms, hysteresis, selected_features, stats=stats,
+                                 lld_frame=lld_frame)
+                if res is not None:
+                    sink.add(res, key=resume_key(fp, path))
+                    print(f"[OK] {wav_source or fp}")
+                    if catalog is not None:
+                        wav = wav_source or os.path.join(os.path.dirname(fp),
+                                                         os.path.basename(fp).replace('_LLD.csv', '.wav'))
+                        if os.path.exists(wav):
+                            record_extraction(catalog, wav, 'custom', res, run_params,
+                                              lld_csv=None if wav_source else fp,
+                                              lld_params={'config': run_params['lld_config']})
+                else:
+                    print(f"[SKIP] {fp}", file=sys.stderr)
+                tracker.file_finished(fp, index, ok=res is not None, frames=stats.get('frames'))
+            tracker.finish()
+    finally:
+        if close_catalog:
+            catalog.close()
+
+    print(f"\n✅ Fatto. Salvato: {output_path} ({sink.rows} file)")
+    return created_files
 
 
 def main():
@@ -513,6 +643,13 @@ def main():
                     help="Smoothing della probabilità di voicing (ms).")
     ap.add_argument("--hysteresis", action="store_true",
                     help="Abilita isteresi.")
+    ap.add_argument("--progress-log", default=None,
+                    help="File JSON-lines dove registrare gli eventi di progresso.")
+    ap.add_argument("--no-resume", action="store_true",
+                    help="Riscrivi l'output anche se un'esecuzione precedente è stata interrotta.")
+    ap.add_argument("--lld-backend", choices=LLD_BACKENDS, default=None,
+                    help="Sorgente degli LLD: opensmile (SMILExtract) o numpy (motore interno). "
+                         "Default: 'lld_backend' di gui_config.json, altrimenti opensmile.")
     
     args = ap.parse_args()
     
@@ -536,7 +673,13 @@ def main():
         float(args.long_pause_thr),
         args.smooth_win_ms, 
         args.hysteresis, 
-        out
+        out,
+        resume=not args.no_resume,
+        lld_backend=args.lld_backend,
+        progress_callback=combine_callbacks(
+            ConsoleProgress(),
+            JsonlProgressLogger(args.progress_log) if args.progress_log else None
+        )
     )
 
 if __name__ == "__main__":
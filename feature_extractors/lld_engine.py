@@ -0,0 +1,264 @@
+"""
+Motore LLD nativo (NumPy) per le colonne usate dalle feature custom.
+
+Le feature custom leggono solo 7 LLD (REQUIRED_COLS di extract_features_custom):
+lanciare SMILExtract con ComParE_2016 (circa 65 LLD + delta scritti su CSV)
+per poi scartarne quasi tutti è lo step più lento della pipeline. Qui gli
+stessi descrittori vengono calcolati direttamente dal WAV, vettorizzati su
+blocchi di frame (hop 10 ms, come ComParE):
+
+  voicingFinalUnclipped_sma        picco dell'autocorrelazione normalizzata
+                                   (metodo di Boersma) su frame da 60 ms, finestra gaussiana
+  F0final_sma                      1 / lag del picco, 0 sotto F0_VOICING_CUTOFF
+  pcm_RMSenergy_sma                RMS del frame da 25 ms (non finestrato)
+  pcm_fftMag_spectralCentroid_sma  centroide dello spettro di potenza (Hamming 25 ms)
+  pcm_fftMag_spectralFlux_sma      norma L2 della differenza tra spettri normalizzati
+  pcm_fftMag_spectralEntropy_sma   entropia (bit) dello spettro di potenza normalizzato
+  mfcc_sma[5]                      MFCC HTK: 26 bande mel 20-8000 Hz, log, DCT, lifter 22
+
+Tutte le colonne sono smussate con media mobile su 3 frame (_sma; per F0
+solo sui frame voiced). I valori approssimano quelli di openSMILE ma non
+sono identici (l'F0 di ComParE usa SHS + Viterbi): validate_lld_engine.py
+ne misura l'accordo su un corpus.
+"""
+
+import wave
+
+import numpy as np
+
+
+# Versione del motore: entra nei parametri di estrazione (catalogo, ripresa)
+ENGINE_VERSION = 1
+
+FRAME_STEP = 0.010          # s, hop (come ComParE)
+FRAME_SIZE = 0.025          # s, frame per energia, spettro e MFCC
+PITCH_FRAME_SIZE = 0.060    # s, frame per pitch/voicing
+PITCH_GAUSS_SIGMA = 0.4     # sigma della finestra gaussiana (frazione di metà frame)
+MIN_PITCH = 55.0            # Hz
+MAX_PITCH = 620.0           # Hz
+F0_VOICING_CUTOFF = 0.70    # voicing minimo perché F0final sia != 0
+OCTAVE_COST = 0.01          # preferenza per i lag corti (evita errori di ottava)
+SILENCE_THR = 0.03          # picco del frame / picco globale sotto cui il frame è unvoiced
+MEL_BANDS = 26
+MEL_LOW_HZ = 20.0
+MEL_HIGH_HZ = 8000.0
+CEP_LIFTER = 22
+MFCC_INDEX = 5
+SMA_WIN = 3
+BLOCK_FRAMES = 1000         # frame per blocco: limita la memoria delle FFT sui file lunghi
+
+LLD_COLUMNS = [
+    "voicingFinalUnclipped_sma",
+    "F0final_sma",
+    "pcm_RMSenergy_sma",
+    "pcm_fftMag_spectralCentroid_sma",
+    "pcm_fftMag_spectralFlux_sma",
+    "pcm_fftMag_spectralEntropy_sma",
+    "mfcc_sma[5]",
+]
+
+
+# ===============================================
+# LETTURA WAV
+# ===============================================
+def read_wav(path):
+    """WAV PCM (8/16/24/32 bit) -> (segnale mono float in [-1, 1], sample rate)."""
+    try:
+        with wave.open(path, 'rb') as w:
+            n_channels, width, sr = w.getnchannels(), w.getsampwidth(), w.getframerate()
+            raw = w.readframes(w.getnframes())
+    except (wave.Error, EOFError) as e:
+        raise ValueError(f"WAV non supportato dal motore numpy ({path}): {e}. "
+                         f"Usa il backend LLD 'opensmile'.")
+
+    if width == 1:
+        x = (np.frombuffer(raw, dtype=np.uint8).astype(np.float64) - 128.0) / 128.0
+    elif width == 2:
+        x = np.frombuffer(raw, dtype='<i2').astype(np.float64) / 32768.0
+    elif width == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        x = np.where(ints >= 1 << 23, ints - (1 << 24), ints).astype(np.float64) / float(1 << 23)
+    elif width == 4:
+        x = np.frombuffer(raw, dtype='<i4').astype(np.float64) / float(1 << 31)
+    else:
+        raise ValueError(f"Campioni da {width} byte non supportati ({path})")
+
+    if n_channels > 1:
+        x = x[:len(x) - len(x) % n_channels].reshape(-1, n_channels).mean(axis=1)
+    return x, sr
+
+
+# ===============================================
+# SUPPORTO
+# ===============================================
+def _next_pow2(n):
+    return 1 << max(0, int(np.ceil(np.log2(max(n, 1)))))
+
+
+def _frame_view(x, size, step, n_frames, left_pad):
+    """Vista (n_frames, size): il frame k inizia al campione k*step - left_pad (zero padding ai bordi)."""
+    needed = (n_frames - 1) * step + size
+    padded = np.zeros(max(needed, left_pad + len(x)))
+    padded[left_pad:left_pad + len(x)] = x
+    return np.lib.stride_tricks.sliding_window_view(padded, size)[::step][:n_frames]
+
+
+def _mel_filterbank(nfft, sr):
+    """Filtri triangolari HTK (n_bin x MEL_BANDS) sulla scala mel 1127*ln(1 + f/700)."""
+    def mel(f):
+        return 1127.0 * np.log1p(np.asarray(f) / 700.0)
+
+    high = min(MEL_HIGH_HZ, sr / 2.0)
+    centers = np.linspace(mel(MEL_LOW_HZ), mel(high), MEL_BANDS + 2)
+    bin_mel = mel(np.fft.rfftfreq(nfft, 1.0 / sr))
+    lower, center, upper = centers[:-2, None], centers[1:-1, None], centers[2:, None]
+    rising = (bin_mel[None, :] - lower) / (center - lower)
+    falling = (upper - bin_mel[None, :]) / (upper - center)
+    return np.clip(np.minimum(rising, falling), 0.0, None).T
+
+
+def _mfcc_weights():
+    """Riga DCT-II (HTK, scala sqrt(2/N)) del coefficiente MFCC_INDEX, con liftering."""
+    j = np.arange(MEL_BANDS)
+    dct = np.sqrt(2.0 / MEL_BANDS) * np.cos(np.pi * MFCC_INDEX * (j + 0.5) / MEL_BANDS)
+    lifter = 1.0 + (CEP_LIFTER / 2.0) * np.sin(np.pi * MFCC_INDEX / CEP_LIFTER)
+    return dct * lifter
+
+
+def _sma(values, no_zero=False):
+    """Media mobile centrata su SMA_WIN frame; con no_zero i frame a 0 restano 0 e non entrano nella media."""
+    kernel = np.ones(SMA_WIN)
+    weights = (values != 0).astype(np.float64) if no_zero else np.ones_like(values)
+    sums = np.convolve(values * weights, kernel, mode='same')
+    counts = np.convolve(weights, kernel, mode='same')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        smoothed = np.where(counts > 0, sums / counts, 0.0)
+    if no_zero:
+        smoothed[values == 0] = 0.0
+    return smoothed
+
+
+# ===============================================
+# DESCRITTORI
+# ===============================================
+def _spectral_block(frames, window, nfft, freqs, mel_fb, mfcc_w, prev_norm):
+    """Energia, descrittori spettrali e MFCC[5] di un blocco; ritorna anche l'ultimo spettro normalizzato."""
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    mag = np.abs(np.fft.rfft(frames * window, nfft, axis=1))
+    power = mag ** 2
+    total = power.sum(axis=1)
+    safe_total = np.where(total > 0, total, 1.0)
+
+    centroid = (power @ freqs) / safe_total
+    pmf = power / safe_total[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entropy = -np.sum(np.where(pmf > 0, pmf * np.log2(pmf), 0.0), axis=1)
+
+    # Flux: differenza tra spettri di ampiezza normalizzati di frame consecutivi
+    mag_sum = mag.sum(axis=1, keepdims=True)
+    norm = mag / np.where(mag_sum > 0, mag_sum, 1.0)
+    previous = np.vstack([norm[:1] if prev_norm is None else prev_norm[None, :], norm[:-1]])
+    flux = np.sqrt(np.sum((norm - previous) ** 2, axis=1))
+
+    # MFCC HTK: ampiezze in scala 16 bit, log naturale delle energie mel
+    mel_energy = (power * 32768.0 ** 2) @ mel_fb
+    mfcc5 = np.log(np.maximum(mel_energy, 1e-8)) @ mfcc_w
+    return rms, centroid, flux, entropy, mfcc5, norm[-1]
+
+
+def _pitch_block(frames, window, window_acf, nfft, min_lag, max_lag, sr, peak_floor):
+    """Voicing (picco NACF) e F0 di un blocco di frame da 60 ms."""
+    centered = frames - frames.mean(axis=1, keepdims=True)
+    spectrum = np.fft.rfft(centered * window, nfft, axis=1)
+    acf = np.fft.irfft(np.abs(spectrum) ** 2, nfft, axis=1)[:, :max_lag + 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        nacf = (acf / acf[:, :1]) / window_acf[None, :max_lag + 2]
+    nacf = np.nan_to_num(nacf, nan=0.0, posinf=0.0, neginf=0.0)
+
+    # Massimi locali nel range di pitch, con costo di ottava a favore dei lag corti
+    lags = np.arange(min_lag, max_lag + 1)
+    prev, cand, nxt = nacf[:, lags - 1], nacf[:, lags], nacf[:, lags + 1]
+    is_peak = (cand >= prev) & (cand > nxt)
+    score = np.where(is_peak, cand - OCTAVE_COST * np.log2(lags * MIN_PITCH / sr), -np.inf)
+    best = np.argmax(score, axis=1)
+    rows = np.arange(len(frames))
+    has_peak = np.isfinite(score[rows, best])
+
+    voicing = np.where(has_peak, np.clip(cand[rows, best], 0.0, 1.0), 0.0)
+    voicing[np.abs(frames).max(axis=1) < peak_floor] = 0.0
+
+    # Interpolazione parabolica del lag
+    y0, y1, y2 = prev[rows, best], cand[rows, best], nxt[rows, best]
+    denom = y0 - 2.0 * y1 + y2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = np.where(denom != 0, 0.5 * (y0 - y2) / denom, 0.0)
+    lag = lags[best] + np.clip(delta, -0.5, 0.5)
+    f0 = np.where(voicing >= F0_VOICING_CUTOFF, sr / lag, 0.0)
+    return voicing, f0
+
+
+def compute_lld(signal, sr):
+    """
+    Calcola gli LLD_COLUMNS da un segnale mono.
+
+    Returns:
+        dict colonna -> array (un valore per frame), più 'frameTime' (s)
+    """
+    step = int(round(FRAME_STEP * sr))
+    size = int(round(FRAME_SIZE * sr))
+    pitch_size = int(round(PITCH_FRAME_SIZE * sr))
+    n_frames = 1 + (len(signal) - size) // step if len(signal) >= size else 0
+    result = {'frameTime': np.arange(n_frames) * FRAME_STEP}
+    if n_frames == 0:
+        result.update({col: np.zeros(0) for col in LLD_COLUMNS})
+        return result
+
+    # Frame da 25 ms e frame da 60 ms centrati sugli stessi istanti
+    frames = _frame_view(signal, size, step, n_frames, 0)
+    pitch_frames = _frame_view(signal, pitch_size, step, n_frames, (pitch_size - size) // 2)
+
+    nfft = _next_pow2(size)
+    window = np.hamming(size)
+    freqs = np.fft.rfftfreq(nfft, 1.0 / sr)
+    mel_fb = _mel_filterbank(nfft, sr)
+    mfcc_w = _mfcc_weights()
+
+    pitch_nfft = _next_pow2(2 * pitch_size)
+    n = np.arange(pitch_size)
+    half = (pitch_size - 1) / 2.0
+    pitch_window = np.exp(-0.5 * ((n - half) / (PITCH_GAUSS_SIGMA * half)) ** 2)
+    window_acf = np.fft.irfft(np.abs(np.fft.rfft(pitch_window, pitch_nfft)) ** 2, pitch_nfft)
+    window_acf = window_acf / window_acf[0]
+    min_lag = max(1, int(np.floor(sr / MAX_PITCH)))
+    max_lag = min(int(np.ceil(sr / MIN_PITCH)), pitch_size // 2)
+    peak_floor = SILENCE_THR * (np.abs(signal).max() if len(signal) else 0.0)
+
+    columns = {col: np.empty(n_frames) for col in LLD_COLUMNS}
+    prev_norm = None
+    for start in range(0, n_frames, BLOCK_FRAMES):
+        block = slice(start, min(start + BLOCK_FRAMES, n_frames))
+        rms, centroid, flux, entropy, mfcc5, prev_norm = _spectral_block(
+            frames[block], window, nfft, freqs, mel_fb, mfcc_w, prev_norm)
+        voicing, f0 = _pitch_block(pitch_frames[block], pitch_window, window_acf, pitch_nfft,
+                                   min_lag, max_lag, sr, peak_floor)
+        columns["voicingFinalUnclipped_sma"][block] = voicing
+        columns["F0final_sma"][block] = f0
+        columns["pcm_RMSenergy_sma"][block] = rms
+        columns["pcm_fftMag_spectralCentroid_sma"][block] = centroid
+        columns["pcm_fftMag_spectralFlux_sma"][block] = flux
+        columns["pcm_fftMag_spectralEntropy_sma"][block] = entropy
+        columns["mfcc_sma[5]"][block] = mfcc5
+    columns["pcm_fftMag_spectralFlux_sma"][0] = 0.0
+
+    for col in LLD_COLUMNS:
+        result[col] = _sma(columns[col], no_zero=(col == "F0final_sma"))
+    return result
+
+
+def compute_lld_frame(wav_path):
+    """LLD di un WAV come DataFrame (frameTime + LLD_COLUMNS), nel formato letto da process_file."""
+    import pandas as pd
+
+    signal, sr = read_wav(wav_path)
+    return pd.DataFrame(compute_lld(signal, sr))
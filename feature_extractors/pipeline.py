@@ -0,0 +1,227 @@
+"""
+Runner incrementale della pipeline WAV -> LLD -> feature (-> dataset index).
+
+Ogni esecuzione confronta il corpus con il catalogo SQLite (catalog.py):
+  - una registrazione è "cambiata" se size/mtime differiscono e l'hash del
+    contenuto non coincide più (register_recording invalida LLD e feature)
+  - un set di feature è da ricalcolare se manca o se è stato estratto con
+    parametri diversi: fingerprint del config openSMILE, feature selezionate,
+    soglie di voicing/pause (egemaps_params / custom_params)
+Solo i task (file, set) non aggiornati vengono eseguiti con
+extract_combined_features; i CSV di output sono poi rigenerati dal catalogo
+con tutte le registrazioni presenti su disco (le righe invariate non vengono
+ricalcolate, quelle dei file rimossi spariscono).
+"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    from feature_extractors.combined_extraction import extract_combined_features, _list_wavs
+    from feature_extractors.csv_extract_eGeMAPS_FUNCTION import egemaps_features_v2
+    from feature_extractors.extract_features_custom import (
+        ALL_CUSTOM_FEATURES, VOICING_THR_DEFAULT, MIN_PAUSE_DEFAULT, LONG_PAUSE_DEFAULT, LLD_BACKENDS,
+        resolve_lld_backend
+    )
+    from feature_extractors.lld_engine import ENGINE_VERSION
+    from feature_extractors.progress import ConsoleProgress, JsonlProgressLogger, combine_callbacks
+    from feature_extractors.config_service import get_config_service, EGEMAPS_CONFIG_KEY, LLD_CONFIG_KEY
+    from feature_extractors.catalog import open_catalog, egemaps_params, custom_params
+except Exception:
+    from .combined_extraction import extract_combined_features, _list_wavs
+    from .csv_extract_eGeMAPS_FUNCTION import egemaps_features_v2
+    from .extract_features_custom import (
+        ALL_CUSTOM_FEATURES, VOICING_THR_DEFAULT, MIN_PAUSE_DEFAULT, LONG_PAUSE_DEFAULT, LLD_BACKENDS,
+        resolve_lld_backend
+    )
+    from .lld_engine import ENGINE_VERSION
+    from .progress import ConsoleProgress, JsonlProgressLogger, combine_callbacks
+    from .config_service import get_config_service, EGEMAPS_CONFIG_KEY, LLD_CONFIG_KEY
+    from .catalog import open_catalog, egemaps_params, custom_params
+
+
+def _write_table(table, output_path):
+    """Scrive il CSV (sep ';') su un file temporaneo e lo sostituisce in modo atomico."""
+    tmp_path = output_path + ".tmp"
+    table.to_csv(tmp_path, index=False, sep=';')
+    os.replace(tmp_path, output_path)
+
+
+def _modified(record, wav):
+    st = os.stat(wav)
+    return record is not None and (record['size'], record['mtime_ns']) != (st.st_size, st.st_mtime_ns)
+
+
+def _update_index(root, index_path, catalog, workers):
+    """Aggiorna il dataset index (build_index, incrementale) e ne importa le etichette nel catalogo."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'train'))
+    from build_index import main as build_index, read_index
+
+    index_db = build_index(root, index_path, workers=workers)
+    return catalog.import_labels(read_index(index_db))
+
+
+def run_incremental(root, catalog, egemaps_output_path=None, custom_output_path=None, index_path=None,
+                    egemaps_features=None, custom_features=None,
+                    voicing_thr=VOICING_THR_DEFAULT, min_pause=MIN_PAUSE_DEFAULT,
+                    long_pause_thr=LONG_PAUSE_DEFAULT, smooth_win_ms=50, hysteresis=True,
+                    max_workers=None, progress_callback=None, cancel_token=None, config=None,
+                    dry_run=False, lld_backend=None):
+    """
+    Porta feature (ed eventualmente dataset index) di `root` allo stato corrente
+    dei WAV e dei parametri, ricalcolando solo ciò che è cambiato.
+
+    Args:
+        root (str): cartella dei WAV
+        catalog (Catalog|str): catalogo SQLite (o suo path) con lo stato delle estrazioni
+        egemaps_output_path / custom_output_path (str): CSV rigenerati dal catalogo (None: non scritti)
+        index_path (str): dataset index da aggiornare (vedi build_index.main); le
+            etichette vengono importate nel catalogo
+        egemaps_features, custom_features, soglie: come extract_combined_features
+        dry_run (bool): calcola solo cosa andrebbe ricalcolato, senza estrarre né scrivere
+        lld_backend (str): 'opensmile' o 'numpy'; cambiarlo rende da ricalcolare il set custom
+
+    Returns:
+        dict con 'wavs', 'removed', 'egemaps_stale', 'custom_stale', 'tasks'
+        ed eventualmente 'extraction' (risultato di extract_combined_features) e 'labelled'
+    """
+    if egemaps_features is None:
+        egemaps_features = egemaps_features_v2
+    if custom_features is None:
+        custom_features = ALL_CUSTOM_FEATURES
+    config = config or get_config_service()
+    lld_backend = resolve_lld_backend(lld_backend, config)
+    root = os.path.abspath(root)
+    start = time.perf_counter()
+
+    catalog, close_catalog = open_catalog(catalog)
+    try:
+        wavs = sorted(os.path.abspath(w) for w in _list_wavs(root))
+
+        # WAV rimossi dal disco: registrazioni, feature ed etichette escono dal catalogo
+        on_disk = set(wavs)
+        removed = [p for p in catalog.recording_paths(root) if p not in on_disk]
+        if removed and not dry_run:
+            catalog.forget_recordings(removed)
+
+        # LLD registrati prima dell'aggiornamento (per riconoscere quelli non più validi)
+        known_lld = {wav: catalog.artifact(wav, 'lld') for wav in wavs}
+        if not dry_run:
+            for wav in wavs:
+                catalog.register_recording(wav)
+
+        # Stessi parametri che extract_combined_features registra nel catalogo
+        settings = config.load()
+        egemaps_catalog_params = egemaps_params(settings.get(EGEMAPS_CONFIG_KEY), egemaps_features)
+        custom_catalog_params = custom_params(
+            settings.get(LLD_CONFIG_KEY), custom_features, voicing_thr=voicing_thr, min_pause=min_pause,
+            long_pause_thr=long_pause_thr, smooth_win_ms=smooth_win_ms, hysteresis=hysteresis,
+            lld_backend=lld_backend, engine_version=ENGINE_VERSION)
+        lld_params = {'config': custom_catalog_params['lld_config']}
+
+        egemaps_stale = catalog.stale_recordings(wavs, 'egemaps', egemaps_catalog_params)
+        custom_stale = catalog.stale_recordings(wavs, 'custom', custom_catalog_params)
+        if dry_run:
+            # Senza registrazione (e hash) i file con size/mtime diversi sono contati come da ricalcolare
+            modified = {wav for wav in wavs if _modified(catalog.recording(wav), wav)}
+            egemaps_stale = sorted(set(egemaps_stale) | modified)
+            custom_stale = sorted(set(custom_stale) | modified)
+        wav_tasks = {}
+        for wav in egemaps_stale:
+            wav_tasks.setdefault(wav, []).append('egemaps')
+        for wav in custom_stale:
+            wav_tasks.setdefault(wav, []).append('custom')
+
+        summary = {
+            'wavs': len(wavs),
+            'removed': len(removed),
+            'egemaps_stale': len(egemaps_stale),
+            'custom_stale': len(custom_stale),
+            'tasks': sum(len(tasks) for tasks in wav_tasks.values()),
+        }
+        print(f"📂 {root}: {len(wavs)} WAV, {len(removed)} rimossi | da ricalcolare: "
+              f"eGeMAPS {len(egemaps_stale)}, custom {len(custom_stale)}")
+        if dry_run:
+            return summary
+
+        # LLD generati con un altro config (o da un audio cambiato): rigenerati dal task custom
+        for wav in (custom_stale if lld_backend == 'opensmile' else ()):
+            lld_csv = known_lld.get(wav)
+            if lld_csv and catalog.artifact(wav, 'lld', lld_params) is None and os.path.exists(lld_csv):
+                os.remove(lld_csv)
+
+        if wav_tasks:
+            summary['extraction'] = extract_combined_features(
+                root, None, None,
+                egemaps_features=egemaps_features, custom_features=custom_features,
+                voicing_thr=voicing_thr, min_pause=min_pause, long_pause_thr=long_pause_thr,
+                smooth_win_ms=smooth_win_ms, hysteresis=hysteresis,
+                max_workers=max_workers, progress_callback=progress_callback, cancel_token=cancel_token,
+                config=config, catalog=catalog, wav_tasks=wav_tasks, lld_backend=lld_backend)
+        else:
+            print("✅ Feature già aggiornate, nessuna estrazione necessaria")
+
+        # CSV rigenerati dal catalogo: righe invariate + righe ricalcolate, nell'ordine dei path
+        for feature_set, output_path in (('egemaps', egemaps_output_path), ('custom', custom_output_path)):
+            if not output_path:
+                continue
+            table = catalog.feature_table(feature_set, paths=wavs)
+            if table.empty:
+                print(f"⚠ Nessuna feature {feature_set} nel catalogo per {root}")
+                continue
+            _write_table(table, output_path)
+            print(f"✅ Salvato: {output_path} ({len(table)} file)")
+
+        if index_path:
+            summary['labelled'] = _update_index(root, index_path, catalog, max_workers)
+            print(f"🏷 Etichette importate per {summary['labelled']} registrazioni")
+    finally:
+        if close_catalog:
+            catalog.close()
+
+    print(f"⏱ Pipeline incrementale: {time.perf_counter() - start:.1f}s")
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Pipeline incrementale: ricalcola solo le registrazioni cambiate")
+    ap.add_argument("root", help="Cartella dei WAV da processare")
+    ap.add_argument("--catalog", default=None,
+                    help="Catalogo SQLite dello stato delle estrazioni (default: pipeline_catalog.sqlite in root)")
+    ap.add_argument("--egemaps-out", help="CSV eGeMAPS (default: extracted_features_eGeMAPS.csv nella cartella input)")
+    ap.add_argument("--custom-out", help="CSV custom (default: extracted_features_custom.csv nella cartella input)")
+    ap.add_argument("--index", default=None, help="Dataset index da aggiornare (.sqlite, .xlsx o cartella)")
+    ap.add_argument("--all", action="store_true", help="Estrai tutte le 88 feature eGeMAPS invece delle 48 standard")
+    ap.add_argument("--voicing-thr", type=float, default=VOICING_THR_DEFAULT, help="Soglia voicingFinalUnclipped")
+    ap.add_argument("--min-pause", type=float, default=MIN_PAUSE_DEFAULT, help="Durata minima pausa (s)")
+    ap.add_argument("--long-pause", type=float, default=LONG_PAUSE_DEFAULT, help="Soglia pausa lunga (s)")
+    ap.add_argument("--workers", type=int, default=None, help="SMILExtract concorrenti (default: core logici)")
+    ap.add_argument("--progress-log", default=None, help="File JSON-lines dove registrare gli eventi di progresso")
+    ap.add_argument("--dry-run", action="store_true", help="Mostra solo cosa andrebbe ricalcolato")
+    ap.add_argument("--lld-backend", choices=LLD_BACKENDS, default=None,
+                    help="Sorgente degli LLD per le feature custom (default: gui_config.json, altrimenti opensmile)")
+    args = ap.parse_args()
+
+    run_incremental(
+        args.root,
+        args.catalog or os.path.join(args.root, "pipeline_catalog.sqlite"),
+        egemaps_output_path=args.egemaps_out or os.path.join(args.root, "extracted_features_eGeMAPS.csv"),
+        custom_output_path=args.custom_out or os.path.join(args.root, "extracted_features_custom.csv"),
+        index_path=args.index,
+        egemaps_features="all" if args.all else None,
+        voicing_thr=args.voicing_thr,
+        min_pause=args.min_pause,
+        long_pause_thr=args.long_pause,
+        max_workers=args.workers,
+        dry_run=args.dry_run,
+        lld_backend=args.lld_backend,
+        progress_callback=combine_callbacks(
+            ConsoleProgress(),
+            JsonlProgressLogger(args.progress_log) if args.progress_log else None
+        )
+    )
@@ -0,0 +1,171 @@
+"""
+Eventi di progresso strutturati per la pipeline di estrazione.
+
+Le funzioni di estrazione accettano un `progress_callback` opzionale che
+riceve dizionari (eventi) di questo tipo:
+
+    batch_started   stage, total
+    file_started    stage, file, index, total
+    file_finished   stage, file, index, total, ok, file_elapsed, frames, error
+    batch_finished  stage, total, ok_count, error_count, elapsed, cancelled
+
+Ogni evento contiene anche 'time', 'done', 'elapsed', 'files_per_sec' ed
+'eta_seconds', così i consumer (barra GUI, riga CLI, log JSON-lines) non
+devono ricalcolarli.
+"""
+
+import json
+import os
+import threading
+import time
+
+
+# ===============================================
+# EMITTER
+# ===============================================
+class ProgressTracker:
+    """Conta file e tempi di uno stage ed emette gli eventi al callback."""
+
+    def __init__(self, stage, total, callback=None):
+        self.stage = stage
+        self.total = total
+        self.callback = callback
+        self.done = 0
+        self.ok_count = 0
+        self.error_count = 0
+        self.start_time = None
+        self._file_start = {}
+
+    @property
+    def elapsed(self):
+        return 0.0 if self.start_time is None else time.perf_counter() - self.start_time
+
+    @property
+    def files_per_sec(self):
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self):
+        rate = self.files_per_sec
+        if rate <= 0:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    def _emit(self, event, **fields):
+        if self.callback is None:
+            return
+        payload = {
+            'event': event,
+            'stage': self.stage,
+            'time': time.time(),
+            'total': self.total,
+            'done': self.done,
+            'elapsed': self.elapsed,
+            'files_per_sec': self.files_per_sec,
+            'eta_seconds': self.eta_seconds,
+        }
+        payload.update(fields)
+        try:
+            self.callback(payload)
+        except Exception as e:
+            # Un consumer rotto non deve interrompere l'estrazione
+            print(f"Warning: progress callback failed: {e}")
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self._emit('batch_started')
+
+    def file_started(self, file, index):
+        self._file_start[file] = time.perf_counter()
+        self._emit('file_started', file=file, index=index)
+
+    def file_finished(self, file, index, ok=True, frames=None, error=None, **fields):
+        started = self._file_start.pop(file, None)
+        file_elapsed = time.perf_counter() - started if started is not None else None
+        self.done += 1
+        if ok:
+            self.ok_count += 1
+        else:
+            self.error_count += 1
+        self._emit('file_finished', file=file, index=index, ok=ok,
+                   file_elapsed=file_elapsed, frames=frames,
+                   error=None if error is None else str(error), **fields)
+
+    def finish(self, cancelled=False):
+        self._emit('batch_finished', ok_count=self.ok_count, error_count=self.error_count,
+                   cancelled=cancelled)
+
+
+# ===============================================
+# CONSUMER
+# ===============================================
+def format_eta(seconds):
+    """Secondi -> 'hh:mm:ss' (oppure '--:--' se non stimabile)."""
+    if seconds is None:
+        return "--:--"
+    seconds = int(round(seconds))
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h:d}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+
+def format_progress(event):
+    """Riga compatta: '[stage] 120/500 (24.0%) | 3.2 file/s | ETA 01:58'."""
+    total = event.get('total') or 0
+    done = event.get('done', 0)
+    percent = done * 100.0 / total if total else 100.0
+    return (f"[{event['stage']}] {done}/{total} ({percent:.1f}%) | "
+            f"{event.get('files_per_sec', 0.0):.2f} file/s | ETA {format_eta(event.get('eta_seconds'))}")
+
+
+class ConsoleProgress:
+    """Callback CLI: una riga compatta al massimo ogni `interval` secondi, più il riepilogo finale."""
+
+    def __init__(self, interval=1.0, stream=None):
+        self.interval = interval
+        self.stream = stream
+        self._last = 0.0
+
+    def __call__(self, event):
+        kind = event['event']
+        if kind == 'file_finished':
+            now = time.perf_counter()
+            if now - self._last >= self.interval or event['done'] == event['total']:
+                self._last = now
+                print(format_progress(event), file=self.stream, flush=True)
+        elif kind == 'batch_finished':
+            status = "interrotto" if event.get('cancelled') else "completato"
+            print(f"[{event['stage']}] {status}: {event['ok_count']} ok, {event['error_count']} errori "
+                  f"in {format_eta(event['elapsed'])} ({event['files_per_sec']:.2f} file/s)",
+                  file=self.stream, flush=True)
+
+
+class JsonlProgressLogger:
+    """Callback che appende ogni evento come riga JSON (capacity planning)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+
+    def __call__(self, event):
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+
+def combine_callbacks(*callbacks):
+    """Un solo callback che inoltra l'evento a tutti quelli non None."""
+    callbacks = [cb for cb in callbacks if cb is not None]
+    if not callbacks:
+        return None
+    if len(callbacks) == 1:
+        return callbacks[0]
+
+    def fan_out(event):
+        for cb in callbacks:
+            cb(event)
+    return fan_out
@@ -0,0 +1,181 @@
+"""
+Scrittura incrementale (append-only) dei CSV di output degli estrattori.
+
+Le righe vengono accodate al CSV a blocchi man mano che i file terminano,
+invece di restare in memoria fino alla fine del batch. Ogni blocco è un
+commit: dati scritti e sincronizzati su disco, poi aggiornato in modo
+atomico (tmp + os.replace) il marker `<output>.progress` con il numero di
+righe e l'offset in byte confermati. Se il processo si interrompe:
+  - i blocchi confermati restano nel CSV
+  - un blocco scritto a metà (oltre l'offset del marker) viene troncato alla ripresa
+  - la ripresa salta i file già presenti nell'output
+Ogni riga ha una chiave di ripresa (resume_key: path relativo alla radice
+dell'estrazione, univoco anche tra sottocartelle con file omonimi), accodata
+con lo stesso schema a `<output>.progress.keys`.
+A batch completato marker e chiavi vengono rimossi: un CSV senza marker è completo.
+"""
+
+import csv
+import json
+import os
+
+
+# Righe per commit: compromesso tra fsync frequenti e righe perse in caso di crash
+DEFAULT_BATCH_ROWS = 25
+PROGRESS_SUFFIX = ".progress"
+KEYS_SUFFIX = ".keys"
+
+
+def resume_key(file_path, root):
+    """Chiave di ripresa: path di file_path relativo a root (cartella, o file singolo)."""
+    base = root if os.path.isdir(root) else os.path.dirname(os.path.abspath(root))
+    return os.path.relpath(os.path.abspath(file_path), os.path.abspath(base)).replace(os.sep, '/')
+
+
+def _params_json(params):
+    return json.dumps(params or {}, sort_keys=True, default=str)
+
+
+def _cell(value):
+    # Come pandas.to_csv: None/NaN -> cella vuota
+    if value is None or (isinstance(value, float) and value != value):
+        return ''
+    return value
+
+
+class ResultSink:
+    """
+    CSV di output scritto a blocchi con marker di avanzamento su disco.
+
+    Args:
+        output_path (str): CSV di output (separatore `sep`)
+        params (dict): parametri dell'estrazione; la ripresa avviene solo se
+            coincidono con quelli del marker (altrimenti il CSV viene riscritto)
+        batch_size (int): righe per commit
+        resume (bool): riprendi da un marker esistente saltando i file già scritti
+            (chiavi in `done`, vedi add())
+    """
+
+    def __init__(self, output_path, params=None, batch_size=DEFAULT_BATCH_ROWS, resume=True, sep=';'):
+        self.output_path = output_path
+        self.progress_path = output_path + PROGRESS_SUFFIX
+        self.keys_path = self.progress_path + KEYS_SUFFIX
+        self.params = _params_json(params)
+        self.batch_size = max(1, batch_size)
+        self.sep = sep
+        self.columns = None
+        self.rows = 0           # righe confermate nel CSV
+        self.done = set()       # chiavi di ripresa delle righe già confermate
+        self.resumed = False
+        self._offset = 0
+        self._keys_offset = 0
+        self._pending = []
+        if resume:
+            self._load_progress()
+
+    # ---------------------------------------------
+    # Ripresa
+    # ---------------------------------------------
+    def _load_progress(self):
+        try:
+            with open(self.progress_path, 'r', encoding='utf-8') as f:
+                progress = json.load(f)
+        except (OSError, ValueError):
+            return
+        if progress.get('params') != self.params:
+            print(f"⚠ Parametri cambiati rispetto all'esecuzione interrotta: {self.output_path} verrà riscritto")
+            return
+        offset = progress.get('offset', 0)
+        keys_offset = progress.get('keys_offset')
+        if not os.path.exists(self.output_path) or os.path.getsize(self.output_path) < offset:
+            return
+        if keys_offset is None or not os.path.exists(self.keys_path) \
+                or os.path.getsize(self.keys_path) < keys_offset:
+            # Senza chiavi confermate non si sa quali file sono già estratti
+            print(f"⚠ Chiavi di ripresa mancanti: {self.output_path} verrà riscritto")
+            return
+
+        # Scarta un eventuale blocco scritto solo in parte dopo l'ultimo commit
+        with open(self.output_path, 'r+b') as f:
+            f.truncate(offset)
+        with open(self.keys_path, 'r+b') as f:
+            f.truncate(keys_offset)
+        with open(self.output_path, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f, delimiter=self.sep)
+            self.columns = next(reader, None)
+            self.rows = sum(1 for record in reader if record)
+        with open(self.keys_path, 'r', encoding='utf-8') as f:
+            self.done = set(f.read().splitlines())
+        self._offset = offset
+        self._keys_offset = keys_offset
+        self.resumed = True
+        print(f"↻ Ripresa di {self.output_path}: {self.rows} file già estratti")
+
+    def _save_progress(self):
+        tmp_path = self.progress_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'params': self.params, 'columns': self.columns, 'rows': self.rows,
+                       'offset': self._offset, 'keys_offset': self._keys_offset}, f)
+        os.replace(tmp_path, self.progress_path)
+
+    # ---------------------------------------------
+    # Scrittura
+    # ---------------------------------------------
+    def add(self, row, columns=None, key=None):
+        """
+        Accoda una riga: dict colonna -> valore, oppure lista con le sue `columns`.
+        key: chiave di ripresa (resume_key); default il valore della prima colonna.
+        """
+        if isinstance(row, dict):
+            columns = list(row)
+            values = list(row.values())
+        else:
+            values = list(row)
+        if self.columns is None:
+            self.columns = list(columns)
+        elif columns is not None and list(columns) != self.columns:
+            raise ValueError(f"Colonne diverse da quelle di {self.output_path}")
+        self._pending.append((values, str(values[0]) if key is None else key))
+        if len(self._pending) >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        """Scrive le righe in attesa, le sincronizza su disco e aggiorna il marker."""
+        if not self._pending:
+            return
+        new_file = self._offset == 0
+        with open(self.output_path, 'w' if new_file else 'r+', encoding='utf-8', newline='') as f:
+            f.seek(self._offset)
+            writer = csv.writer(f, delimiter=self.sep, lineterminator='\n')
+            if new_file:
+                writer.writerow(self.columns)
+            writer.writerows([_cell(v) for v in values] for values, _ in self._pending)
+            f.flush()
+            os.fsync(f.fileno())
+            self._offset = f.tell()
+        keys = [key for _, key in self._pending]
+        with open(self.keys_path, 'w' if self._keys_offset == 0 else 'r+', encoding='utf-8', newline='') as f:
+            f.seek(self._keys_offset)
+            f.write(''.join(key + '\n' for key in keys))
+            f.flush()
+            os.fsync(f.fileno())
+            self._keys_offset = f.tell()
+        self.rows += len(self._pending)
+        self.done.update(keys)
+        self._pending = []
+        self._save_progress()
+
+    def close(self, complete=True):
+        """Conferma le righe rimaste; a batch completo rimuove il marker."""
+        self.commit()
+        if complete:
+            for marker in (self.progress_path, self.keys_path):
+                if os.path.exists(marker):
+                    os.remove(marker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Le righe già calcolate sono valide anche se il batch si interrompe: il marker resta per la ripresa
+        self.close(complete=exc_type is None)
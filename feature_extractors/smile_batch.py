@@ -0,0 +1,152 @@
+"""
+Più WAV brevi in un solo SMILExtract.
+
+Per clip di pochi secondi l'avvio di SMILExtract (processo, parsing del
+config, creazione dei componenti) pesa quanto l'analisi stessa. I WAV PCM
+con lo stesso formato vengono concatenati in un WAV temporaneo, separati da
+GAP_SECONDS di silenzio, ed elaborati con un solo processo:
+  - LLD: il CSV del batch viene diviso per frameTime nei <nome>_LLD.csv dei
+    singoli file (split_lld, frameTime riportato all'inizio del file)
+  - eGeMAPS: il config a segmenti (smile_config.segment_functionals_config)
+    calcola i functionals su ogni segmento e scrive una riga ARFF per file
+Ogni file inizia su un multiplo del passo dei frame (ALIGN_SECONDS), quindi
+i frame coincidono con quelli dell'estrazione singola; il silenzio tra i
+file evita che smoothing e delta mescolino file vicini. Possono cambiare
+solo i frame a cavallo della fine di un file. I WAV non leggibili con il
+modulo wave o più lunghi di MAX_CLIP_SECONDS restano a un SMILExtract per file.
+"""
+
+import bisect
+import csv
+import math
+import os
+import sys
+import wave
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    from feature_extractors.config_service import get_config_service, SMILE_BATCH_KEY
+except Exception:
+    from .config_service import get_config_service, SMILE_BATCH_KEY
+
+
+GAP_SECONDS = 0.5           # silenzio tra due file del batch
+ALIGN_SECONDS = 0.01        # passo dei frame (10 ms): inizio di ogni file allineato
+MAX_CLIP_SECONDS = 60.0     # oltre, l'avvio di SMILExtract è trascurabile
+MAX_BATCH_SECONDS = 1800.0  # durata massima del WAV concatenato
+
+
+def resolve_batch_files(batch_files=None, config=None):
+    """WAV per SMILExtract: esplicito, altrimenti 'smile_batch_files' di gui_config.json (default 0 = disattivato)."""
+    if batch_files is None:
+        try:
+            batch_files = int((config or get_config_service()).get(SMILE_BATCH_KEY, 0))
+        except (TypeError, ValueError):
+            batch_files = 0
+    return max(0, int(batch_files))
+
+
+def wav_info(path):
+    """((canali, byte per campione, sample rate), durata in s) di un WAV PCM, None se non concatenabile."""
+    try:
+        with wave.open(path, 'rb') as w:
+            if w.getcomptype() != 'NONE' or not w.getframerate():
+                return None
+            return (w.getnchannels(), w.getsampwidth(), w.getframerate()), w.getnframes() / w.getframerate()
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def plan_batches(wav_paths, batch_files, max_clip=MAX_CLIP_SECONDS, max_batch=MAX_BATCH_SECONDS):
+    """
+    Raggruppa wav_paths in batch di al più batch_files WAV con lo stesso formato.
+    Ritorna una lista di gruppi (liste di WAV) nell'ordine del loro primo file;
+    i WAV non concatenabili formano gruppi di un solo file.
+    """
+    if batch_files < 2:
+        return [[wav] for wav in wav_paths]
+    groups = []
+    open_groups = {}  # formato -> (gruppo, durata accumulata)
+    for wav in wav_paths:
+        info = wav_info(wav)
+        if info is None or info[1] > max_clip:
+            groups.append([wav])
+            continue
+        fmt, duration = info
+        group, seconds = open_groups.get(fmt, (None, 0.0))
+        if group is None or len(group) >= batch_files or seconds + duration > max_batch:
+            group, seconds = [], 0.0
+            groups.append(group)
+        group.append(wav)
+        open_groups[fmt] = (group, seconds + duration + GAP_SECONDS)
+    return groups
+
+
+def write_batch_wav(wav_paths, out_path, gap=GAP_SECONDS, align=ALIGN_SECONDS):
+    """
+    Concatena i WAV (stesso formato) in out_path con almeno `gap` secondi di
+    silenzio tra uno e l'altro e dopo l'ultimo. Ritorna i segmenti [(inizio, fine)] in secondi.
+    """
+    segments = []
+    with wave.open(out_path, 'wb') as out:
+        position = 0
+        for wav in wav_paths:
+            with wave.open(wav, 'rb') as w:
+                if not segments:
+                    rate, width, channels = w.getframerate(), w.getsampwidth(), w.getnchannels()
+                    out.setnchannels(channels)
+                    out.setsampwidth(width)
+                    out.setframerate(rate)
+                    step = max(1, int(round(align * rate)))
+                    # Silenzio: 0 per PCM con segno, 128 per PCM 8 bit (senza segno)
+                    zero = (b'\x80' if width == 1 else b'\x00' * width) * channels
+                elif (w.getframerate(), w.getsampwidth(), w.getnchannels()) != (rate, width, channels):
+                    raise ValueError(f"Formato diverso dagli altri WAV del batch: {wav}")
+                else:
+                    start = int(math.ceil((position + gap * rate) / step)) * step
+                    out.writeframes(zero * (start - position))
+                    position = start
+                frames = w.readframes(w.getnframes())
+            out.writeframes(frames)
+            n_frames = len(frames) // (width * channels)
+            segments.append((position / rate, (position + n_frames) / rate))
+            position += n_frames
+        # Silenzio anche dopo l'ultimo file: openSMILE scarta un segmento di
+        # frameList che arriva alla fine dell'input (ultimo frame incompleto)
+        if segments:
+            out.writeframes(zero * int(math.ceil(gap * rate)))
+    return segments
+
+
+def split_lld(batch_lld, segments, lld_paths, created_files=None):
+    """
+    Divide il CSV LLD del batch (sep ';') nei CSV dei singoli file: ogni file
+    riceve i frame con frameTime nel suo segmento, con frameTime riportato
+    all'inizio del file. Scrittura atomica (tmp + os.replace) di ogni CSV.
+    """
+    with open(batch_lld, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, delimiter=';')
+        header = next(reader)
+        time_col = [c.strip().strip("'") for c in header].index('frameTime')
+        per_file = [[] for _ in segments]
+        starts = [start for start, _ in segments]
+        for row in reader:
+            if not row:
+                continue
+            t = float(row[time_col])
+            i = bisect.bisect_right(starts, t + 1e-6) - 1
+            if i >= 0 and t < segments[i][1] - 1e-6:
+                row[time_col] = f"{max(t - starts[i], 0.0):.6f}"
+                per_file[i].append(row)
+
+    for lld_csv, rows in zip(lld_paths, per_file):
+        tmp_path = lld_csv + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, delimiter=';', lineterminator='\n')
+            writer.writerow(header)
+            writer.writerows(rows)
+        os.replace(tmp_path, lld_csv)
+        if created_files is not None:
+            created_files.append(lld_csv)
+    return lld_paths
@@ -0,0 +1,726 @@
+"""
+Config openSMILE minimale per gli LLD delle feature custom.
+
+ComParE_2016 calcola circa 65 LLD (più i delta) e li scrive tutti nel CSV
+passato con -lldcsvoutput, ma process_file ne legge solo 7. Qui il config
+configurato in gui_config.json viene letto (include compresi), ricostruito
+come grafo di componenti collegati dai dmLevel e ridotto a:
+  - le catene che producono le colonne richieste (pitch/voicing, energia,
+    centroid/flux/entropy spettrali, MFCC) con tutti i loro antenati
+  - i componenti "di passaggio" (concat, smoothing, selettori) fino al sink
+    CSV degli LLD, con i reader.dmLevel potati ai soli livelli mantenuti
+I parametri dei componenti sono copiati dal config originale, quindi i
+valori delle colonne restano quelli di ComParE. Il config ridotto viene
+salvato in una cache (smile_configs/ accanto a gui_config.json) e provato una
+volta con SMILExtract su un WAV sintetico: se non produce tutte le colonne si
+torna al config completo.
+
+merge_configs unisce il config eGeMAPS e quello LLD in un config combinato:
+un solo SMILExtract legge il WAV e scrive sia l'ARFF dei functionals (-O)
+sia il CSV degli LLD (-customlldcsvoutput), con la stessa cache e la stessa
+prova dei config minimali (vedi combined_extraction.py).
+
+segment_functionals_config mette i cFunctionals del config eGeMAPS in
+frameMode=list (-segmentlist): una riga ARFF per ogni WAV di un batch
+concatenato (vedi smile_batch.py).
+
+Uso:
+    python feature_extractors/smile_config.py [--out file.conf] [--benchmark file.wav]
+"""
+
+import hashlib
+import math
+import os
+import re
+import struct
+import sys
+import tempfile
+import time
+import wave
+from collections import OrderedDict
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    from feature_extractors.config_service import get_config_service, EGEMAPS_CONFIG_KEY, LLD_CONFIG_KEY, LLD_CONFIG_MODE_KEY
+    from feature_extractors.cancellation import run_cancellable
+except Exception:
+    from .config_service import get_config_service, EGEMAPS_CONFIG_KEY, LLD_CONFIG_KEY, LLD_CONFIG_MODE_KEY
+    from .cancellation import run_cancellable
+
+
+# Versione del generatore: entra nel nome dei config in cache
+GENERATOR_VERSION = 1
+
+# Colonna LLD -> (gruppo, tipi di componente che la producono)
+COLUMN_SOURCES = OrderedDict([
+    ("voicingFinalUnclipped_sma", ('pitch', ('cPitchSmootherViterbi', 'cPitchSmoother'))),
+    ("F0final_sma", ('pitch', ('cPitchSmootherViterbi', 'cPitchSmoother'))),
+    ("pcm_RMSenergy_sma", ('energy', ('cEnergy',))),
+    ("pcm_fftMag_spectralCentroid_sma", ('spectral', ('cSpectral',))),
+    ("pcm_fftMag_spectralFlux_sma", ('spectral', ('cSpectral',))),
+    ("pcm_fftMag_spectralEntropy_sma", ('spectral', ('cSpectral',))),
+    ("mfcc_sma[5]", ('mfcc', ('cMfcc',))),
+])
+DEFAULT_COLUMNS = list(COLUMN_SOURCES)
+
+# Componenti tra i produttori e il sink che non aggiungono descrittori propri
+PASS_THROUGH_TYPES = ('cVectorConcat', 'cContourSmoother', 'cDataSelector', 'cValbasedSelector')
+
+# Descrittori di cSpectral: restano attivi solo quelli richiesti
+SPECTRAL_FLAGS = {
+    "pcm_fftMag_spectralCentroid_sma": 'centroid',
+    "pcm_fftMag_spectralFlux_sma": 'flux',
+    "pcm_fftMag_spectralEntropy_sma": 'entropy',
+}
+SPECTRAL_OTHER_FLAGS = ('fluxCentroid', 'fluxAtFluxCentroid', 'maxPos', 'minPos', 'variance', 'skewness',
+                        'kurtosis', 'slope', 'harmonicity', 'sharpness', 'tonality', 'alphaRatio',
+                        'hammarbergIndex', 'slopes', 'spread')
+SPECTRAL_ARRAY_KEYS = ('bands[', 'rollOff[')
+
+_INCLUDE = re.compile(r'^\s*\\\{(.+)\}\s*$')
+_SECTION = re.compile(r'^\s*\[([^:\]]+):([^\]]+)\]\s*$')
+_INSTANCE = re.compile(r'^\s*instance\[([^\]]+)\]\.type\s*=\s*(\S+)')
+_KEY = re.compile(r'^\s*([^=;#/%\s][^=]*?)\s*=\s*(.*?)\s*$')
+# \cm[nome(alias){default}:descrizione]: opzione da riga di comando, default e descrizione opzionali
+_CM_OPTION = re.compile(r'\\cm\[\s*([^\s{}():\]]+)\s*(?:\([^)]*\))?\s*(?:\{([^}]*)\})?[^\]]*\]')
+_READER_KEY = re.compile(r'\w*reader\d*\.dmLevel', re.IGNORECASE)
+_LEVEL_KEY = re.compile(r'(\w*reader\d*|writer)\.dmLevel', re.IGNORECASE)
+_LLD_OPTION = re.compile(r'\blldcsvoutput\b(\([^)]*\))?')
+
+# Config combinato: prefisso dei componenti LLD e opzione del loro CSV
+LLD_PREFIX = 'lld_'
+COMBINED_LLD_OPTION = 'customlldcsvoutput'
+
+# Config eGeMAPS a segmenti: opzione con la lista 'inizio-fine,...' (secondi)
+SEGMENT_LIST_OPTION = 'segmentlist'
+
+
+# ===============================================
+# PARSING
+# ===============================================
+def _read_lines(path, seen=None, defaults=None):
+    """
+    Righe del config con gli include \\{...} espansi (path relativi al file che include).
+
+    Include da riga di comando (\\{\\cm[opzione{default}:...]}) risolti come
+    openSMILE: il default è dichiarato una sola volta (la prima) e vale per
+    tutti i riferimenti successivi \\{\\cm[opzione]} in qualunque file; un
+    include senza default (o con default '?') è saltato.
+    """
+    seen = set() if seen is None else seen
+    defaults = {} if defaults is None else defaults
+    path = os.path.abspath(path)
+    if path in seen:
+        raise ValueError(f"Include ciclico nel config openSMILE: {path}")
+    seen.add(path)
+    lines = []
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            for name, default in _CM_OPTION.findall(line):
+                if default:
+                    defaults.setdefault(name, default.strip())
+            match = _INCLUDE.match(line)
+            if match:
+                target = match.group(1).strip()
+                option = _CM_OPTION.fullmatch(target)
+                if option:
+                    target = defaults.get(option.group(1), '')
+                    if target in ('', '?'):
+                        continue
+                lines.extend(_read_lines(os.path.join(os.path.dirname(path), target), seen, defaults))
+            else:
+                lines.append(line.rstrip('\n'))
+    seen.discard(path)
+    return lines
+
+
+def parse_config(path):
+    """
+    Ritorna (manager_lines, instances, sections):
+      manager_lines  opzioni di cComponentManager diverse da instance[...]
+      instances      OrderedDict nome -> tipo
+      sections       OrderedDict nome -> righe della sezione [nome:tipo]
+    """
+    manager_lines = []
+    instances = OrderedDict()
+    sections = OrderedDict()
+    current = None
+    for line in _read_lines(path):
+        match = _SECTION.match(line)
+        if match:
+            name, ctype = match.group(1).strip(), match.group(2).strip()
+            current = '__manager__' if ctype == 'cComponentManager' else name
+            if current != '__manager__':
+                sections.setdefault(name, [])
+            continue
+        if current is None:
+            continue
+        if current == '__manager__':
+            match = _INSTANCE.match(line)
+            if match:
+                instances[match.group(1).strip()] = match.group(2).strip()
+            elif line.strip():
+                manager_lines.append(line)
+        else:
+            sections[current].append(line)
+    return manager_lines, instances, sections
+
+
+def _options(lines):
+    options = OrderedDict()
+    for line in lines:
+        match = _KEY.match(line)
+        if match:
+            options.setdefault(match.group(1), []).append(match.group(2))
+    return options
+
+
+def _reader_levels(lines):
+    levels = []
+    for key, values in _options(lines).items():
+        if _READER_KEY.fullmatch(key):
+            for value in values:
+                levels.extend(level.strip() for level in value.split(';') if level.strip())
+    return levels
+
+
+def _writer_level(lines):
+    values = _options(lines).get('writer.dmLevel')
+    return values[-1].strip() if values else None
+
+
+def _graph(instances, sections):
+    """(righe per componente, dmLevel -> componente che lo scrive, componente -> livelli letti)."""
+    components = {name: sections.get(name, []) for name in instances}
+    writer_of = {}
+    for name, lines in components.items():
+        level = _writer_level(lines)
+        if level:
+            writer_of[level] = name
+    readers = {name: _reader_levels(lines) for name, lines in components.items()}
+    return components, writer_of, readers
+
+
+def _ancestors(names, readers, writer_of):
+    found, stack = set(), list(names)
+    while stack:
+        name = stack.pop()
+        for level in readers.get(name, []):
+            source = writer_of.get(level)
+            if source and source not in found:
+                found.add(source)
+                stack.append(source)
+    return found
+
+
+def _lld_sink(instances, components, config_path):
+    sinks = [name for name, ctype in instances.items()
+             if ctype.endswith('CsvSink') and any('lldcsvoutput' in line for line in components[name])]
+    if not sinks:
+        raise ValueError(f"Nessun sink -lldcsvoutput in {config_path}")
+    return sinks[0]
+
+
+# ===============================================
+# RIDUZIONE
+# ===============================================
+def trim_lld_config(config_path, columns=None):
+    """
+    Testo del config ridotto alle colonne LLD richieste (default: DEFAULT_COLUMNS).
+    ValueError se una colonna non è supportata o il config non ha un sink -lldcsvoutput.
+    """
+    columns = list(columns or DEFAULT_COLUMNS)
+    unknown = [c for c in columns if c not in COLUMN_SOURCES]
+    if unknown:
+        raise ValueError(f"Colonne non supportate dal config minimale: {unknown}")
+
+    manager_lines, instances, sections = parse_config(config_path)
+    components, writer_of, readers = _graph(instances, sections)
+    sink = _lld_sink(instances, components, config_path)
+
+    def ancestors(names):
+        return _ancestors(names, readers, writer_of)
+
+    producer_types = {ctype for col in columns for ctype in COLUMN_SOURCES[col][1]}
+    producers = [name for name, ctype in instances.items() if ctype in producer_types]
+    if 'cEnergy' in producer_types:
+        # Solo l'energia RMS (pcm_RMSenergy), non eventuali cEnergy logaritmiche
+        producers = [name for name in producers if instances[name] != 'cEnergy'
+                     or _options(components[name]).get('rms', ['0'])[-1].strip() == '1']
+    feeding_sink = ancestors([sink])
+    producers = [name for name in producers if name in feeding_sink]
+    found = {COLUMN_SOURCES[col][0] for col in columns
+             if any(instances[name] in COLUMN_SOURCES[col][1] for name in producers)}
+    missing = {COLUMN_SOURCES[col][0] for col in columns} - found
+    if missing:
+        raise ValueError(f"Nel config mancano i componenti per: {', '.join(sorted(missing))}")
+
+    # Percorso produttori -> sink attraverso i soli componenti di passaggio
+    keep = set(producers) | ancestors(producers)
+    frontier = list(producers)
+    while frontier:
+        level = _writer_level(components[frontier.pop()])
+        for name, levels in readers.items():
+            if level in levels and name not in keep and (name == sink or (
+                    instances[name] in PASS_THROUGH_TYPES and name in feeding_sink)):
+                keep.add(name)
+                frontier.append(name)
+    keep |= {name for name, ctype in instances.items() if ctype == 'cDataMemory'}
+
+    kept_levels = {_writer_level(components[name]) for name in keep} - {None}
+    for name in list(keep):
+        if instances[name] in PASS_THROUGH_TYPES or name == sink:
+            if not any(level in kept_levels for level in readers[name]):
+                keep.discard(name)
+
+    out = [f"; Config LLD minimale generato da smile_config.py (v{GENERATOR_VERSION})",
+           f"; sorgente: {os.path.abspath(config_path)}",
+           f"; colonne: {', '.join(columns)}",
+           "",
+           "[componentInstances:cComponentManager]"]
+    out += manager_lines
+    out += [f"instance[{name}].type={ctype}" for name, ctype in instances.items() if name in keep]
+    for name, ctype in instances.items():
+        if name not in keep or name not in sections:
+            continue
+        out += ["", f"[{name}:{ctype}]"]
+        out += _trim_section(components[name], ctype, columns, kept_levels)
+    return "\n".join(out) + "\n"
+
+
+def _trim_section(lines, ctype, columns, kept_levels):
+    trimmed = []
+    disabled = set(SPECTRAL_OTHER_FLAGS) | {flag for col, flag in SPECTRAL_FLAGS.items() if col not in columns}
+    for line in lines:
+        match = _KEY.match(line)
+        key = match.group(1) if match else None
+        if key and _READER_KEY.fullmatch(key):
+            levels = [lv.strip() for lv in match.group(2).split(';') if lv.strip()]
+            if any(lv not in kept_levels for lv in levels):
+                line = f"{key} = {';'.join(lv for lv in levels if lv in kept_levels)}"
+        elif ctype == 'cSpectral' and key:
+            if key.startswith(SPECTRAL_ARRAY_KEYS):
+                continue
+            if key in disabled:
+                line = f"{key} = 0"
+        trimmed.append(line)
+    return trimmed
+
+
+# ===============================================
+# CONFIG COMBINATO eGeMAPS + LLD
+# ===============================================
+def _source_options(lines):
+    options = _options(lines)
+    options.pop('writer.dmLevel', None)
+    return options
+
+
+def _single_instance(instances, ctype):
+    names = [name for name, t in instances.items() if t == ctype]
+    return names[0] if len(names) == 1 else None
+
+
+def _rename_lld_line(line, level_name):
+    match = _KEY.match(line)
+    if match and _LEVEL_KEY.fullmatch(match.group(1)):
+        levels = [level_name(lv.strip()) for lv in match.group(2).split(';') if lv.strip()]
+        return f"{match.group(1)} = {';'.join(levels)}"
+    return _LLD_OPTION.sub(COMBINED_LLD_OPTION, line)
+
+
+def merge_configs(egemaps_config_path, lld_config_path):
+    """
+    Testo di un config che in un solo SMILExtract scrive i functionals eGeMAPS
+    (-O, come il config eGeMAPS) e gli LLD (-customlldcsvoutput).
+
+    La parte eGeMAPS è copiata invariata. Della parte LLD restano solo il sink
+    -lldcsvoutput e i suoi antenati, con nomi e dmLevel prefissati da 'lld_'.
+    L'opzione diventa -customlldcsvoutput perché anche eGeMAPS dichiara un proprio
+    -lldcsvoutput. Se i due cWaveSource hanno le stesse opzioni il WAV viene letto
+    una volta sola (il livello audio degli LLD diventa quello di eGeMAPS).
+    ValueError se il config LLD non ha un sink -lldcsvoutput o i nomi collidono.
+    """
+    e_manager, e_instances, e_sections = parse_config(egemaps_config_path)
+    l_manager, l_instances, l_sections = parse_config(lld_config_path)
+    components, writer_of, readers = _graph(l_instances, l_sections)
+    sink = _lld_sink(l_instances, components, lld_config_path)
+    keep = {sink} | _ancestors([sink], readers, writer_of)
+
+    level_map = {}
+    e_wave = _single_instance(e_instances, 'cWaveSource')
+    l_wave = _single_instance(l_instances, 'cWaveSource')
+    shared_wave = (e_wave is not None and l_wave in keep and _writer_level(e_sections.get(e_wave, []))
+                   and _source_options(e_sections.get(e_wave, [])) == _source_options(components[l_wave]))
+    if shared_wave:
+        level_map[_writer_level(components[l_wave])] = _writer_level(e_sections[e_wave])
+        keep.discard(l_wave)
+
+    def level_name(level):
+        return level_map.get(level, LLD_PREFIX + level)
+
+    has_memory = any(ctype == 'cDataMemory' for ctype in e_instances.values())
+    lld_instances = OrderedDict()
+    for name, ctype in l_instances.items():
+        if name in keep or (ctype == 'cDataMemory' and not has_memory):
+            lld_instances[name] = ctype
+    clashes = [LLD_PREFIX + name for name in lld_instances if LLD_PREFIX + name in e_instances]
+    if clashes:
+        raise ValueError(f"Componenti con lo stesso nome nei due config: {clashes}")
+
+    e_keys = {match.group(1) for match in map(_KEY.match, e_manager) if match}
+    out = [f"; Config combinato eGeMAPS + LLD generato da smile_config.py (v{GENERATOR_VERSION})",
+           f"; eGeMAPS (-O): {os.path.abspath(egemaps_config_path)}",
+           f"; LLD (-{COMBINED_LLD_OPTION}): {os.path.abspath(lld_config_path)}",
+           f"; sorgente audio {'condivisa' if shared_wave else 'separata'}",
+           "",
+           "[componentInstances:cComponentManager]"]
+    out += e_manager
+    out += [line for line in l_manager if not (_KEY.match(line) and _KEY.match(line).group(1) in e_keys)]
+    out += [f"instance[{name}].type={ctype}" for name, ctype in e_instances.items()]
+    out += [f"instance[{LLD_PREFIX}{name}].type={ctype}" for name, ctype in lld_instances.items()]
+    for name, ctype in e_instances.items():
+        if name in e_sections:
+            out += ["", f"[{name}:{ctype}]"] + e_sections[name]
+    for name, ctype in lld_instances.items():
+        if name in l_sections:
+            out += ["", f"[{LLD_PREFIX}{name}:{ctype}]"]
+            out += [_rename_lld_line(line, level_name) for line in l_sections[name]]
+    return "\n".join(out) + "\n"
+
+
+# ===============================================
+# FUNCTIONALS PER SEGMENTO (batch eGeMAPS)
+# ===============================================
+def segment_functionals_config(config_path):
+    """
+    Testo del config eGeMAPS con i cFunctionals in frameMode=list: una riga ARFF
+    per ogni segmento di -segmentlist invece di una per l'intero input. Usato per
+    estrarre più WAV concatenati con un solo SMILExtract (vedi smile_batch.py).
+    ValueError se il config non ha componenti cFunctionals.
+    """
+    manager_lines, instances, sections = parse_config(config_path)
+    functionals = [name for name, ctype in instances.items() if ctype == 'cFunctionals']
+    if not functionals:
+        raise ValueError(f"Nessun cFunctionals in {config_path}")
+
+    out = [f"; Config eGeMAPS a segmenti generato da smile_config.py (v{GENERATOR_VERSION})",
+           f"; sorgente: {os.path.abspath(config_path)}",
+           "",
+           "[componentInstances:cComponentManager]"]
+    out += manager_lines
+    out += [f"instance[{name}].type={ctype}" for name, ctype in instances.items()]
+    for name, ctype in instances.items():
+        if name not in sections:
+            continue
+        lines = sections[name]
+        if name in functionals:
+            lines = [line for line in lines
+                     if not (_KEY.match(line) and _KEY.match(line).group(1) in ('frameMode', 'frameList'))]
+            lines += ["frameMode = list",
+                      f"frameList = \\cm[{SEGMENT_LIST_OPTION}{{0s-1s}}:segmenti inizio-fine in secondi]"]
+        out += ["", f"[{name}:{ctype}]"] + lines
+    return "\n".join(out) + "\n"
+
+
+# ===============================================
+# CACHE E VALIDAZIONE
+# ===============================================
+def default_cache_dir(config=None):
+    config = config or get_config_service()
+    return os.path.join(os.path.dirname(os.path.abspath(config.config_file)), 'smile_configs')
+
+
+def _write_test_wav(path, seconds=1.0, sr=16000):
+    """WAV sintetico (tono a 200 Hz con armoniche e una pausa) per provare il config."""
+    frames = bytearray()
+    for i in range(int(seconds * sr)):
+        t = i / sr
+        value = 0.0 if 0.4 <= t < 0.6 else 0.4 * math.sin(2 * math.pi * 200 * t) + 0.2 * math.sin(2 * math.pi * 400 * t)
+        frames += struct.pack('<h', int(value * 32767))
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(bytes(frames))
+
+
+def run_lld(settings, config_path, wav, lld_csv):
+    """Esegue SMILExtract con config_path; ritorna il tempo impiegato (s)."""
+    start = time.perf_counter()
+    proc = run_cancellable([settings.smile_path, "-C", config_path, "-I", wav, "-lldcsvoutput", lld_csv,
+                            "-nologfile", "-loglevel", "2"], None, cwd=settings.cwd, env=settings.env)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr or proc.stdout or f"exit code {proc.returncode}")
+    return time.perf_counter() - start
+
+
+def _lld_header(lld_csv):
+    with open(lld_csv, 'r', encoding='utf-8', errors='replace') as f:
+        return [c.strip().strip("'") for c in f.readline().strip().split(';')]
+
+
+def validate_config(settings, config_path, columns):
+    """Prova il config su un WAV sintetico e verifica che l'header LLD contenga tutte le colonne."""
+    with tempfile.TemporaryDirectory() as tmp:
+        wav = os.path.join(tmp, 'probe.wav')
+        lld_csv = os.path.join(tmp, 'probe_LLD.csv')
+        _write_test_wav(wav)
+        run_lld(settings, config_path, wav, lld_csv)
+        header = _lld_header(lld_csv)
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise RuntimeError(f"colonne mancanti nell'output: {missing}")
+
+
+# Un config fallito viene riprovato dopo questo intervallo (errori transitori)
+FAILED_RETRY_SECONDS = 24 * 3600
+
+
+def _binary_fingerprint(smile_path):
+    """Identifica l'eseguibile SMILExtract (path, mtime, dimensione) per i marker di validazione."""
+    path = os.path.abspath(smile_path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path
+    return f"{path}|{st.st_mtime_ns}|{st.st_size}"
+
+
+def _read_marker(marker):
+    try:
+        with open(marker, 'r', encoding='utf-8') as f:
+            return f.readline().rstrip('\n')
+    except OSError:
+        return None
+
+
+def _cached_config(text, prefix, validator, cache_dir, label, smile_path):
+    """
+    Salva `text` in cache_dir/<prefix>_<hash>.conf e lo valida una volta con
+    validator(path); i marker .ok/.failed evitano di ripetere la prova.
+    I marker registrano l'eseguibile SMILExtract usato per la prova: se cambia
+    (altro path o binario aggiornato) il config viene riprovato, e un .failed
+    scade comunque dopo FAILED_RETRY_SECONDS.
+    Ritorna il path, o None se la prova fallisce.
+    """
+    digest = hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+    path = os.path.join(cache_dir, f"{prefix}_{digest}.conf")
+    ok_marker, failed_marker = path + ".ok", path + ".failed"
+    binary = _binary_fingerprint(smile_path)
+    if _read_marker(failed_marker) == binary and \
+            time.time() - os.path.getmtime(failed_marker) < FAILED_RETRY_SECONDS:
+        return None
+    if os.path.exists(path) and _read_marker(ok_marker) == binary:
+        return path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for marker in (ok_marker, failed_marker):
+        if os.path.exists(marker):
+            os.remove(marker)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    try:
+        validator(path)
+    except Exception as e:
+        print(f"⚠️ {label} non valido ({e})")
+        with open(failed_marker, 'w', encoding='utf-8') as f:
+            f.write(f"{binary}\n{e}")
+        return None
+    with open(ok_marker, 'w', encoding='utf-8') as f:
+        f.write(binary + "\n")
+    return path
+
+
+def minimal_lld_config(settings, columns=None, cache_dir=None):
+    """
+    Path del config minimale per settings.config_path (generato e validato una
+    volta, poi riusato dalla cache). None se non è generabile o non supera la prova.
+    """
+    columns = list(columns or DEFAULT_COLUMNS)
+    try:
+        text = trim_lld_config(settings.config_path, columns)
+    except Exception as e:
+        print(f"⚠️ Config LLD minimale non generabile ({e}): uso il config completo")
+        return None
+    path = _cached_config(text, 'lld_minimal', lambda conf: validate_config(settings, conf, columns),
+                          cache_dir or default_cache_dir(), "Config LLD minimale", settings.smile_path)
+    if path is None:
+        print("   uso il config LLD completo")
+    return path
+
+
+def lld_settings(config=None, columns=None):
+    """
+    SmileSettings per generare gli LLD: il config minimale se 'lld_config_mode'
+    di gui_config.json non è 'full' e il config ridotto è valido, altrimenti
+    quello completo (Compare2016_config_path).
+    """
+    config = config or get_config_service()
+    settings = config.smile_settings(LLD_CONFIG_KEY)
+    if config.get(LLD_CONFIG_MODE_KEY, 'minimal') == 'full':
+        return settings
+    path = minimal_lld_config(settings, columns, cache_dir=default_cache_dir(config))
+    return settings._replace(config_path=path) if path else settings
+
+
+
+def run_combined(settings, config_path, wav, arff_file, lld_csv, cancel_token=None):
+    """SMILExtract con il config combinato: functionals in arff_file, LLD in lld_csv."""
+    proc = run_cancellable([settings.smile_path, "-C", config_path, "-I", wav, "-O", arff_file,
+                            f"-{COMBINED_LLD_OPTION}", lld_csv, "-nologfile", "-loglevel", "2"],
+                           cancel_token, cwd=settings.cwd, env=settings.env)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr or proc.stdout or f"exit code {proc.returncode}")
+
+
+def arff_data_rows(arff_file):
+    """Numero di righe di dati (dopo @data) di un ARFF."""
+    rows, in_data = 0, False
+    with open(arff_file, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('%'):
+                continue
+            if in_data:
+                rows += 1
+            elif line.lower() == '@data':
+                in_data = True
+    return rows
+
+
+def validate_combined_config(settings, config_path, columns):
+    """Prova il config combinato: l'ARFF deve avere una riga di dati e l'LLD tutte le colonne."""
+    with tempfile.TemporaryDirectory() as tmp:
+        wav = os.path.join(tmp, 'probe.wav')
+        arff_file = os.path.join(tmp, 'probe.arff')
+        lld_csv = os.path.join(tmp, 'probe_LLD.csv')
+        _write_test_wav(wav)
+        run_combined(settings, config_path, wav, arff_file, lld_csv)
+        rows = arff_data_rows(arff_file)
+        header = _lld_header(lld_csv)
+    if rows < 1:
+        raise RuntimeError("ARFF eGeMAPS senza dati")
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise RuntimeError(f"colonne mancanti nell'output LLD: {missing}")
+
+
+def combined_config(egemaps_settings, lld_config_settings, cache_dir=None):
+    """
+    Path del config combinato (generato e validato una volta, poi dalla cache).
+    None se i due config usano SMILExtract diversi, non sono unibili o la prova fallisce.
+    """
+    if egemaps_settings.smile_path != lld_config_settings.smile_path:
+        return None
+    try:
+        text = merge_configs(egemaps_settings.config_path, lld_config_settings.config_path)
+    except Exception as e:
+        print(f"⚠️ Config combinato eGeMAPS + LLD non generabile ({e}): due SMILExtract per file")
+        return None
+    path = _cached_config(text, 'combined',
+                          lambda conf: validate_combined_config(egemaps_settings, conf, DEFAULT_COLUMNS),
+                          cache_dir or default_cache_dir(), "Config combinato eGeMAPS + LLD",
+                          egemaps_settings.smile_path)
+    if path is None:
+        print("   due SMILExtract per file (eGeMAPS e LLD separati)")
+    return path
+
+
+def combined_settings(config=None):
+    """
+    SmileSettings con il config combinato eGeMAPS + LLD (config LLD scelto da
+    lld_settings), o None se non disponibile: in quel caso si usano i due config separati.
+    """
+    config = config or get_config_service()
+    egemaps_settings = config.smile_settings(EGEMAPS_CONFIG_KEY)
+    path = combined_config(egemaps_settings, lld_settings(config), cache_dir=default_cache_dir(config))
+    return egemaps_settings._replace(config_path=path) if path else None
+
+
+def format_segments(segments):
+    """frameList in secondi: senza il suffisso 's' openSMILE legge i valori come indici di frame."""
+    return ",".join(f"{start:.3f}s-{end:.3f}s" for start, end in segments)
+
+
+def run_segments(settings, config_path, wav, arff_file, segments, cancel_token=None):
+    """SMILExtract con il config a segmenti: una riga ARFF per (inizio, fine) di segments."""
+    proc = run_cancellable([settings.smile_path, "-C", config_path, "-I", wav, "-O", arff_file,
+                            f"-{SEGMENT_LIST_OPTION}", format_segments(segments), "-nologfile", "-loglevel", "2"],
+                           cancel_token, cwd=settings.cwd, env=settings.env)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr or proc.stdout or f"exit code {proc.returncode}")
+
+
+def validate_segment_config(settings, config_path):
+    """
+    Prova il config a segmenti: due segmenti del WAV sintetico devono dare due
+    righe ARFF (il WAV continua dopo il secondo segmento, come i batch di smile_batch.py).
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        wav = os.path.join(tmp, 'probe.wav')
+        arff_file = os.path.join(tmp, 'probe.arff')
+        _write_test_wav(wav, seconds=1.5)
+        run_segments(settings, config_path, wav, arff_file, [(0.0, 0.4), (0.6, 1.0)])
+        rows = arff_data_rows(arff_file)
+    if rows != 2:
+        raise RuntimeError(f"{rows} righe ARFF per 2 segmenti")
+
+
+def segment_egemaps_settings(config=None, settings=None):
+    """
+    SmileSettings con il config eGeMAPS a segmenti (generato e validato una volta,
+    poi dalla cache), o None se non disponibile: in quel caso un SMILExtract per file.
+    """
+    config = config or get_config_service()
+    settings = settings or config.smile_settings(EGEMAPS_CONFIG_KEY)
+    try:
+        text = segment_functionals_config(settings.config_path)
+    except Exception as e:
+        print(f"⚠️ Config eGeMAPS a segmenti non generabile ({e}): un SMILExtract per file")
+        return None
+    path = _cached_config(text, 'egemaps_segments', lambda conf: validate_segment_config(settings, conf),
+                          default_cache_dir(config), "Config eGeMAPS a segmenti", settings.smile_path)
+    if path is None:
+        print("   un SMILExtract per file")
+    return settings._replace(config_path=path) if path else None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Genera il config openSMILE minimale per gli LLD delle feature custom")
+    ap.add_argument("--config", default=None, help="Config LLD completo (default: Compare2016_config_path)")
+    ap.add_argument("--columns", nargs="+", default=None, help="Colonne LLD richieste (default: tutte le 7)")
+    ap.add_argument("--out", default=None, help="Scrivi il config ridotto in questo file")
+    ap.add_argument("--benchmark", default=None, help="WAV su cui confrontare tempo e dimensione LLD (completo vs minimale)")
+    args = ap.parse_args()
+
+    service = get_config_service()
+    source = args.config or service.get(LLD_CONFIG_KEY)
+    text = trim_lld_config(source, args.columns)
+    _, all_instances, _ = parse_config(source)
+    kept = sum(1 for line in text.splitlines() if _INSTANCE.match(line))
+    print(f"Componenti: {kept}/{len(all_instances)} mantenuti ({source})")
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"✅ Salvato: {args.out}")
+
+    if args.benchmark:
+        base_settings = service.smile_settings(LLD_CONFIG_KEY, config_path=source)
+        with tempfile.TemporaryDirectory() as tmp:
+            trimmed_conf = os.path.join(tmp, 'minimal.conf')
+            with open(trimmed_conf, 'w', encoding='utf-8') as f:
+                f.write(text)
+            results = {}
+            for label, conf in (('completo', source), ('minimale', trimmed_conf)):
+                lld_csv = os.path.join(tmp, f"{label}_LLD.csv")
+                elapsed = run_lld(base_settings, conf, args.benchmark, lld_csv)
+                results[label] = (elapsed, os.path.getsize(lld_csv))
+                print(f"{label:<9} {elapsed:6.2f}s  LLD {results[label][1] / 1024:8.1f} KB")
+            full, small = results['completo'], results['minimale']
+            print(f"⏱ x{full[0] / max(small[0], 1e-9):.1f} più veloce, LLD x{full[1] / max(small[1], 1):.1f} più piccolo")
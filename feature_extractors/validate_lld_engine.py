@@ -0,0 +1,150 @@
+"""
+Validazione del motore LLD numpy (lld_engine.py) rispetto a openSMILE.
+
+Per ogni WAV con il relativo LLD ComParE (<nome>_LLD.csv, generato con
+--generate se manca) confronta frame per frame (allineati su frameTime)
+le colonne di REQUIRED_COLS:
+  - r      correlazione di Pearson
+  - nmae   errore assoluto medio / deviazione standard della colonna openSMILE
+  - vuv    accordo della maschera voiced (soglia --voicing-thr), solo voicing
+e le feature custom calcolate dalle due sorgenti (errore relativo).
+Stampa le mediane sul corpus e i tempi (motore numpy vs SMILExtract, se
+gli LLD vengono generati in questa esecuzione).
+
+Uso:
+    python feature_extractors/validate_lld_engine.py <cartella WAV> [--generate] [--max-files N] [--report out.csv]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    from feature_extractors.extract_features_custom import (
+        REQUIRED_COLS, ALL_CUSTOM_FEATURES, VOICING_THR_DEFAULT, MIN_PAUSE_DEFAULT, LONG_PAUSE_DEFAULT, DT,
+        load_lld_csv_min, process_file, lld_path_for
+    )
+    from feature_extractors.lld_engine import read_wav, compute_lld
+    from feature_extractors.config_service import get_config_service, LLD_CONFIG_KEY
+except Exception:
+    from .extract_features_custom import (
+        REQUIRED_COLS, ALL_CUSTOM_FEATURES, VOICING_THR_DEFAULT, MIN_PAUSE_DEFAULT, LONG_PAUSE_DEFAULT, DT,
+        load_lld_csv_min, process_file, lld_path_for
+    )
+    from .lld_engine import read_wav, compute_lld
+    from .config_service import get_config_service, LLD_CONFIG_KEY
+
+
+def compare_columns(reference, engine, voicing_thr):
+    """Metriche per colonna su frame allineati (frameTime arrotondato al hop)."""
+    ref = reference.assign(frame=np.round(reference['frameTime'].to_numpy() / DT).astype(int))
+    eng = engine.assign(frame=np.round(engine['frameTime'].to_numpy() / DT).astype(int))
+    merged = ref.merge(eng, on='frame', suffixes=('_ref', '_eng'))
+
+    metrics = {'frames_ref': len(reference), 'frames_eng': len(engine), 'frames_aligned': len(merged)}
+    for col in REQUIRED_COLS:
+        a = pd.to_numeric(merged[f'{col}_ref'], errors='coerce').fillna(0.0).to_numpy()
+        b = merged[f'{col}_eng'].to_numpy()
+        std = a.std()
+        metrics[f'{col} r'] = float(np.corrcoef(a, b)[0, 1]) if std > 0 and b.std() > 0 else np.nan
+        metrics[f'{col} nmae'] = float(np.mean(np.abs(a - b)) / std) if std > 0 else np.nan
+
+    v_ref = pd.to_numeric(merged['voicingFinalUnclipped_sma_ref'], errors='coerce').fillna(0.0).to_numpy()
+    v_eng = merged['voicingFinalUnclipped_sma_eng'].to_numpy()
+    metrics['vuv agreement'] = float(np.mean((v_ref > voicing_thr) == (v_eng > voicing_thr))) if len(merged) else np.nan
+    return metrics
+
+
+def compare_features(lld_csv, engine, voicing_thr):
+    """Errore relativo delle feature custom: LLD openSMILE vs LLD del motore."""
+    args = (voicing_thr, MIN_PAUSE_DEFAULT, LONG_PAUSE_DEFAULT, DT, 50, True, ALL_CUSTOM_FEATURES)
+    ref = process_file(lld_csv, *args)
+    eng = process_file(lld_csv, *args, lld_frame=engine)
+    if ref is None or eng is None:
+        return {}
+    errors = {}
+    for feature in ALL_CUSTOM_FEATURES:
+        a, b = float(ref[feature]), float(eng[feature])
+        errors[f'{feature} relerr'] = abs(a - b) / max(abs(a), 1e-9)
+    return errors
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Validazione del motore LLD numpy rispetto a openSMILE (ComParE_2016)")
+    ap.add_argument("root", help="Cartella dei WAV (con gli LLD <nome>_LLD.csv accanto)")
+    ap.add_argument("--generate", action="store_true", help="Genera con SMILExtract gli LLD mancanti")
+    ap.add_argument("--max-files", type=int, default=None, help="Numero massimo di WAV da confrontare")
+    ap.add_argument("--voicing-thr", type=float, default=VOICING_THR_DEFAULT, help="Soglia per l'accordo voiced/unvoiced")
+    ap.add_argument("--report", default=None, help="CSV (sep ';') con le metriche per file")
+    args = ap.parse_args()
+
+    wavs = sorted(os.path.join(dirpath, f) for dirpath, _, filenames in os.walk(args.root)
+                  for f in filenames if f.lower().endswith('.wav'))
+    settings = None
+    if args.generate:
+        from feature_extractors.extract_feature_batch_LLD import generate_lld_for_file
+        settings = get_config_service().smile_settings(LLD_CONFIG_KEY)
+
+    rows = []
+    for wav in wavs:
+        if args.max_files and len(rows) >= args.max_files:
+            break
+        lld_csv = lld_path_for(wav)
+        smile_time = np.nan
+        if not os.path.exists(lld_csv):
+            if settings is None:
+                continue
+            start = time.perf_counter()
+            lld_csv = generate_lld_for_file(wav, settings=settings)
+            smile_time = time.perf_counter() - start
+
+        try:
+            start = time.perf_counter()
+            signal, sr = read_wav(wav)
+            engine = pd.DataFrame(compute_lld(signal, sr))
+            engine_time = time.perf_counter() - start
+            reference = load_lld_csv_min(lld_csv, usecols=['frameTime'] + REQUIRED_COLS)
+        except Exception as e:
+            print(f"[ERROR] {wav}: {e}")
+            continue
+
+        row = {'file': os.path.basename(wav), 'engine_s': engine_time, 'smilextract_s': smile_time}
+        row.update(compare_columns(reference, engine, args.voicing_thr))
+        row.update(compare_features(lld_csv, engine, args.voicing_thr))
+        rows.append(row)
+        print(f"[OK] {row['file']}: vuv {row['vuv agreement']:.3f}, "
+              f"F0 r {row['F0final_sma r']:.3f}, numpy {engine_time:.2f}s")
+
+    if not rows:
+        print("⚠ Nessun WAV con LLD openSMILE da confrontare (usa --generate)")
+        return
+
+    report = pd.DataFrame(rows)
+    print(f"\n📊 Accordo con openSMILE su {len(report)} file (mediane)")
+    for col in REQUIRED_COLS:
+        print(f"  {col:<34} r {report[f'{col} r'].median():6.3f}   nmae {report[f'{col} nmae'].median():6.3f}")
+    print(f"  {'voiced/unvoiced agreement':<34} {report['vuv agreement'].median():6.3f}")
+    feature_cols = [c for c in report.columns if c.endswith(' relerr')]
+    if feature_cols:
+        print("\n  Feature custom (errore relativo mediano)")
+        for col in feature_cols:
+            print(f"  {col[:-len(' relerr')]:<34} {report[col].median():6.3f}")
+    print(f"\n⏱ numpy {report['engine_s'].sum():.1f}s totali")
+    if report['smilextract_s'].notna().any():
+        generated = report[report['smilextract_s'].notna()]
+        print(f"⏱ SMILExtract {generated['smilextract_s'].sum():.1f}s vs numpy {generated['engine_s'].sum():.1f}s "
+              f"sugli stessi {len(generated)} file (x{generated['smilextract_s'].sum() / generated['engine_s'].sum():.1f})")
+
+    if args.report:
+        report.to_csv(args.report, index=False, sep=';')
+        print(f"✅ Report: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+Feature Matrix out-of-core
+
+Backend a blocchi per corpora molto grandi (centinaia di migliaia di
+registrazioni): il dataset merged viene scritto su disco come matrice
+numerica densa (np.memmap, righe x feature) invece di restare in memoria
+come DataFrame pandas con colonne object.
+
+- Il merge custom + eGeMAPS + index è fatto a blocchi: le tabelle piccole
+  (custom, index) restano in memoria, quella eGeMAPS è letta in streaming.
+- Le colonne categoriche sono codificate in interi durante la scrittura,
+  senza LabelEncoder sull'intera colonna; a fine scrittura i codici sono
+  riportati all'ordine ordinato dei valori, come LabelEncoder.
+- I valori sono float64 come nel percorso in memoria (stessi risultati);
+  float32 dimezza disco e I/O al prezzo della precisione.
+- Medie, varianze, correlazioni e covarianze (per correlation filter,
+  variance threshold, scaling e PCA) sono accumulate in passate a blocchi:
+  la memoria di picco dipende dal numero di feature, non dal numero di righe.
+"""
+
+import os
+import json
+import sqlite3
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHUNK_ROWS = 50000
+
+# Colonne non-feature prodotte dal merge (stesse di load_and_merge_data / train.main)
+MERGE_DROP_COLUMNS = [
+    'filename_standard', 'filename_x', 'filename_y',
+    'subjectId_x', 'subjectId_y', 'ID', 'FileName', 'Tipo audio', 'class', 'name'
+]
+
+
+# ===============================================
+# LETTURA A BLOCCHI
+# ===============================================
+def iter_dataset_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Blocchi di un dataset merged: parquet (a batch) oppure CSV con ';'."""
+    if os.path.splitext(path)[1].lower() in ('.parquet', '.pq'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(path, delimiter=';', chunksize=chunk_rows):
+            yield chunk
+
+
+def read_dataset_index(path):
+    """
+    Carica il dataset index: SQLite scritto da train/build_index.py (tabella
+    'dataset_index'), Excel oppure CSV con ';'.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.sqlite', '.sqlite3', '.db'):
+        with sqlite3.connect(path) as conn:
+            return pd.read_sql_query(
+                'SELECT "FileName", "ID", "Tipo audio", "Tipo soggetto" FROM dataset_index ORDER BY path', conn)
+    if ext in ('.xlsx', '.xls'):
+        return pd.read_excel(path)
+    return pd.read_csv(path, delimiter=';')
+
+
+def _standard_filename(name):
+    return name.split('Italian')[0] + 'Italian'
+
+
+def iter_merged_chunks(dataset_custom_path, dataset_egemaps_path, dataset_index_path,
+                       chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Merge custom + eGeMAPS + index a blocchi (stessa logica di load_and_merge_data).
+
+    Il CSV eGeMAPS è letto in streaming; ogni blocco è unito alle tabelle
+    custom e index (in memoria) e filtrato su 'Tipo audio' == 'Free'.
+    Il merge inner preserva l'ordine delle righe di sinistra, quindi il
+    risultato concatenato coincide con il merge in memoria.
+    """
+    dataset_custom = pd.read_csv(dataset_custom_path, delimiter=';')
+    dataset_custom['filename_standard'] = dataset_custom['filename'].map(_standard_filename)
+
+    dataset_index = read_dataset_index(dataset_index_path)
+
+    for egemaps_chunk in pd.read_csv(dataset_egemaps_path, delimiter=';', chunksize=chunk_rows):
+        egemaps_chunk['filename_standard'] = egemaps_chunk['filename'].map(_standard_filename)
+        merged = pd.merge(egemaps_chunk, dataset_custom,
+                          left_on='filename_standard', right_on='filename_standard')
+        merged = pd.merge(merged, dataset_index, left_on='filename_x', right_on='FileName')
+        merged = merged[merged['Tipo audio'] == 'Free']
+        if len(merged):
+            yield merged.drop(columns=MERGE_DROP_COLUMNS, errors='ignore')
+
+
+# ===============================================
+# ACCUMULATORE DI MOMENTI
+# ===============================================
+class StreamingMoments:
+    """
+    Accumulatore a una passata di conteggi, medie, varianze e covarianze.
+
+    Le somme sono accumulate rispetto a uno shift (media del primo blocco)
+    per evitare la cancellazione numerica di sum(x^2) - sum(x)^2/n.
+    I NaN sono trattati come mancanti per medie e varianze; nelle
+    covarianze contribuiscono con deviazione nulla.
+    """
+
+    def __init__(self, n_features, with_covariance=True):
+        self.n_features = n_features
+        self.with_covariance = with_covariance
+        self.shift = None
+        self.count = np.zeros(n_features)
+        self.sum = np.zeros(n_features)
+        self.sumsq = np.zeros(n_features)
+        self.cross = np.zeros((n_features, n_features)) if with_covariance else None
+        self.n_rows = 0
+
+    def update(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        if block.shape[0] == 0:
+            return
+        if self.shift is None:
+            with np.errstate(invalid='ignore'):
+                self.shift = np.nan_to_num(np.nanmean(block, axis=0))
+        valid = ~np.isnan(block)
+        dev = np.where(valid, block - self.shift, 0.0)
+        self.count += valid.sum(axis=0)
+        self.sum += dev.sum(axis=0)
+        self.sumsq += np.square(dev).sum(axis=0)
+        if self.with_covariance:
+            self.cross += dev.T @ dev
+        self.n_rows += block.shape[0]
+
+    @property
+    def mean(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.shift + self.sum / self.count
+
+    def variance(self, ddof=0):
+        """Varianza per feature (ddof=0 come VarianceThreshold/StandardScaler, ddof=1 come pandas)."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            centered = self.sumsq - np.square(self.sum) / self.count
+            return np.maximum(centered, 0.0) / (self.count - ddof)
+
+    def covariance(self, ddof=0):
+        n = self.n_rows
+        mean_dev = self.sum / n
+        return (self.cross - n * np.outer(mean_dev, mean_dev)) / (n - ddof)
+
+    def correlation(self):
+        cov = self.covariance()
+        std = np.sqrt(np.diag(cov))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = cov / np.outer(std, std)
+        return np.clip(corr, -1.0, 1.0)
+
+
+# ===============================================
+# FEATURE MATRIX SU DISCO
+# ===============================================
+def _sort_categorical_codes(x_path, shape, dtype, columns, categorical, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Ricodifica in place (a blocchi sul memmap) le colonne categoriche scritte
+    con codici di prima comparsa: codice = posizione del valore in ordine
+    ordinato, come LabelEncoder nel percorso in memoria. Ritorna i mapping ordinati.
+    """
+    X = np.memmap(x_path, dtype=dtype, mode='r+', shape=shape)
+    position = {c: i for i, c in enumerate(columns)}
+    sorted_mappings = {}
+    for col, mapping in categorical.items():
+        values = sorted(mapping)
+        rank = {v: i for i, v in enumerate(values)}
+        lookup = np.array([rank[v] for v in mapping], dtype=dtype)
+        j = position[col]
+        for start in range(0, shape[0], chunk_rows):
+            codes = X[start:start + chunk_rows, j]
+            X[start:start + chunk_rows, j] = lookup[codes.astype(np.intp)]
+        sorted_mappings[col] = {v: i for i, v in enumerate(values)}
+    X.flush()
+    del X
+    return sorted_mappings
+
+
+class FeatureMatrix:
+    """
+    Matrice feature memory-mapped (righe x feature) con target codificato.
+
+    Struttura della directory:
+        X.bin        valori (dtype da meta.json), row-major
+        y.bin        codici int32 del target
+        meta.json    colonne, n_rows, dtype, classi target, mapping categorici
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.columns = self.meta['columns']
+        self.n_rows = self.meta['n_rows']
+        self.dtype = np.dtype(self.meta['dtype'])
+        self.target_column = self.meta['target_column']
+        self.classes = self.meta['target_classes']
+        shape = (self.n_rows, len(self.columns))
+        self.X = np.memmap(os.path.join(directory, 'X.bin'), dtype=self.dtype, mode='r', shape=shape) \
+            if self.n_rows else np.empty(shape, dtype=self.dtype)
+        self.y_codes = np.fromfile(os.path.join(directory, 'y.bin'), dtype=np.int32)
+
+    @property
+    def shape(self):
+        return self.X.shape
+
+    # ---------- costruzione ----------
+    @classmethod
+    def from_chunks(cls, chunks, directory, target_column, dtype=np.float64):
+        """
+        Scrive su disco i blocchi (DataFrame con feature + target) in un'unica passata.
+
+        Lo schema (colonne, colonne categoriche) è fissato dal primo blocco.
+        dtype: float64 (default) dà gli stessi valori del percorso in memoria;
+        float32 solo se la precisione ridotta è accettabile.
+        """
+        os.makedirs(directory, exist_ok=True)
+        x_path = os.path.join(directory, 'X.bin')
+        y_path = os.path.join(directory, 'y.bin')
+
+        columns = None
+        categorical = {}
+        classes = {}
+        n_rows = 0
+
+        with open(x_path, 'wb') as fx, open(y_path, 'wb') as fy:
+            for chunk in chunks:
+                if columns is None:
+                    columns = [c for c in chunk.columns if c != target_column]
+                    categorical = {c: {} for c in chunk[columns].select_dtypes(include=['object']).columns}
+
+                features = chunk.reindex(columns=columns)
+                for col, mapping in categorical.items():
+                    codes = [mapping.setdefault(v, len(mapping)) for v in features[col].astype(str)]
+                    features[col] = codes
+                numeric = features.apply(pd.to_numeric, errors='coerce')
+                fx.write(np.ascontiguousarray(numeric.to_numpy(dtype=dtype)).tobytes())
+
+                target_codes = [classes.setdefault(v, len(classes)) for v in chunk[target_column]]
+                fy.write(np.asarray(target_codes, dtype=np.int32).tobytes())
+                n_rows += len(chunk)
+
+        if categorical and n_rows:
+            categorical = _sort_categorical_codes(x_path, (n_rows, len(columns)), dtype, columns, categorical)
+
+        meta = {
+            'columns': [str(c) for c in (columns or [])],
+            'n_rows': n_rows,
+            'dtype': np.dtype(dtype).name,
+            'target_column': target_column,
+            'target_classes': [v.item() if hasattr(v, 'item') else v for v in classes],
+            'categorical': {str(c): list(m) for c, m in categorical.items()},
+        }
+        tmp_meta = os.path.join(directory, 'meta.json.tmp')
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_meta, os.path.join(directory, 'meta.json'))
+        return cls(directory)
+
+    # ---------- accesso ----------
+    def column_indices(self, columns=None):
+        if columns is None:
+            return np.arange(len(self.columns))
+        position = {c: i for i, c in enumerate(self.columns)}
+        return np.array([position[c] for c in columns], dtype=np.intp)
+
+    def iter_chunks(self, chunk_rows=DEFAULT_CHUNK_ROWS, columns=None, rows=None):
+        """Blocchi float64 (righe x colonne richieste); rows = indici posizionali opzionali."""
+        cols = self.column_indices(columns)
+        all_columns = columns is None
+        if rows is None:
+            for start in range(0, self.n_rows, chunk_rows):
+                block = self.X[start:start + chunk_rows]
+                yield np.asarray(block if all_columns else block[:, cols], dtype=np.float64)
+        else:
+            rows = np.sort(np.asarray(rows))
+            for start in range(0, len(rows), chunk_rows):
+                block = self.X[rows[start:start + chunk_rows]]
+                yield np.asarray(block if all_columns else block[:, cols], dtype=np.float64)
+
+    def target(self):
+        """Target come Series di etichette originali."""
+        labels = np.empty(len(self.classes), dtype=object)
+        labels[:] = self.classes
+        return pd.Series(labels[self.y_codes], name=self.target_column)
+
+    def to_frame(self, columns=None):
+        """
+        DataFrame delle feature. Senza `columns` è una vista sul memmap
+        (nessuna copia finché non si selezionano righe/colonne).
+        """
+        if columns is None:
+            return pd.DataFrame(self.X, columns=self.columns, copy=False)
+        return pd.DataFrame(np.asarray(self.X[:, self.column_indices(columns)]), columns=list(columns))
+
+    # ---------- statistiche in streaming ----------
+    def moments(self, chunk_rows=DEFAULT_CHUNK_ROWS, columns=None, rows=None, with_covariance=True):
+        """Una passata a blocchi: conteggi, medie, varianze e (opzionale) covarianze."""
+        n_features = len(self.columns) if columns is None else len(columns)
+        acc = StreamingMoments(n_features, with_covariance=with_covariance)
+        for block in self.iter_chunks(chunk_rows, columns=columns, rows=rows):
+            acc.update(block)
+        return acc
+
+    def fit_scaler(self, chunk_rows=DEFAULT_CHUNK_ROWS, columns=None, rows=None):
+        """StandardScaler fittato a blocchi (partial_fit) sulle righe indicate."""
+        from sklearn.preprocessing import StandardScaler
+
+        scaler = StandardScaler()
+        for block in self.iter_chunks(chunk_rows, columns=columns, rows=rows):
+            scaler.partial_fit(block)
+        return scaler
+
+    def export(self, path, fmt="csv", chunk_rows=DEFAULT_CHUNK_ROWS, sep=','):
+        """Esporta feature + target a blocchi (CSV in append, parquet per row group)."""
+        labels = self.target()
+        with ChunkedDatasetWriter(path, fmt=fmt, sep=sep) as writer:
+            for i, block in enumerate(self.iter_chunks(chunk_rows)):
+                start = i * chunk_rows
+                df = pd.DataFrame(block, columns=self.columns)
+                df[self.target_column] = labels.iloc[start:start + len(block)].values
+                writer.write(df)
+        return path
+
+
+class ChunkedDatasetWriter:
+    """
+    Scrittura a blocchi di un dataset tabellare: CSV in append (header solo
+    sul primo blocco), parquet con un row group per blocco. Nessun blocco
+    resta in memoria dopo write().
+    """
+
+    def __init__(self, path, fmt="csv", sep=','):
+        self.path = path
+        self.fmt = fmt
+        self.sep = sep
+        self._parquet_writer = None
+        self._n_blocks = 0
+
+    def write(self, df):
+        if self.fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            # Nomi colonna sempre stringhe (requisito parquet)
+            table = pa.Table.from_pandas(df.rename(columns=str), preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            first = self._n_blocks == 0
+            df.to_csv(self.path, index=False, sep=self.sep, mode='w' if first else 'a', header=first)
+        self._n_blocks += 1
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def pca_eigenvalues_from_correlation(corr, n_rows):
+    """
+    Autovalori della PCA su dati standardizzati, dalla matrice di correlazione.
+
+    Equivalente a StandardScaler + PCA().explained_variance_ (ddof=1):
+    covarianza dei dati standardizzati = corr * n / (n - 1). Colonne costanti
+    (correlazione NaN) contribuiscono con varianza nulla.
+    """
+    corr = np.nan_to_num(np.asarray(corr, dtype=np.float64))
+    eigenvalues = np.linalg.eigvalsh(corr * n_rows / (n_rows - 1))[::-1]
+    return np.maximum(eigenvalues, 0.0)
@@ -11,10 +11,16 @@ Strategia:
 5a. PCA FORMALE → Fit su train, transform su train e test
 5b. ANOVA F-TEST → Fit su train, transform su train e test
 6. Validation → Monte-Carlo CV con fit corretto per ogni split
+7. (opzionale) Permutation importance + stability selection sugli split
+   della validation, riusando i modelli fittati per split
+
+Ogni stage è memoizzato su disco (stage_cache.py): un re-run ricalcola
+solo gli stage a valle dei parametri modificati.
 
 """
 
 import os
+import sys
 import argparse
 import pandas as pd
 import numpy as np
@@ -32,10 +38,80 @@ import warnings
 import joblib
 warnings.filterwarnings('ignore')
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stage_cache import StageCache, hash_data, hash_file
+from feature_matrix import (FeatureMatrix, ChunkedDatasetWriter, iter_merged_chunks, pca_eigenvalues_from_correlation,
+                            read_dataset_index, DEFAULT_CHUNK_ROWS)
+
+# ===============================================
+# 0. FORMATO DATASET DI OUTPUT
+# ===============================================
+DATASET_FORMATS = ("csv", "parquet")
+
+
+def check_dataset_format(fmt):
+    """Verifica che il formato sia supportato (parquet richiede pyarrow)."""
+    if fmt not in DATASET_FORMATS:
+        raise ValueError(f"Formato dataset '{fmt}' non supportato. Opzioni: {list(DATASET_FORMATS)}")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Il formato parquet richiede pyarrow: pip install pyarrow")
+
+
+def save_dataset(df, output_dir, name, fmt="csv", sep=';'):
+    """
+    Salva un dataset di handoff verso il training.
+
+    csv     → testo, separatore `sep` (compatibile con Excel)
+    parquet → binario, tipizzato, colonnare: lettura quasi istantanea,
+              proiezione per colonne e float senza perdita di precisione
+
+    Returns:
+        str: Percorso del file salvato
+    """
+    if fmt == "parquet":
+        path = os.path.join(output_dir, name + ".parquet")
+        # Nomi colonna sempre stringhe (requisito parquet)
+        df = df.rename(columns=str)
+        df.to_parquet(path, index=False)
+    else:
+        path = os.path.join(output_dir, name + ".csv")
+        df.to_csv(path, index=False, sep=sep)
+    return path
+
+
+def save_dataset_chunks(fm, columns, row_groups, transform, output_dir, name, fmt="csv", sep=';',
+                        chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Come save_dataset, ma a blocchi dalla FeatureMatrix (modalità out-of-core).
+
+    Per ogni gruppo di righe (train, poi test) le colonne `columns` sono lette
+    a blocchi, trasformate con transform(block) -> DataFrame e scritte insieme
+    al target: in memoria c'è un solo blocco alla volta.
+
+    Returns:
+        str: Percorso del file salvato
+    """
+    path = os.path.join(output_dir, f"{name}.{fmt}")
+    labels = fm.target().to_numpy()
+    with ChunkedDatasetWriter(path, fmt=fmt, sep=sep) as writer:
+        for rows in row_groups:
+            rows = np.sort(np.asarray(rows))
+            starts = range(0, len(rows), chunk_rows)
+            for start, block in zip(starts, fm.iter_chunks(chunk_rows, columns=columns, rows=rows)):
+                df = transform(block)
+                df[fm.target_column] = labels[rows[start:start + len(block)]]
+                writer.write(df)
+    return path
+
+
 # ===============================================
 # 1. DATA LOADING
 # ===============================================
-def load_and_merge_data(dataset_custom_path, dataset_egemaps_path, dataset_index_path, output_dir):
+def load_and_merge_data(dataset_custom_path, dataset_egemaps_path, dataset_index_path, output_dir,
+                        output_format="csv"):
     """
     Carica e merge i 3 dataset.
     """
@@ -45,7 +121,7 @@ def load_and_merge_data(dataset_custom_path, dataset_egemaps_path, dataset_index
 
     dataset_custom = pd.read_csv(dataset_custom_path, delimiter=';')
     dataset_egemaps = pd.read_csv(dataset_egemaps_path, delimiter=';')
-    dataset_index = pd.read_excel(dataset_index_path)
+    dataset_index = read_dataset_index(dataset_index_path)
 
     print(f"✓ Dataset custom caricato: {len(dataset_custom)} righe, {len(dataset_custom.columns)} colonne")
     print(f"✓ Dataset eGeMAPS caricato: {len(dataset_egemaps)} righe, {len(dataset_egemaps.columns)} colonne")
@@ -94,41 +170,94 @@ def load_and_merge_data(dataset_custom_path, dataset_egemaps_path, dataset_index
 
     # Salva
     os.makedirs(output_dir, exist_ok=True)
-    full_dataset_path = os.path.join(output_dir, "full_dataset_before_selection.csv")
     full_df = X.copy()
     full_df['Tipo soggetto'] = y
-    full_df.to_csv(full_dataset_path, index=False)
+    full_dataset_path = save_dataset(full_df, output_dir, "full_dataset_before_selection",
+                                     fmt=output_format, sep=',')
     print(f"✓ Dataset completo salvato: {full_dataset_path}")
 
     return X, y
 
+
+def load_and_merge_data_out_of_core(dataset_custom_path, dataset_egemaps_path, dataset_index_path,
+                                    output_dir, output_format="csv", chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Come load_and_merge_data, ma il merge è fatto a blocchi e scritto su disco
+    come FeatureMatrix memory-mapped (output_dir/feature_matrix).
+
+    Returns:
+        FeatureMatrix
+    """
+    print("\n" + "="*70)
+    print("📂 STEP 1: CARICAMENTO E MERGE DATASET (out-of-core)")
+    print("="*70)
+
+    target_column = 'Tipo soggetto'
+    matrix_dir = os.path.join(output_dir, "feature_matrix")
+    fm = FeatureMatrix.from_chunks(
+        iter_merged_chunks(dataset_custom_path, dataset_egemaps_path, dataset_index_path,
+                           chunk_rows=chunk_rows),
+        matrix_dir, target_column
+    )
+
+    print(f"✓ Feature matrix su disco: {matrix_dir}")
+    print(f"\n📊 DATASET FINALE:")
+    print(f"   Campioni: {fm.n_rows}")
+    print(f"   Feature: {len(fm.columns)}")
+    print(f"   Classi: {fm.target().value_counts().to_dict()}")
+
+    ext = "parquet" if output_format == "parquet" else "csv"
+    full_dataset_path = os.path.join(output_dir, f"full_dataset_before_selection.{ext}")
+    fm.export(full_dataset_path, fmt=output_format, chunk_rows=chunk_rows, sep=',')
+    print(f"✓ Dataset completo salvato: {full_dataset_path}")
+
+    return fm
+
+
+def streaming_feature_stats(fm, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Una passata a blocchi sulla FeatureMatrix: matrice di correlazione e
+    varianze (ddof=0) di tutte le feature, per correlation/variance/PCA analysis.
+    """
+    print(f"\n📊 Statistiche in streaming ({fm.n_rows} righe, blocchi da {chunk_rows})...")
+    moments = fm.moments(chunk_rows=chunk_rows)
+    corr = pd.DataFrame(moments.correlation(), index=fm.columns, columns=fm.columns)
+    variances = pd.Series(moments.variance(ddof=0), index=fm.columns)
+    return corr, variances
+
 # ===============================================
 # 2. CORRELATION MATRIX ANALYSIS
 # ===============================================
-def correlation_analysis(X, threshold=0.9, output_dir="output"):
+def correlation_analysis(X, threshold=0.9, output_dir="output", corr_matrix=None):
     """
     Analizza correlazione e rimuove feature altamente correlate.
     OK fare su tutto il dataset (non è un fit che impara dai dati).
+
+    corr_matrix: matrice di correlazione già calcolata (modalità out-of-core,
+    accumulata a blocchi); in questo caso X può essere None e X_reduced è None.
     """
     print("\n" + "="*70)
     print("🔗 STEP 2: CORRELATION MATRIX ANALYSIS")
     print("="*70)
 
-    corr_matrix = X.corr().abs()
+    if corr_matrix is None:
+        corr_matrix = X.corr()
+    corr_matrix = corr_matrix.abs()
+    columns = corr_matrix.columns
 
     # Plot
-    if len(X.columns) <= 50:
+    if len(columns) <= 50:
         plt.figure(figsize=(20, 18))
         sns.heatmap(corr_matrix, annot=False, cmap='coolwarm', center=0,
                     square=True, linewidths=0.5, cbar_kws={"shrink": 0.8},
                     xticklabels=True, yticklabels=True)
-        title = f'Correlation Matrix - {len(X.columns)} Feature'
+        title = f'Correlation Matrix - {len(columns)} Feature'
     else:
         plt.figure(figsize=(16, 14))
         sns.heatmap(corr_matrix, annot=False, cmap='coolwarm', center=0,
                     square=True, linewidths=0.1, cbar_kws={"shrink": 0.8},
                     xticklabels=False, yticklabels=False)
-        title = f'Correlation Matrix - {len(X.columns)} Feature (labels hidden)'
+        title = f'Correlation Matrix - {len(columns)} Feature (labels hidden)'
 
     plt.title(title, fontsize=16)
     plt.tight_layout()
@@ -146,7 +275,7 @@ def correlation_analysis(X, threshold=0.9, output_dir="output"):
                if any(upper_triangle[column] > threshold)]
 
     print(f"\n📊 Analisi correlazione (threshold={threshold}):")
-    print(f"   Feature iniziali: {len(X.columns)}")
+    print(f"   Feature iniziali: {len(columns)}")
     print(f"   Feature altamente correlate (> {threshold}): {len(to_drop)}")
 
     if to_drop:
@@ -158,8 +287,8 @@ def correlation_analysis(X, threshold=0.9, output_dir="output"):
         if len(to_drop) > 20:
             print(f"   ... e altre {len(to_drop)-20} feature")
 
-    X_reduced = X.drop(columns=to_drop)
-    print(f"\n✓ Feature dopo rimozione correlazione: {len(X_reduced.columns)}")
+    X_reduced = X.drop(columns=to_drop) if X is not None else None
+    print(f"\n✓ Feature dopo rimozione correlazione: {len(columns) - len(to_drop)}")
 
     # Salva
     removed_path = os.path.join(output_dir, "removed_features_correlation.txt")
@@ -176,21 +305,30 @@ def correlation_analysis(X, threshold=0.9, output_dir="output"):
 # ===============================================
 # 3. VARIANCE THRESHOLD
 # ===============================================
-def variance_filtering(X, threshold=0.01, output_dir="output"):
+def variance_filtering(X, threshold=0.01, output_dir="output", variances=None):
     """
     Rimuove feature con varianza bassa.
     OK fare su tutto il dataset (threshold fisso).
+
+    variances: Series di varianze (ddof=0) già calcolate (modalità out-of-core,
+    accumulate a blocchi); in questo caso X può essere None e X_reduced è None.
     """
     print("\n" + "="*70)
     print("📉 STEP 3: VARIANCE THRESHOLD FILTERING")
     print("="*70)
 
-    variances = X.var()
-    selector = VarianceThreshold(threshold=threshold)
-    selector.fit(X)
+    if variances is None:
+        variances = X.var()
+        selector = VarianceThreshold(threshold=threshold)
+        selector.fit(X)
+        feature_mask = selector.get_support()
+        columns = X.columns
+    else:
+        # Stesso criterio di VarianceThreshold: varianza (ddof=0) > threshold
+        feature_mask = (variances > threshold).to_numpy()
+        columns = variances.index
 
-    feature_mask = selector.get_support()
-    low_variance_features = X.columns[~feature_mask].tolist()
+    low_variance_features = columns[~feature_mask].tolist()
 
     print(f"\n📊 Analisi varianza (threshold={threshold}):")
     print(f"   Feature con bassa varianza: {len(low_variance_features)}")
@@ -202,8 +340,8 @@ def variance_filtering(X, threshold=0.01, output_dir="output"):
         if len(low_variance_features) > 10:
             print(f"   ... e altre {len(low_variance_features)-10} feature")
 
-    X_reduced = X.loc[:, feature_mask]
-    print(f"\n✓ Feature dopo variance filtering: {len(X_reduced.columns)}")
+    X_reduced = X.loc[:, feature_mask] if X is not None else None
+    print(f"\n✓ Feature dopo variance filtering: {int(feature_mask.sum())}")
 
     # Salva
     removed_path = os.path.join(output_dir, "removed_features_variance.txt")
@@ -219,11 +357,14 @@ def variance_filtering(X, threshold=0.01, output_dir="output"):
 # ===============================================
 # 4. PCA ANALYSIS (per determinare n_components)
 # ===============================================
-def pca_analysis(X, y, output_dir="output"):
+def pca_analysis(X, y, output_dir="output", eigenvalues=None):
     """
     Analizza PCA per determinare numero ottimale di componenti.
     Questa è solo analisi esplorativa, OK fare su tutto il dataset.
     La vera trasformazione PCA sarà fatta solo su train.
+
+    eigenvalues: autovalori già calcolati dalla matrice di correlazione
+    accumulata a blocchi (modalità out-of-core); in questo caso X non è usato.
     """
     print("\n" + "="*70)
     print("🔬 STEP 4: PCA ANALYSIS (Esplorativa)")
@@ -231,16 +372,18 @@ def pca_analysis(X, y, output_dir="output"):
     print("NOTA: Questa è solo per determinare n_components.")
     print("   La trasformazione PCA vera sarà fatta SOLO su train dopo lo split.")
 
-    # Standardizzazione
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    if eigenvalues is None:
+        # Standardizzazione
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
 
-    # PCA completa
-    pca = PCA(random_state=42)
-    pca.fit(X_scaled)
+        # PCA completa
+        pca = PCA(random_state=42)
+        pca.fit(X_scaled)
+        eigenvalues = pca.explained_variance_
 
-    cumsum_variance = np.cumsum(pca.explained_variance_ratio_)
-    eigenvalues = pca.explained_variance_
+    explained_variance_ratio = eigenvalues / eigenvalues.sum()
+    cumsum_variance = np.cumsum(explained_variance_ratio)
 
     # Kaiser criterion
     n_kaiser = np.sum(eigenvalues > 1.0)
@@ -273,7 +416,7 @@ def pca_analysis(X, y, output_dir="output"):
 
     # Varianza per componente
     ax2 = axes[0, 1]
-    ax2.bar(range(1, n_plot+1), pca.explained_variance_ratio_[:n_plot], 
+    ax2.bar(range(1, n_plot+1), explained_variance_ratio[:n_plot], 
             alpha=0.7, color='steelblue')
     ax2.set_xlabel('Componente', fontsize=12)
     ax2.set_ylabel('Varianza Spiegata', fontsize=12)
@@ -379,11 +522,21 @@ def apply_pca_transformation_train_test(X_train, X_test, n_components, output_di
     X_train_pca_df = pd.DataFrame(X_train_pca, columns=columns, index=X_train.index)
     X_test_pca_df = pd.DataFrame(X_test_pca, columns=columns, index=X_test.index)
 
+    _save_pca_outputs(pca, scaler, X_train.columns, output_dir)
+
+    return X_train_pca_df, X_test_pca_df, pca, scaler
+
+
+def _save_pca_outputs(pca, scaler, feature_names, output_dir):
+    """Loadings (csv + heatmap), top contributors e modelli PCA/scaler per il deployment."""
+    n_components = pca.n_components_
+    columns = [f'PC{i+1}' for i in range(n_components)]
+
     # Salva loadings
     loadings = pd.DataFrame(
         pca.components_.T,
         columns=columns,
-        index=X_train.columns
+        index=feature_names
     )
     loadings_path = os.path.join(output_dir, "pca_loadings.csv")
     loadings.to_csv(loadings_path)
@@ -391,7 +544,7 @@ def apply_pca_transformation_train_test(X_train, X_test, n_components, output_di
 
     # Plot loadings heatmap
     n_plot = min(10, n_components)
-    plt.figure(figsize=(14, max(10, len(X_train.columns)//3)))
+    plt.figure(figsize=(14, max(10, len(feature_names)//3)))
     sns.heatmap(loadings.iloc[:, :n_plot], cmap='RdBu_r', center=0,
                 cbar_kws={'label': 'Loading'}, linewidths=0.5)
     plt.title(f'PCA Loadings - Prime {n_plot} Componenti', fontsize=14, fontweight='bold')
@@ -422,11 +575,179 @@ def apply_pca_transformation_train_test(X_train, X_test, n_components, output_di
     print(f"   PCA: {pca_model_path}")
     print(f"   Scaler: {scaler_model_path}")
 
-    return X_train_pca_df, X_test_pca_df, pca, scaler
+
+def _blocks_of_at_least(blocks, min_rows):
+    """
+    Riunisce blocchi consecutivi in modo che ognuno abbia almeno min_rows
+    righe (IncrementalPCA.partial_fit richiede n_samples >= n_components);
+    un resto finale troppo corto è unito all'ultimo blocco.
+    """
+    ready, pending, n_pending = None, [], 0
+    for block in blocks:
+        pending.append(block)
+        n_pending += len(block)
+        if n_pending >= min_rows:
+            if ready is not None:
+                yield ready
+            ready, pending, n_pending = np.vstack(pending), [], 0
+    if pending:
+        ready = np.vstack(pending if ready is None else [ready] + pending)
+    if ready is not None:
+        yield ready
+
+
+def apply_pca_transformation_out_of_core(fm, columns, train_rows, n_components, output_dir="output",
+                                         chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Come apply_pca_transformation_train_test, ma a blocchi sulla FeatureMatrix:
+    scaler (partial_fit) e IncrementalPCA fittati SOLO sulle righe di train.
+    Le trasformazioni di train e test sono scritte a blocchi da save_dataset_chunks.
+
+    Returns:
+        pca: IncrementalPCA fittato (per deployment)
+        scaler: Scaler fittato (per deployment)
+    """
+    from sklearn.decomposition import IncrementalPCA
+
+    print("\n" + "="*70)
+    print(f"⭐ STEP 5A: PCA TRANSFORMATION ({n_components} componenti, out-of-core)")
+    print("="*70)
+    print("✅ FIT PCA SOLO SU TRAIN")
+
+    scaler = fm.fit_scaler(chunk_rows=chunk_rows, columns=columns, rows=train_rows)
+    print(f"\n⚙️ Standardizzazione: fit a blocchi su {len(train_rows)} righe di train")
+
+    pca = IncrementalPCA(n_components=n_components)
+    blocks = fm.iter_chunks(chunk_rows, columns=columns, rows=train_rows)
+    for block in _blocks_of_at_least(blocks, n_components):
+        pca.partial_fit(scaler.transform(block))
+
+    print(f"\n✓ PCA completato:")
+    print(f"   Feature originali: {len(columns)}")
+    print(f"   Componenti principali: {n_components}")
+    print(f"   Varianza spiegata: {pca.explained_variance_ratio_.sum()*100:.2f}%")
+
+    _save_pca_outputs(pca, scaler, columns, output_dir)
+    return pca, scaler
 
 # ===============================================
 # 5B. ANOVA FEATURE SELECTION
 # ===============================================
+def _class_sums(values, codes, n_classes):
+    """Conteggi, somme e somme dei quadrati per classe (valori già centrati)."""
+    counts = np.bincount(codes, minlength=n_classes).astype(np.float64)
+    sums = np.zeros((n_classes, values.shape[1]))
+    sumsq = np.zeros((n_classes, values.shape[1]))
+    for k in range(n_classes):
+        class_values = values[codes == k]
+        sums[k] = class_values.sum(axis=0)
+        sumsq[k] = np.square(class_values).sum(axis=0)
+    return counts, sums, sumsq
+
+
+class AnovaRanker:
+    """
+    Motore ANOVA F-test basato su statistiche sufficienti per classe.
+
+    Conteggi, somme e somme dei quadrati per classe vengono calcolati UNA
+    volta sull'intero dataset. Gli F-score di un sottoinsieme di righe (es. il
+    train di uno split Monte-Carlo) si ottengono sottraendo le statistiche
+    delle sole righe escluse (il test, 20%), senza ripassare il train.
+
+    L'F-statistic è invariante a trasformazioni affini per feature: il ranking
+    non richiede alcuno scaling. Le stesse statistiche danno media e
+    deviazione standard del train per scalare solo le feature selezionate.
+    """
+
+    def __init__(self, X, y):
+        values = np.asarray(X, dtype=np.float64)
+        # Centratura globale (shift: F invariato) per stabilità numerica
+        # delle somme dei quadrati
+        self.shift_ = values.mean(axis=0)
+        self.values_ = values - self.shift_
+        self.classes_, self.codes_ = np.unique(np.asarray(y), return_inverse=True)
+        self.counts_, self.sums_, self.sumsq_ = self._class_stats(np.arange(len(values)))
+
+    @classmethod
+    def from_chunks(cls, chunks, classes):
+        """
+        Ranker accumulato a blocchi (modalità out-of-core).
+
+        chunks: coppie (valori float64, codici classe 0..len(classes)-1).
+        Le righe non restano in memoria: stats/f_scores/select_k/scaling
+        sono disponibili solo senza `exclude`.
+        """
+        ranker = cls.__new__(cls)
+        ranker.classes_ = np.asarray(classes)
+        ranker.values_ = ranker.codes_ = None
+        ranker.shift_ = ranker.counts_ = ranker.sums_ = ranker.sumsq_ = None
+        for block, codes in chunks:
+            if ranker.shift_ is None:
+                # Shift dalla media del primo blocco (F invariato)
+                ranker.shift_ = block.mean(axis=0)
+            stats = _class_sums(block - ranker.shift_, codes, len(ranker.classes_))
+            if ranker.counts_ is None:
+                ranker.counts_, ranker.sums_, ranker.sumsq_ = stats
+            else:
+                ranker.counts_ += stats[0]
+                ranker.sums_ += stats[1]
+                ranker.sumsq_ += stats[2]
+        return ranker
+
+    def _class_stats(self, rows):
+        """Conteggi, somme e somme dei quadrati per classe sulle righe indicate."""
+        return _class_sums(self.values_[rows], self.codes_[rows], len(self.classes_))
+
+    def stats(self, exclude=None):
+        """Statistiche sufficienti di tutte le righe tranne `exclude` (indici posizionali)."""
+        if exclude is None:
+            return self.counts_, self.sums_, self.sumsq_
+        if self.values_ is None:
+            raise ValueError("AnovaRanker.from_chunks non conserva le righe: exclude non supportato")
+        counts, sums, sumsq = self._class_stats(exclude)
+        return self.counts_ - counts, self.sums_ - sums, self.sumsq_ - sumsq
+
+    def f_scores(self, exclude=None):
+        """F-score e p-value (come f_classif) per ogni feature."""
+        from scipy import stats as sp_stats
+
+        counts, sums, sumsq = self.stats(exclude)
+        present = counts > 0
+        counts, sums, sumsq = counts[present], sums[present], sumsq[present]
+
+        n = counts.sum()
+        n_classes = len(counts)
+        total = sums.sum(axis=0)
+        correction = total ** 2 / n
+        ss_total = sumsq.sum(axis=0) - correction
+        ss_between = (sums ** 2 / counts[:, None]).sum(axis=0) - correction
+        ss_within = np.maximum(ss_total - ss_between, 0.0)
+
+        df_between = n_classes - 1
+        df_within = n - n_classes
+        with np.errstate(divide='ignore', invalid='ignore'):
+            f = (ss_between / df_between) / (ss_within / df_within)
+        pvalues = sp_stats.f.sf(f, df_between, df_within)
+        return f, pvalues
+
+    def select_k(self, k, exclude=None):
+        """Indici (in ordine di colonna) delle k feature con F-score più alto, come SelectKBest."""
+        scores, _ = self.f_scores(exclude)
+        scores = np.where(np.isnan(scores), np.finfo(np.float64).min, scores)
+        k = min(k, len(scores))
+        return np.sort(np.argsort(scores, kind="mergesort")[len(scores) - k:])
+
+    def scaling(self, columns, exclude=None):
+        """Media e scala (come StandardScaler) delle colonne indicate, sulle righe non escluse."""
+        counts, sums, sumsq = self.stats(exclude)
+        n = counts.sum()
+        mean_centered = sums[:, columns].sum(axis=0) / n
+        var = np.maximum(sumsq[:, columns].sum(axis=0) / n - mean_centered ** 2, 0.0)
+        scale = np.sqrt(var)
+        scale[scale == 0.0] = 1.0
+        return self.shift_[columns] + mean_centered, scale
+
+
 def select_features_anova_train_test(X_train, X_test, y_train, n_features, output_dir="output"):
     """
     Seleziona feature con ANOVA fittato SOLO su train.
@@ -450,22 +771,24 @@ def select_features_anova_train_test(X_train, X_test, y_train, n_features, outpu
     print("="*70)
     print("✅ FIT ANOVA SOLO SU TRAIN")
 
-    # Standardizzazione: FIT su train, TRANSFORM su train e test
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
-
-    X_train_scaled_df = pd.DataFrame(X_train_scaled, columns=X_train.columns, index=X_train.index)
-    X_test_scaled_df = pd.DataFrame(X_test_scaled, columns=X_test.columns, index=X_test.index)
+    # ANOVA: FIT su train (F-score invariante allo scaling → nessuna
+    # standardizzazione prima della selezione)
+    selector = SelectKBest(f_classif, k=n_features)
+    selector.fit(X_train, y_train)
+    selected_mask = selector.get_support()
 
-    print(f"\n⚙️ Standardizzazione:")
-    print(f"   Train: fit + transform → shape {X_train_scaled_df.shape}")
-    print(f"   Test: transform only → shape {X_test_scaled_df.shape}")
+    # Scaler fittato su train (per deployment: scaler → selector), applicato
+    # ai dati SOLO per il dataset di output, sulle sole feature selezionate
+    scaler = StandardScaler()
+    scaler.fit(X_train)
+    mean_sel = scaler.mean_[selected_mask]
+    scale_sel = scaler.scale_[selected_mask]
+    X_train_anova = (X_train.values[:, selected_mask] - mean_sel) / scale_sel
+    X_test_anova = (X_test.values[:, selected_mask] - mean_sel) / scale_sel
 
-    # ANOVA: FIT su train, TRANSFORM su train e test
-    selector = SelectKBest(f_classif, k=n_features)
-    X_train_anova = selector.fit_transform(X_train_scaled_df, y_train)
-    X_test_anova = selector.transform(X_test_scaled_df)
+    print(f"\n⚙️ Standardizzazione (solo feature selezionate):")
+    print(f"   Train: fit + transform → shape {X_train_anova.shape}")
+    print(f"   Test: transform only → shape {X_test_anova.shape}")
 
     print(f"\n✓ ANOVA Feature Selection completato:")
     print(f"   Feature iniziali: {X_train.shape[1]}")
@@ -473,20 +796,25 @@ def select_features_anova_train_test(X_train, X_test, y_train, n_features, outpu
     print(f"   Train shape: {X_train_anova.shape}")
     print(f"   Test shape: {X_test_anova.shape}")
 
-    # Ottieni scores e feature selezionate
-    scores = selector.scores_
-    feature_scores = pd.DataFrame({
-        'feature': X_train.columns,
-        'score': scores
-    }).sort_values('score', ascending=False)
-
-    selected_mask = selector.get_support()
     selected_features = X_train.columns[selected_mask].tolist()
 
     # Crea DataFrame
     X_train_anova_df = pd.DataFrame(X_train_anova, columns=selected_features, index=X_train.index)
     X_test_anova_df = pd.DataFrame(X_test_anova, columns=selected_features, index=X_test.index)
 
+    _save_anova_outputs(selector, scaler, X_train.columns, n_features, output_dir)
+
+    return X_train_anova_df, X_test_anova_df, selector, scaler, selected_features
+
+
+def _save_anova_outputs(selector, scaler, feature_names, n_features, output_dir):
+    """Ranking F-score (stampa, plot, csv) e selector/scaler per il deployment."""
+    # Ottieni scores
+    feature_scores = pd.DataFrame({
+        'feature': list(feature_names),
+        'score': selector.scores_
+    }).sort_values('score', ascending=False)
+
     print(f"\n📊 Top {min(20, n_features)} feature per ANOVA F-score:")
     for i, row in feature_scores.head(20).iterrows():
         idx = list(feature_scores.index).index(i) + 1
@@ -520,121 +848,187 @@ def select_features_anova_train_test(X_train, X_test, y_train, n_features, outpu
     print(f"   Selector: {selector_path}")
     print(f"   Scaler: {scaler_path}")
 
-    return X_train_anova_df, X_test_anova_df, selector, scaler, selected_features
 
-# ===============================================
-# 6. VALIDATION MONTE-CARLO CORRETTA
-# ===============================================
-def validate_feature_selection_corrected(X_full, X_preprocessed, y, n_components_pca, n_features_anova,
-                                         n_splits=50, test_size=0.2, output_dir="output"):
+def select_features_anova_out_of_core(fm, columns, train_rows, n_features, output_dir="output",
+                                      chunk_rows=DEFAULT_CHUNK_ROWS):
     """
-    Per ogni split, fit PCA/ANOVA solo su train di quel split.
+    Come select_features_anova_train_test, ma a blocchi sulla FeatureMatrix:
+    statistiche per classe (AnovaRanker.from_chunks) e scaler accumulati
+    SOLO sulle righe di train. I dataset di output sono scritti a blocchi
+    da save_dataset_chunks.
 
-    Args:
-        X_full: Dataset completo (prima del preprocessing)
-        X_preprocessed: Dataset dopo correlation + variance
-        y: Target
-        n_components_pca: Numero componenti PCA
-        n_features_anova: Numero feature ANOVA
-        n_splits: Numero di split Monte-Carlo
-        test_size: Percentuale test
-        output_dir: Directory output
+    Returns:
+        selector: SelectKBest fittato (scores_/pvalues_ dalle statistiche a blocchi)
+        scaler: Scaler fittato
+        selected_features: Lista nomi feature selezionate
     """
-    from sklearn.model_selection import StratifiedShuffleSplit
-    from imblearn.over_sampling import SMOTE
-
     print("\n" + "="*70)
-    print(f" STEP 6: VALIDATION MONTE-CARLO CV ({n_splits} split)")
+    print(f"⭐ STEP 5B: ANOVA F-TEST ({n_features} features, out-of-core)")
     print("="*70)
-    print(" FIT su ogni TRAIN split")
+    print("✅ FIT ANOVA SOLO SU TRAIN")
 
-    rf = RandomForestClassifier(n_estimators=200, random_state=42, n_jobs=-1)
-    sss = StratifiedShuffleSplit(n_splits=n_splits, test_size=test_size, random_state=42)
+    train_rows = np.sort(np.asarray(train_rows))
 
-    scores_full = []
-    scores_preprocessed = []
-    scores_pca = []
-    scores_anova = []
+    def chunks():
+        for start, block in zip(range(0, len(train_rows), chunk_rows),
+                                fm.iter_chunks(chunk_rows, columns=columns, rows=train_rows)):
+            yield block, fm.y_codes[train_rows[start:start + len(block)]]
 
-    print(f"\n Strategia: {n_splits} split stratificati ({int((1-test_size)*100)}-{int(test_size*100)})")
-    print(f"  SMOTE su train di ogni split")
-    print(f"  PCA e ANOVA fittati SOLO su train di ogni split")
+    ranker = AnovaRanker.from_chunks(chunks(), fm.classes)
+    scores, pvalues = ranker.f_scores()
 
-    for i, (train_idx, test_idx) in enumerate(sss.split(X_full, y)):
-        if (i + 1) % 10 == 0:
-            print(f"   Split {i+1}/{n_splits} completato...", end='\r')
+    # Equivalente a selector.fit(X_train, y_train): stessi attributi fittati
+    selector = SelectKBest(f_classif, k=n_features)
+    selector.scores_, selector.pvalues_ = scores, pvalues
+    selector.n_features_in_ = len(columns)
+    selector.feature_names_in_ = np.asarray(columns, dtype=object)
+    selected_features = [columns[i] for i in np.flatnonzero(selector.get_support())]
 
-        y_train = y.iloc[train_idx]
-        y_test = y.iloc[test_idx]
+    scaler = fm.fit_scaler(chunk_rows=chunk_rows, columns=columns, rows=train_rows)
 
-        # ===================================================
-        # 1. FULL DATASET (feature iniziali complete)
-        # ===================================================
-        X_train_full = X_full.iloc[train_idx]
-        X_test_full = X_full.iloc[test_idx]
+    print(f"\n✓ ANOVA Feature Selection completato:")
+    print(f"   Feature iniziali: {len(columns)}")
+    print(f"   Feature selezionate: {len(selected_features)}")
 
-        smote = SMOTE(random_state=42)
-        X_train_full_bal, y_train_bal = smote.fit_resample(X_train_full, y_train)
+    _save_anova_outputs(selector, scaler, columns, n_features, output_dir)
+    return selector, scaler, selected_features
+
+# ===============================================
+# 6. VALIDATION MONTE-CARLO CORRETTA
+# ===============================================
+def _monte_carlo_splits(y, n_splits=50, test_size=0.2):
+    """Split stratificati Monte-Carlo (indici train/test), riproducibili."""
+    from sklearn.model_selection import StratifiedShuffleSplit
 
-        rf.fit(X_train_full_bal, y_train_bal)
-        y_pred = rf.predict(X_test_full)
-        scores_full.append(balanced_accuracy_score(y_test, y_pred))
+    sss = StratifiedShuffleSplit(n_splits=n_splits, test_size=test_size, random_state=42)
+    return list(sss.split(np.zeros(len(y)), y))
 
-        # ===================================================
-        # 2. PREPROCESSED (dopo correlation + variance)
-        # ===================================================
-        X_train_prep = X_preprocessed.iloc[train_idx]
-        X_test_prep = X_preprocessed.iloc[test_idx]
 
-        smote = SMOTE(random_state=42)
-        X_train_prep_bal, y_train_bal = smote.fit_resample(X_train_prep, y_train)
+def stratified_subsample(y, max_rows, random_state=42):
+    """Indici posizionali (ordinati) di un sottocampione stratificato di al più max_rows righe."""
+    positions = np.arange(len(y))
+    if max_rows is None or len(y) <= max_rows:
+        return positions
+    sample, _ = train_test_split(positions, train_size=max_rows, random_state=random_state, stratify=y)
+    return np.sort(sample)
 
-        rf.fit(X_train_prep_bal, y_train_bal)
-        y_pred = rf.predict(X_test_prep)
-        scores_preprocessed.append(balanced_accuracy_score(y_test, y_pred))
 
-        # ===================================================
-        # 3. PCA - FIT SOLO SU TRAIN DI QUESTO SPLIT
-        # ===================================================
+def _pca_split_transform(n_components):
+    """Trasformazione per split: scaler + PCA fittati SOLO sul train dello split."""
+    def transform(X_train, X_test, y_train, split):
         scaler_pca = StandardScaler()
-        X_train_prep_scaled = scaler_pca.fit_transform(X_train_prep)
-        X_test_prep_scaled = scaler_pca.transform(X_test_prep)
+        X_train_scaled = scaler_pca.fit_transform(X_train)
+        X_test_scaled = scaler_pca.transform(X_test)
 
-        pca = PCA(n_components=n_components_pca, random_state=42)
-        X_train_pca = pca.fit_transform(X_train_prep_scaled)
-        X_test_pca = pca.transform(X_test_prep_scaled)
+        pca = PCA(n_components=n_components, random_state=42)
+        return pca.fit_transform(X_train_scaled), pca.transform(X_test_scaled)
+    return transform
 
-        smote = SMOTE(random_state=42)
-        X_train_pca_bal, y_train_bal = smote.fit_resample(X_train_pca, y_train)
 
-        rf.fit(X_train_pca_bal, y_train_bal)
-        y_pred = rf.predict(X_test_pca)
-        scores_pca.append(balanced_accuracy_score(y_test, y_pred))
+def _anova_split_transform(n_features, ranker):
+    """
+    Trasformazione per split: ANOVA + scaling fittati SOLO sul train dello split.
 
-        # ===================================================
-        # 4. ANOVA - FIT SOLO SU TRAIN DI QUESTO SPLIT
-        # ===================================================
-        scaler_anova = StandardScaler()
-        X_train_prep_scaled = scaler_anova.fit_transform(X_train_prep)
-        X_test_prep_scaled = scaler_anova.transform(X_test_prep)
+    Le statistiche del train si ottengono dall'AnovaRanker (costruito una volta
+    su tutto il dataset) sottraendo quelle del test; solo le k feature
+    selezionate vengono scalate (serve a SMOTE, basato su distanze).
+    """
+    def transform(X_train, X_test, y_train, split):
+        _, test_idx = split
+        selected = ranker.select_k(n_features, exclude=test_idx)
+        mean, scale = ranker.scaling(selected, exclude=test_idx)
+        X_train_sel = (np.asarray(X_train, dtype=np.float64)[:, selected] - mean) / scale
+        X_test_sel = (np.asarray(X_test, dtype=np.float64)[:, selected] - mean) / scale
+        return X_train_sel, X_test_sel
+    return transform
+
+
+def _fit_split_model(X_train, y_train, n_jobs=-1):
+    """RF fittato sul train di uno split bilanciato con SMOTE (stessi seed per validation e stability)."""
+    from imblearn.over_sampling import SMOTE
 
-        selector = SelectKBest(f_classif, k=n_features_anova)
-        X_train_anova = selector.fit_transform(X_train_prep_scaled, y_train)
-        X_test_anova = selector.transform(X_test_prep_scaled)
+    smote = SMOTE(random_state=42)
+    X_train_bal, y_train_bal = smote.fit_resample(X_train, y_train)
+    model = RandomForestClassifier(n_estimators=200, random_state=42, n_jobs=n_jobs)
+    model.fit(X_train_bal, y_train_bal)
+    return model
 
-        smote = SMOTE(random_state=42)
-        X_train_anova_bal, y_train_bal = smote.fit_resample(X_train_anova, y_train)
 
-        rf.fit(X_train_anova_bal, y_train_bal)
-        y_pred = rf.predict(X_test_anova)
-        scores_anova.append(balanced_accuracy_score(y_test, y_pred))
+def _mc_split_scores(X, y, splits, transform=None, label=""):
+    """
+    Balanced accuracy di RF (SMOTE sul train) per ogni split.
 
-    print(f"   Split {n_splits}/{n_splits} completato... ✓")
+    Args:
+        transform: funzione (X_train, X_test, y_train, (train_idx, test_idx))
+                   -> (X_train_t, X_test_t) fittata solo sul train dello split,
+                   oppure None
+    """
+    scores = []
+    for i, (train_idx, test_idx) in enumerate(splits):
+        if (i + 1) % 10 == 0:
+            print(f"   [{label}] Split {i+1}/{len(splits)} completato...", end='\r')
 
-    scores_full = np.array(scores_full)
-    scores_preprocessed = np.array(scores_preprocessed)
-    scores_pca = np.array(scores_pca)
-    scores_anova = np.array(scores_anova)
+        X_train, X_test = X.iloc[train_idx], X.iloc[test_idx]
+        y_train, y_test = y.iloc[train_idx], y.iloc[test_idx]
+
+        if transform is not None:
+            X_train, X_test = transform(X_train, X_test, y_train, (train_idx, test_idx))
+
+        model = _fit_split_model(X_train, y_train)
+        y_pred = model.predict(X_test)
+        scores.append(balanced_accuracy_score(y_test, y_pred))
+
+    print(f"   [{label}] Split {len(splits)}/{len(splits)} completato... ✓")
+    return np.array(scores)
+
+
+def validate_feature_selection_corrected(X_full, X_preprocessed, y, n_components_pca, n_features_anova,
+                                         n_splits=50, test_size=0.2, output_dir="output", cache=None):
+    """
+    Per ogni split, fit PCA/ANOVA solo su train di quel split.
+
+    Args:
+        X_full: Dataset completo (prima del preprocessing)
+        X_preprocessed: Dataset dopo correlation + variance
+        y: Target
+        n_components_pca: Numero componenti PCA
+        n_features_anova: Numero feature ANOVA
+        n_splits: Numero di split Monte-Carlo
+        test_size: Percentuale test
+        output_dir: Directory output
+        cache: StageCache opzionale; gli score per split di ogni metodo sono
+               memoizzati separatamente (cambiare n_features ricalcola solo PCA/ANOVA)
+    """
+    print("\n" + "="*70)
+    print(f" STEP 6: VALIDATION MONTE-CARLO CV ({n_splits} split)")
+    print("="*70)
+    print(" FIT su ogni TRAIN split")
+
+    print(f"\n Strategia: {n_splits} split stratificati ({int((1-test_size)*100)}-{int(test_size*100)})")
+    print(f"  SMOTE su train di ogni split")
+    print(f"  PCA e ANOVA fittati SOLO su train di ogni split")
+
+    splits = _monte_carlo_splits(y, n_splits=n_splits, test_size=test_size)
+
+    def scores_for(stage, X, transform, params):
+        compute = lambda: _mc_split_scores(X, y, splits, transform, label=stage)
+        key_parts = [hash_data(X), hash_data(y), n_splits, test_size] + params
+        if cache is None:
+            return compute()
+        return cache.memoize(f"validation_{stage}", key_parts, compute)
+
+    # 1. FULL DATASET (feature iniziali complete)
+    scores_full = scores_for("full", X_full, None, [])
+    # 2. PREPROCESSED (dopo correlation + variance)
+    scores_preprocessed = scores_for("preprocessed", X_preprocessed, None, [])
+    # 3. PCA - FIT SOLO SU TRAIN DI OGNI SPLIT
+    scores_pca = scores_for("pca", X_preprocessed, _pca_split_transform(n_components_pca),
+                            [n_components_pca])
+    # 4. ANOVA - FIT SOLO SU TRAIN DI OGNI SPLIT
+    # Statistiche sufficienti ANOVA calcolate una sola volta per tutti gli split
+    ranker = AnovaRanker(X_preprocessed, y)
+    scores_anova = scores_for("anova", X_preprocessed, _anova_split_transform(n_features_anova, ranker),
+                              [n_features_anova])
 
     # Statistiche
     print(f"\n📊 RISULTATI MONTE-CARLO VALIDATION:")
@@ -749,9 +1143,183 @@ def validate_feature_selection_corrected(X_full, X_preprocessed, y, n_components
 
     return scores_full.mean(), scores_preprocessed.mean(), scores_pca.mean(), scores_anova.mean(), best_method
 
+# ===============================================
+# 7. PERMUTATION IMPORTANCE + STABILITY SELECTION
+# ===============================================
+# Dataset preprocessed dei worker di permutation importance (impostato da
+# _init_permutation_worker una volta per processo, non a ogni split)
+_PERMUTATION_DATA = None
+
+
+def _init_permutation_worker(X, y):
+    global _PERMUTATION_DATA
+    _PERMUTATION_DATA = (X, y)
+
+
+def _permutation_importance_split(train_idx, test_idx, n_repeats, seed):
+    """
+    Worker (processo separato): permutation importance su un test split.
+
+    Il RF dello split viene rifittato qui (stessi seed della validation, un
+    core per worker: il parallelismo è già sugli split), così i modelli non
+    restano in memoria né vengono serializzati verso il pool.
+    Importanza = calo medio di balanced accuracy permutando la feature.
+    Le n_repeats permutazioni di una feature sono predette in un'unica
+    chiamata su un blocco impilato.
+    """
+    X, y = _PERMUTATION_DATA
+    model = _fit_split_model(X[train_idx], y[train_idx], n_jobs=1)
+
+    rng = np.random.RandomState(seed)
+    X_test = X[test_idx]
+    y_test = y[test_idx]
+    n_rows, n_cols = X_test.shape
+
+    baseline = balanced_accuracy_score(y_test, model.predict(X_test))
+    X_stack = np.tile(X_test, (n_repeats, 1))
+    importances = np.zeros(n_cols)
+    for j in range(n_cols):
+        original = X_stack[:, j].copy()
+        X_stack[:, j] = np.concatenate([rng.permutation(X_test[:, j]) for _ in range(n_repeats)])
+        y_pred = model.predict(X_stack).reshape(n_repeats, n_rows)
+        drops = [baseline - balanced_accuracy_score(y_test, y_pred[r]) for r in range(n_repeats)]
+        importances[j] = np.mean(drops)
+        X_stack[:, j] = original
+    return importances
+
+
+def permutation_importances(X, y, splits, n_repeats=5, n_jobs=None):
+    """
+    Permutation importance (split x feature) sul test di ogni split Monte-Carlo,
+    in parallelo su un pool di processi che rifitta il RF di ogni split.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    n_workers = n_jobs or os.cpu_count() or 1
+    print(f"   Pool: {n_workers} processi, {n_repeats} permutazioni per feature")
+
+    X_values = np.asarray(X, dtype=np.float64)
+    y_values = np.asarray(y)
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_permutation_worker,
+                             initargs=(X_values, y_values)) as pool:
+        futures = [
+            pool.submit(_permutation_importance_split, train_idx, test_idx, n_repeats, 42 + i)
+            for i, (train_idx, test_idx) in enumerate(splits)
+        ]
+        return np.vstack([f.result() for f in futures])
+
+
+def permutation_stability_selection(X, y, splits, n_features, n_repeats=5,
+                                    stability_threshold=0.6, n_jobs=None, output_dir="output", cache=None):
+    """
+    Permutation importance e stability selection sugli split Monte-Carlo.
+
+    Per ogni split calcola la permutation importance sul test dello split
+    (RF rifittato nei worker, vedi permutation_importances). La frequenza di
+    stabilità di una feature è la frazione di split in cui entra nella top
+    n_features per importanza.
+
+    Args:
+        X: Dataset preprocessed
+        y: Target
+        splits: Lista di (train_idx, test_idx)
+        n_features: Dimensione della top-k per split
+        n_repeats: Permutazioni per feature
+        stability_threshold: Frequenza minima per selezionare una feature
+        n_jobs: Processi del pool (default: tutti i core)
+        output_dir: Directory output
+        cache: StageCache opzionale; le importanze sono memoizzate senza
+               n_features e soglia (cambiarli rifà solo top-k e ranking)
+
+    Returns:
+        ranking: DataFrame con importance media/std e frequenza di stabilità
+        selected_features: Feature stabili selezionate
+    """
+    print("\n" + "="*70)
+    print(f"⭐ STEP 7B: PERMUTATION IMPORTANCE + STABILITY SELECTION ({len(splits)} split)")
+    print("="*70)
+
+    compute = lambda: permutation_importances(X, y, splits, n_repeats, n_jobs)
+    if cache is None:
+        importances = compute()
+    else:
+        importances = cache.memoize("permutation_importance",
+                                    [hash_data(X), hash_data(y), hash_data(list(splits)), n_repeats],
+                                    compute)
+
+    k = min(n_features, X.shape[1])
+    top_k = np.argsort(-importances, axis=1, kind="mergesort")[:, :k]
+    counts = np.bincount(top_k.ravel(), minlength=X.shape[1])
+
+    ranking = pd.DataFrame({
+        'feature': X.columns,
+        'importance_mean': importances.mean(axis=0),
+        'importance_std': importances.std(axis=0),
+        'stability_frequency': counts / len(splits)
+    }).sort_values(['stability_frequency', 'importance_mean'], ascending=False)
+
+    selected_features = ranking.loc[
+        ranking['stability_frequency'] >= stability_threshold, 'feature'
+    ].tolist()
+    if not selected_features:
+        print(f"⚠️ Nessuna feature con frequenza >= {stability_threshold}: uso le top {k} per importanza")
+        selected_features = ranking.sort_values('importance_mean', ascending=False)['feature'].head(k).tolist()
+
+    print(f"\n📊 Top {min(20, len(ranking))} feature per stabilità:")
+    for i, (_, row) in enumerate(ranking.head(20).iterrows(), 1):
+        print(f"   {i}. {row['feature']}: freq={row['stability_frequency']:.2f} "
+              f"imp={row['importance_mean']:+.4f} ± {row['importance_std']:.4f}")
+    print(f"\n✓ Feature stabili (freq >= {stability_threshold}): {len(selected_features)}")
+
+    # Plot
+    top_n = min(30, len(ranking))
+    plt.figure(figsize=(12, 8))
+    plt.barh(range(top_n), ranking.head(top_n)['stability_frequency'].values, color='mediumseagreen')
+    plt.yticks(range(top_n), ranking.head(top_n)['feature'].values)
+    plt.axvline(stability_threshold, color='red', linestyle='--', linewidth=2,
+                label=f'Soglia ({stability_threshold})')
+    plt.xlabel('Frequenza di selezione (top-k per split)', fontsize=12)
+    plt.title(f'Stability Selection - Permutation Importance ({len(splits)} split)',
+              fontsize=14, fontweight='bold')
+    plt.legend()
+    plt.gca().invert_yaxis()
+    plt.tight_layout()
+    plot_path = os.path.join(output_dir, "permutation_stability.png")
+    plt.savefig(plot_path, dpi=300, bbox_inches='tight')
+    plt.close()
+    print(f"✓ Plot salvato: {plot_path}")
+
+    ranked_path = os.path.join(output_dir, "permutation_stability_ranked.csv")
+    ranking.to_csv(ranked_path, index=False)
+    print(f"✓ Ranking salvato: {ranked_path}")
+
+    return ranking, selected_features
+
 # ===============================================
 # MAIN CORRETTO
 # ===============================================
+# File scritti in output_dir dagli stage memoizzati: salvati con la voce
+# di cache e ripristinati a ogni cache hit (plot, ranking, .pkl di deployment)
+STAGE_ARTIFACTS = {
+    "correlation": ("correlation_matrix_full.png", "removed_features_correlation.txt"),
+    "variance": ("removed_features_variance.txt",),
+    "pca_analysis": ("pca_analysis_exploratory.png",),
+    "pca_transform": ("pca_loadings.csv", "pca_loadings_heatmap.png", "pca_fitted.pkl", "scaler_pca.pkl"),
+    "anova_selection": ("anova_features.png", "anova_features_ranked.csv",
+                        "anova_selector_fitted.pkl", "scaler_anova.pkl"),
+    "permutation_stability": ("permutation_stability.png", "permutation_stability_ranked.csv"),
+}
+
+# Moduli della pipeline: il loro hash entra in tutte le chiavi di cache
+PIPELINE_MODULES = ("feature_selection.py", "feature_matrix.py", "stage_cache.py")
+
+
+def pipeline_code_hash():
+    """Hash del codice della pipeline (salt delle chiavi di cache)."""
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    return hash_data([hash_file(os.path.join(module_dir, name)) for name in PIPELINE_MODULES])
+
+
 def main(args):
     """
     Pipeline.
@@ -760,32 +1328,105 @@ def main(args):
     5. SPLIT TRAIN/TEST
     6. PCA e ANOVA fittati SOLO su train
     7. Validation con fit su ogni train split
+
+    Con --out-of-core le feature restano sulla FeatureMatrix su disco: split,
+    PCA, ANOVA e dataset di output procedono a blocchi; validation e
+    permutation importance usano un sottocampione stratificato
+    (--validation-rows). La memoria di picco dipende dal numero di feature.
     """
     print("\n" + "="*70)
     print("🚀 FEATURE SELECTION PIPELINE")
     print("="*70)
     print(f"\nOutput directory: {args.output_dir}")
     os.makedirs(args.output_dir, exist_ok=True)
+    check_dataset_format(args.output_format)
+
+    # Cache degli stage: un re-run ricalcola solo gli stage a valle
+    # dei parametri/input modificati
+    cache_dir = args.cache_dir or os.path.join(args.output_dir, "cache")
+    cache = StageCache(cache_dir, enabled=not args.no_cache, salt=pipeline_code_hash())
+    # Gli stage che scrivono file includono output_dir nella chiave
+    output_key = [os.path.abspath(args.output_dir)]
+    if cache.enabled:
+        print(f"Stage cache: {cache_dir}")
 
     # ===================================================
     # STEP 1-3: PREPROCESSING (OK su tutto il dataset)
     # ===================================================
-    X, y = load_and_merge_data(
-        args.dataset_custom,
-        args.dataset_egemaps,
-        args.dataset_index,
-        args.output_dir
+    input_hashes = [hash_file(p) for p in (args.dataset_custom, args.dataset_egemaps, args.dataset_index)]
+    if args.out_of_core:
+        # Merge a blocchi su memmap; correlazioni e varianze in una passata
+        full_dataset_path = os.path.join(args.output_dir, f"full_dataset_before_selection.{args.output_format}")
+        matrix_dir = cache.memoize(
+            "feature_matrix", input_hashes + [args.output_format] + output_key,
+            lambda: load_and_merge_data_out_of_core(
+                args.dataset_custom,
+                args.dataset_egemaps,
+                args.dataset_index,
+                args.output_dir,
+                output_format=args.output_format,
+                chunk_rows=args.chunksize
+            ).directory,
+            # La voce è un percorso: si ricalcola se matrice o export non esistono più
+            valid=lambda d: os.path.exists(os.path.join(d, "meta.json")) and os.path.exists(full_dataset_path)
+        )
+        fm = FeatureMatrix(matrix_dir)
+        # Le feature restano su disco: in memoria solo target e nomi colonna
+        X, y = None, fm.target()
+        feature_columns = fm.columns
+        corr_full, variances_full = cache.memoize(
+            "streaming_stats", input_hashes,
+            lambda: streaming_feature_stats(fm, chunk_rows=args.chunksize)
+        )
+        data_key = input_hashes
+    else:
+        X, y = cache.memoize(
+            "load_merge", input_hashes + [args.output_format] + output_key,
+            lambda: load_and_merge_data(
+                args.dataset_custom,
+                args.dataset_egemaps,
+                args.dataset_index,
+                args.output_dir,
+                output_format=args.output_format
+            ),
+            output_dir=args.output_dir,
+            artifacts=(f"full_dataset_before_selection.{args.output_format}",)
+        )
+        feature_columns = list(X.columns)
+        data_key = [hash_data(X)]
+
+    print(f"\n📊 Feature iniziali: {len(feature_columns)}")
+
+    removed_corr = cache.memoize(
+        "correlation", data_key + [args.correlation_threshold] + output_key,
+        lambda: correlation_analysis(
+            None if args.out_of_core else X,
+            threshold=args.correlation_threshold, output_dir=args.output_dir,
+            corr_matrix=corr_full if args.out_of_core else None
+        )[1],
+        output_dir=args.output_dir, artifacts=STAGE_ARTIFACTS["correlation"]
     )
-
-    print(f"\n📊 Feature iniziali: {len(X.columns)}")
-
-    X_no_corr, removed_corr = correlation_analysis(
-        X, threshold=args.correlation_threshold, output_dir=args.output_dir
+    columns_no_corr = [c for c in feature_columns if c not in set(removed_corr)]
+
+    removed_var = cache.memoize(
+        "variance", data_key + [columns_no_corr, args.variance_threshold] + output_key,
+        lambda: variance_filtering(
+            None if args.out_of_core else X[columns_no_corr],
+            threshold=args.variance_threshold, output_dir=args.output_dir,
+            variances=variances_full[columns_no_corr] if args.out_of_core else None
+        )[1],
+        output_dir=args.output_dir, artifacts=STAGE_ARTIFACTS["variance"]
     )
+    preprocessed_columns = [c for c in columns_no_corr if c not in set(removed_var)]
+    # Out-of-core: nessuna copia righe x feature, gli stage successivi leggono a blocchi
+    X_preprocessed = None if args.out_of_core else X[preprocessed_columns]
 
-    X_preprocessed, removed_var = variance_filtering(
-        X_no_corr, threshold=args.variance_threshold, output_dir=args.output_dir
-    )
+    # Tabella delle feature rimosse (leggibile dal training senza parsing dei .txt)
+    removed_df = pd.DataFrame({
+        'feature': list(removed_corr) + list(removed_var),
+        'stage': ['correlation'] * len(removed_corr) + ['variance'] * len(removed_var)
+    })
+    save_dataset(removed_df, args.output_dir, "removed_features", fmt=args.output_format)
 
     # ===================================================
     # STEP 4: PCA ANALYSIS ESPLORATIVA
@@ -793,8 +1434,15 @@ def main(args):
     print("\n NOTA: PCA analysis esplorativa per determinare n_components.")
     print("   La trasformazione PCA vera sarà su train dopo lo split.")
 
-    n_components_90, n_components_95 = pca_analysis(
-        X_preprocessed, y, output_dir=args.output_dir
+    n_components_90, n_components_95 = cache.memoize(
+        "pca_analysis", data_key + [preprocessed_columns] + output_key,
+        lambda: pca_analysis(
+            X_preprocessed, y, output_dir=args.output_dir,
+            eigenvalues=pca_eigenvalues_from_correlation(
+                corr_full.loc[preprocessed_columns, preprocessed_columns], fm.n_rows
+            ) if args.out_of_core else None
+        ),
+        output_dir=args.output_dir, artifacts=STAGE_ARTIFACTS["pca_analysis"]
     )
 
     # Determina n_components finale
@@ -813,48 +1461,128 @@ def main(args):
     print("="*70)
     print("⚠️ CRITICO: Questo previene data leakage!")
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X_preprocessed, y,
-        test_size=0.2,
-        random_state=42,
-        stratify=y
-    )
+    if args.out_of_core:
+        # Indici posizionali sulla FeatureMatrix (stesso shuffle dello split in memoria);
+        # chiavi sugli hash degli input, non sui dati
+        train_index, test_index = cache.memoize(
+            "split", input_hashes,
+            lambda: tuple(train_test_split(np.arange(fm.n_rows), test_size=0.2, random_state=42, stratify=y))
+        )
+        y_train, y_test = y.iloc[train_index], y.iloc[test_index]
+        train_test_hash = data_key + [preprocessed_columns]
+    else:
+        def split_indices():
+            X_tr, X_te = train_test_split(
+                X_preprocessed,
+                test_size=0.2,
+                random_state=42,
+                stratify=y
+            )
+            return X_tr.index, X_te.index
+
+        train_index, test_index = cache.memoize(
+            "split", [hash_data(X_preprocessed.index), hash_data(y)], split_indices
+        )
+        X_train, X_test = X_preprocessed.loc[train_index], X_preprocessed.loc[test_index]
+        y_train, y_test = y.loc[train_index], y.loc[test_index]
+        train_test_hash = [hash_data(X_train), hash_data(X_test), hash_data(y_train)]
+    n_train, n_test = len(train_index), len(test_index)
 
-    print(f"\n✓ Train set: {len(X_train)} campioni ({len(X_train)/len(X_preprocessed)*100:.1f}%)")
-    print(f"✓ Test set: {len(X_test)} campioni ({len(X_test)/len(X_preprocessed)*100:.1f}%)")
+    print(f"\n✓ Train set: {n_train} campioni ({n_train/(n_train + n_test)*100:.1f}%)")
+    print(f"✓ Test set: {n_test} campioni ({n_test/(n_train + n_test)*100:.1f}%)")
     print(f"  Train - Classi: {y_train.value_counts().to_dict()}")
     print(f"  Test - Classi: {y_test.value_counts().to_dict()}")
 
-    # Anche per X originale e X senza correlazione (per validation)
-    X_train_full = X.loc[X_train.index]
-    X_test_full = X.loc[X_test.index]
-
     # ===================================================
     # STEP 6A: PCA TRANSFORMATION (FIT SOLO SU TRAIN)
     # ===================================================
-    X_train_pca, X_test_pca, pca_fitted, scaler_pca = apply_pca_transformation_train_test(
-        X_train, X_test, n_features_final, output_dir=args.output_dir
-    )
+    if args.out_of_core:
+        pca_fitted, scaler_pca = cache.memoize(
+            "pca_transform", train_test_hash + [n_features_final] + output_key,
+            lambda: apply_pca_transformation_out_of_core(
+                fm, preprocessed_columns, train_index, n_features_final,
+                output_dir=args.output_dir, chunk_rows=args.chunksize
+            ),
+            output_dir=args.output_dir, artifacts=STAGE_ARTIFACTS["pca_transform"]
+        )
+    else:
+        X_train_pca, X_test_pca, pca_fitted, scaler_pca = cache.memoize(
+            "pca_transform", train_test_hash + [n_features_final] + output_key,
+            lambda: apply_pca_transformation_train_test(
+                X_train, X_test, n_features_final, output_dir=args.output_dir
+            ),
+            output_dir=args.output_dir, artifacts=STAGE_ARTIFACTS["pca_transform"]
+        )
 
     # ===================================================
     # STEP 6B: ANOVA SELECTION (FIT SOLO SU TRAIN)
     # ===================================================
-    X_train_anova, X_test_anova, selector_fitted, scaler_anova, selected_features = \
-        select_features_anova_train_test(
-            X_train, X_test, y_train, n_features_final, output_dir=args.output_dir
+    if args.out_of_core:
+        selector_fitted, scaler_anova, selected_features = cache.memoize(
+            "anova_selection", train_test_hash + [n_features_final] + output_key,
+            lambda: select_features_anova_out_of_core(
+                fm, preprocessed_columns, train_index, n_features_final,
+                output_dir=args.output_dir, chunk_rows=args.chunksize
+            ),
+            output_dir=args.output_dir, artifacts=STAGE_ARTIFACTS["anova_selection"]
+        )
+    else:
+        X_train_anova, X_test_anova, selector_fitted, scaler_anova, selected_features = cache.memoize(
+            "anova_selection", train_test_hash + [n_features_final] + output_key,
+            lambda: select_features_anova_train_test(
+                X_train, X_test, y_train, n_features_final, output_dir=args.output_dir
+            ),
+            output_dir=args.output_dir, artifacts=STAGE_ARTIFACTS["anova_selection"]
         )
 
     # ===================================================
     # STEP 7: VALIDATION MONTE-CARLO
     # ===================================================
+    if args.out_of_core:
+        # Validation e permutation importance su un sottocampione stratificato:
+        # memoria limitata da --validation-rows, non dal numero di righe
+        validation_index = stratified_subsample(y, args.validation_rows)
+        X_val = pd.DataFrame(np.asarray(fm.X[validation_index]), columns=fm.columns)
+        X_val_preprocessed = X_val[preprocessed_columns]
+        y_val = y.iloc[validation_index].reset_index(drop=True)
+        print(f"\n🔎 Validation su sottocampione stratificato: {len(validation_index)}/{fm.n_rows} righe")
+        stability_data_key = data_key + [preprocessed_columns, args.validation_rows]
+    else:
+        X_val, X_val_preprocessed, y_val = X, X_preprocessed, y
+        stability_data_key = [hash_data(X_preprocessed), hash_data(y)]
+
+    stability_key = stability_data_key + [50, n_features_final,
+                                          args.n_repeats, args.stability_threshold] + output_key
+
     acc_full, acc_prep, acc_pca, acc_anova, best_method = validate_feature_selection_corrected(
-        X, X_preprocessed, y,
+        X_val, X_val_preprocessed, y_val,
         n_components_pca=n_features_final,
         n_features_anova=n_features_final,
         n_splits=50,
-        output_dir=args.output_dir
+        output_dir=args.output_dir,
+        cache=cache
     )
 
+    # ===================================================
+    # STEP 7B: PERMUTATION IMPORTANCE + STABILITY SELECTION
+    # ===================================================
+    stable_features = None
+    if args.permutation_importance:
+        _, stable_features = cache.memoize(
+            "permutation_stability", stability_key,
+            lambda: permutation_stability_selection(
+                X_val_preprocessed, y_val,
+                _monte_carlo_splits(y_val, n_splits=50),
+                n_features=n_features_final,
+                n_repeats=args.n_repeats,
+                stability_threshold=args.stability_threshold,
+                n_jobs=args.n_jobs,
+                output_dir=args.output_dir,
+                cache=cache
+            ),
+            output_dir=args.output_dir, artifacts=STAGE_ARTIFACTS["permutation_stability"]
+        )
+
     # ===================================================
     # STEP 8: SALVATAGGIO DATASET FINALI
     # ===================================================
@@ -862,28 +1590,60 @@ def main(args):
     print("💾 SALVATAGGIO DATASET FINALI")
     print("="*70)
 
-    # Dataset PCA completo (train + test)
-    X_pca_complete = pd.concat([X_train_pca, X_test_pca])
-    y_complete = pd.concat([y_train, y_test])
-    X_pca_complete['Tipo soggetto'] = y_complete
+    if args.out_of_core:
+        # Train poi test, a blocchi dalla FeatureMatrix con i modelli fittati su train
+        row_groups = (train_index, test_index)
+        pc_columns = [f'PC{i+1}' for i in range(n_features_final)]
+        pca_path = save_dataset_chunks(
+            fm, preprocessed_columns, row_groups,
+            lambda block: pd.DataFrame(pca_fitted.transform(scaler_pca.transform(block)), columns=pc_columns),
+            args.output_dir, "dataset_PCA", fmt=args.output_format, chunk_rows=args.chunksize
+        )
+        selected_mask = selector_fitted.get_support()
+        mean_sel, scale_sel = scaler_anova.mean_[selected_mask], scaler_anova.scale_[selected_mask]
+        anova_path = save_dataset_chunks(
+            fm, preprocessed_columns, row_groups,
+            lambda block: pd.DataFrame((block[:, selected_mask] - mean_sel) / scale_sel, columns=selected_features),
+            args.output_dir, "dataset_ANOVA", fmt=args.output_format, chunk_rows=args.chunksize
+        )
+    else:
+        # Dataset PCA completo (train + test)
+        X_pca_complete = pd.concat([X_train_pca, X_test_pca])
+        y_complete = pd.concat([y_train, y_test])
+        X_pca_complete['Tipo soggetto'] = y_complete
+        pca_path = save_dataset(X_pca_complete, args.output_dir, "dataset_PCA", fmt=args.output_format)
+
+        # Dataset ANOVA completo (train + test)
+        X_anova_complete = pd.concat([X_train_anova, X_test_anova])
+        X_anova_complete['Tipo soggetto'] = y_complete
+        anova_path = save_dataset(X_anova_complete, args.output_dir, "dataset_ANOVA", fmt=args.output_format)
 
-    pca_path = os.path.join(args.output_dir, "dataset_PCA.csv")
-    X_pca_complete.to_csv(pca_path, index=False, sep=';')
     print(f"\n✓ Dataset PCA salvato: {pca_path}")
     print(f"  Contiene: {n_features_final} componenti PC1, PC2, ...")
-    print(f"  Train: {len(X_train_pca)}, Test: {len(X_test_pca)}")
+    print(f"  Train: {n_train}, Test: {n_test}")
 
-    # Dataset ANOVA completo (train + test)
-    X_anova_complete = pd.concat([X_train_anova, X_test_anova])
-    X_anova_complete['Tipo soggetto'] = y_complete
-
-    anova_path = os.path.join(args.output_dir, "dataset_ANOVA.csv")
-    X_anova_complete.to_csv(anova_path, index=False, sep=';')
     print(f"\n✓ Dataset ANOVA salvato: {anova_path}")
     print(f"  Contiene: {n_features_final} feature originali")
     print(f"  Feature: {', '.join(selected_features[:10])}...")
-    print(f"  Train: {len(X_train_anova)}, Test: {len(X_test_anova)}")
-
+    print(f"  Train: {n_train}, Test: {n_test}")
+
+    # Dataset STABILITY (feature stabili per permutation importance, non scalate)
+    stability_path = None
+    if stable_features is not None:
+        if args.out_of_core:
+            stability_path = save_dataset_chunks(
+                fm, stable_features, (train_index, test_index),
+                lambda block: pd.DataFrame(block, columns=stable_features),
+                args.output_dir, "dataset_STABILITY", fmt=args.output_format, chunk_rows=args.chunksize
+            )
+        else:
+            X_stability_complete = pd.concat([X_train[stable_features], X_test[stable_features]])
+            X_stability_complete['Tipo soggetto'] = y_complete
+            stability_path = save_dataset(X_stability_complete, args.output_dir, "dataset_STABILITY",
+                                          fmt=args.output_format)
+        print(f"\n✓ Dataset STABILITY salvato: {stability_path}")
+        print(f"  Contiene: {len(stable_features)} feature stabili")
+        print(f"  Train: {n_train}, Test: {n_test}")
 
     # ===================================================
     # SUMMARY FINALE
@@ -891,12 +1651,13 @@ def main(args):
     print("\n" + "="*70)
     print("📋 SUMMARY FINALE")
     print("="*70)
-    print(f"Feature iniziali: {len(X.columns)}")
-    print(f"Dopo correlation: {len(X_no_corr.columns)} (-{len(removed_corr)})")
-    print(f"Dopo variance: {len(X_preprocessed.columns)} (-{len(removed_var)})")
-    print(f"\n✅ SPLIT 80-20: {len(X_train)} train, {len(X_test)} test")
+    print(f"Feature iniziali: {len(feature_columns)}")
+    print(f"Dopo correlation: {len(columns_no_corr)} (-{len(removed_corr)})")
+    print(f"Dopo variance: {len(preprocessed_columns)} (-{len(removed_var)})")
+    print(f"\n✅ SPLIT 80-20: {n_train} train, {n_test} test")
     print(f"\nFeature/Componenti finali: {n_features_final}")
-    print(f"Riduzione: {len(X.columns)} → {n_features_final} ({(1-n_features_final/len(X.columns))*100:.1f}%)")
+    print(f"Riduzione: {len(feature_columns)} → {n_features_final} "
+          f"({(1-n_features_final/len(feature_columns))*100:.1f}%)")
 
     print(f"\nPerformance Validation (Monte-Carlo CV):")
     print(f"  Full dataset: {acc_full:.3f}")
@@ -918,6 +1679,8 @@ def main(args):
     print(f"  - {anova_path}")
     print(f"  - pca_fitted.pkl, scaler_pca.pkl")
     print(f"  - anova_selector_fitted.pkl, scaler_anova.pkl")
+    if stability_path:
+        print(f"  - {stability_path}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -942,7 +1705,7 @@ if __name__ == "__main__":
         "--dataset-index",
         type=str,
         required=True,
-        help="Path al file dataset_index.xlsx"
+        help="Path al dataset_index (.sqlite di build_index, .xlsx o .csv)"
     )
 
     parser.add_argument(
@@ -973,5 +1736,75 @@ if __name__ == "__main__":
         help="N° componenti/feature (default: auto da PCA 95%%)"
     )
 
+    parser.add_argument(
+        "--permutation-importance",
+        action="store_true",
+        help="Abilita lo stage di permutation importance + stability selection"
+    )
+
+    parser.add_argument(
+        "--n-repeats",
+        type=int,
+        default=5,
+        help="Permutazioni per feature nella permutation importance (default: 5)"
+    )
+
+    parser.add_argument(
+        "--stability-threshold",
+        type=float,
+        default=0.6,
+        help="Frequenza minima di selezione per la stability selection (default: 0.6)"
+    )
+
+    parser.add_argument(
+        "--n-jobs",
+        type=int,
+        default=None,
+        help="Processi per la permutation importance (default: tutti i core)"
+    )
+
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        default="csv",
+        choices=list(DATASET_FORMATS),
+        help="Formato dei dataset di output: csv (testo) o parquet (binario, colonnare)"
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory della stage cache (default: <output-dir>/cache)"
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Disabilita la stage cache e ricalcola tutti gli stage"
+    )
+
+    parser.add_argument(
+        "--out-of-core",
+        action="store_true",
+        help="Merge a blocchi su feature matrix memory-mapped; correlazioni, varianze e PCA "
+             "esplorativa da statistiche accumulate in streaming (corpora molto grandi)"
+    )
+
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=DEFAULT_CHUNK_ROWS,
+        help=f"Righe per blocco in modalità --out-of-core (default: {DEFAULT_CHUNK_ROWS})"
+    )
+
+    parser.add_argument(
+        "--validation-rows",
+        type=int,
+        default=20000,
+        help="Modalità --out-of-core: righe del sottocampione stratificato usato per la validation "
+             "Monte-Carlo e la permutation importance (default: 20000)"
+    )
+
     args = parser.parse_args()
     main(args)
\ No newline at end of file
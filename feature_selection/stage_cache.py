@@ -0,0 +1,180 @@
+"""
+Stage Cache per la Feature Selection Pipeline
+
+Memoizza su disco l'output di ogni stage (merge X/y, feature rimosse,
+trasformatori fittati, score per split) indicizzandolo con un hash del
+CONTENUTO degli input e dei parametri dello stage.
+
+Un re-run in cui cambia solo un parametro (es. n_features) trova in cache
+tutti gli stage a monte e ricalcola solo quelli a valle della modifica.
+
+Gli stage che scrivono file in output_dir (plot, .pkl per il deployment,
+ranking) dichiarano i loro artifacts: vengono copiati accanto alla voce
+di cache e ripristinati in output_dir a ogni cache hit, così i file su
+disco corrispondono sempre ai valori riusati.
+"""
+
+import os
+import shutil
+import hashlib
+import joblib
+import numpy as np
+import pandas as pd
+
+_MISSING = object()
+
+
+# ===============================================
+# HASHING DEL CONTENUTO
+# ===============================================
+def hash_file(path, chunk_size=1 << 20):
+    """SHA-256 del contenuto di un file (letto a blocchi)."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_data(obj):
+    """
+    Hash deterministico di DataFrame, Series, array numpy, liste/tuple,
+    dizionari e scalari (parametri degli stage).
+    """
+    h = hashlib.sha256()
+    _update_hash(h, obj)
+    return h.hexdigest()
+
+
+def _update_hash(h, obj):
+    if isinstance(obj, pd.DataFrame):
+        h.update(b'DataFrame')
+        _update_hash(h, [str(c) for c in obj.columns])
+        _update_hash(h, [str(t) for t in obj.dtypes])
+        h.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+    elif isinstance(obj, pd.Series):
+        h.update(b'Series')
+        h.update(str(obj.name).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+    elif isinstance(obj, pd.Index):
+        h.update(b'Index')
+        h.update(pd.util.hash_pandas_object(obj).values.tobytes())
+    elif isinstance(obj, np.ndarray):
+        h.update(b'ndarray')
+        h.update(f"{obj.dtype}{obj.shape}".encode('utf-8'))
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"seq{len(obj)}".encode('utf-8'))
+        for item in obj:
+            _update_hash(h, item)
+    elif isinstance(obj, dict):
+        h.update(f"dict{len(obj)}".encode('utf-8'))
+        for k in sorted(obj, key=str):
+            _update_hash(h, k)
+            _update_hash(h, obj[k])
+    else:
+        h.update(f"{type(obj).__name__}:{obj!r}".encode('utf-8'))
+
+
+# ===============================================
+# CACHE SU DISCO
+# ===============================================
+class StageCache:
+    """
+    Cache content-addressed degli stage, salvata con joblib in cache_dir.
+
+    Ogni voce è identificata da nome stage + hash degli input/parametri:
+    se cambia un input cambia la chiave, quindi non serve invalidazione.
+    salt (es. hash del codice della pipeline) entra in tutte le chiavi:
+    una modifica al codice non riusa voci calcolate dalla versione precedente.
+    """
+
+    def __init__(self, cache_dir, enabled=True, salt=None):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.salt = salt
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, stage, *parts):
+        """Chiave della voce: nome stage + hash degli input (e del salt)."""
+        return f"{stage}_{hash_data([stage, self.salt, list(parts)])[:24]}"
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def _files_dir(self, key):
+        return os.path.join(self.cache_dir, key + ".files")
+
+    def _store_artifacts(self, key, output_dir, artifacts):
+        """Copia gli artifacts (nomi di file in output_dir) accanto alla voce."""
+        files_dir = self._files_dir(key)
+        tmp_dir = files_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name in artifacts:
+            src = os.path.join(output_dir, name)
+            if os.path.exists(src):
+                shutil.copy2(src, os.path.join(tmp_dir, name))
+        shutil.rmtree(files_dir, ignore_errors=True)
+        os.replace(tmp_dir, files_dir)
+
+    def restore_artifacts(self, key, output_dir, artifacts):
+        """
+        Ripristina in output_dir gli artifacts salvati con la voce.
+        False se la voce non ha i file (es. salvata senza artifacts): va ricalcolata.
+        """
+        files_dir = self._files_dir(key)
+        if not os.path.isdir(files_dir):
+            return False
+        os.makedirs(output_dir, exist_ok=True)
+        for name in artifacts:
+            src = os.path.join(files_dir, name)
+            if os.path.exists(src):
+                shutil.copy2(src, os.path.join(output_dir, name))
+        return True
+
+    def get(self, key, default=None):
+        if not self.enabled:
+            return default
+        path = self._path(key)
+        if not os.path.exists(path):
+            return default
+        try:
+            return joblib.load(path)
+        except Exception as e:
+            print(f"⚠️ Cache corrotta, ricalcolo ({os.path.basename(path)}): {e}")
+            return default
+
+    def put(self, key, value, output_dir=None, artifacts=()):
+        if not self.enabled:
+            return
+        if artifacts:
+            # Prima i file: una voce .pkl non esiste mai senza i suoi artifacts
+            self._store_artifacts(key, output_dir, artifacts)
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        # Scrittura atomica: un run interrotto non lascia voci a metà
+        joblib.dump(value, tmp_path)
+        os.replace(tmp_path, path)
+
+    def memoize(self, stage, key_parts, compute, output_dir=None, artifacts=(), valid=None):
+        """
+        Restituisce l'output in cache dello stage, oppure lo calcola con
+        compute() e lo salva.
+
+        artifacts: file che compute() scrive in output_dir; salvati con la
+        voce e ripristinati in output_dir a ogni cache hit.
+        valid: funzione opzionale valore -> bool; un valore in cache non valido
+        (es. un percorso che non esiste più) viene ricalcolato.
+        """
+        key = self.key(stage, *key_parts)
+        value = self.get(key, _MISSING)
+        if value is not _MISSING and valid is not None and not valid(value):
+            value = _MISSING
+        if value is not _MISSING and (not artifacts or self.restore_artifacts(key, output_dir, artifacts)):
+            print(f"\n♻️ Cache hit: {stage} (riuso output precedente)")
+            return value
+        value = compute()
+        self.put(key, value, output_dir, artifacts)
+        return value
@@ -0,0 +1,32 @@
+"""
+FeatureMatrix.from_chunks: stessi valori e stessi codici categorici del
+percorso in memoria (float64, LabelEncoder).
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'feature_selection')))
+
+from feature_matrix import FeatureMatrix
+
+
+def _chunks():
+    yield pd.DataFrame({'f0': [0.1, 1e-9 + 1.0], 'lang': ['it', 'en'], 'y': ['Pat', 'Ctrl']})
+    yield pd.DataFrame({'f0': [3.3333333333, 2.0], 'lang': ['fr', 'en'], 'y': ['Ctrl', 'Pat']})
+
+
+def test_from_chunks_matches_in_memory_encoding(tmp_path):
+    fm = FeatureMatrix.from_chunks(_chunks(), str(tmp_path), 'y')
+    df = pd.concat(_chunks(), ignore_index=True)
+
+    X = fm.to_frame()
+    assert fm.dtype == np.float64
+    np.testing.assert_array_equal(X['f0'].to_numpy(), df['f0'].to_numpy())
+    np.testing.assert_array_equal(X['lang'].to_numpy(), LabelEncoder().fit_transform(df['lang']))
+    assert fm.meta['categorical']['lang'] == ['en', 'fr', 'it']
+    assert fm.target().tolist() == df['y'].tolist()
@@ -0,0 +1,38 @@
+"""
+WAV concatenati per un solo SMILExtract: segmenti in secondi per frameList
+e silenzio dopo l'ultimo file (openSMILE scarta un segmento che arriva alla
+fine dell'input).
+"""
+
+import os
+import sys
+import wave
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from feature_extractors.smile_batch import write_batch_wav
+from feature_extractors.smile_config import format_segments
+
+
+def _write_wav(path, n_frames, sr=16000):
+    with wave.open(str(path), 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(b'\x01\x00' * n_frames)
+
+
+def test_last_segment_ends_before_end_of_input(tmp_path):
+    _write_wav(tmp_path / "a.wav", 8000)
+    _write_wav(tmp_path / "b.wav", 4000)
+    out = tmp_path / "batch.wav"
+
+    segments = write_batch_wav([str(tmp_path / "a.wav"), str(tmp_path / "b.wav")], str(out), gap=0.5)
+
+    assert segments == [(0.0, 0.5), (1.0, 1.25)]
+    with wave.open(str(out), 'rb') as w:
+        assert w.getnframes() / w.getframerate() == 1.75
+
+
+def test_segments_are_formatted_in_seconds():
+    assert format_segments([(0.0, 0.5), (1.0, 1.25)]) == "0.000s-0.500s,1.000s-1.250s"
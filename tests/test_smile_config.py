@@ -0,0 +1,192 @@
+"""
+Parsing dei config openSMILE con il layout delle distribuzioni stock
+(compare/, gemaps/v01b/, egemaps/v02/, shared/): include da riga di comando
+\\{\\cm[opzione{default}:...]} dichiarati una volta e poi riferiti per nome.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from feature_extractors import smile_config
+from feature_extractors.smile_config import _cached_config, parse_config
+
+
+SHARED = {
+    "shared/standard_wave_input.conf.inc": """
+[componentInstances:cComponentManager]
+instance[waveIn].type=cWaveSource
+
+[waveIn:cWaveSource]
+writer.dmLevel=wave
+filename=\\cm[inputfile(I){test.wav}:name of input file]
+""",
+    "shared/BufferModeRb.conf.inc": "writer.levelconf.isRb = 1\nwriter.levelconf.growDyn = 0\n",
+    "shared/BufferModeRbLag.conf.inc": "writer.levelconf.isRb = 1\nwriter.levelconf.nT = 500\n",
+    "shared/FrameModeFunctionals.conf.inc": "frameMode = full\n",
+}
+
+COMPARE = {
+    "compare/ComParE_2016.conf": """
+[componentInstances:cComponentManager]
+instance[dataMemory].type=cDataMemory
+
+\\{\\cm[source{../shared/standard_wave_input.conf.inc}:path to included config to set up waveform input]}
+\\{ComParE_2016_core.lld.conf.inc}
+\\{ComParE_2016_core.func.conf.inc}
+\\{\\cm[sink{?}:include external sink]}
+""",
+    "compare/ComParE_2016_core.lld.conf.inc": """
+[componentInstances:cComponentManager]
+instance[is13_frame60].type=cFramer
+instance[is13_energy].type=cEnergy
+
+[is13_frame60:cFramer]
+reader.dmLevel=wave
+writer.dmLevel=is13_frame60
+\\{\\cm[bufferModeRbConf{../shared/BufferModeRb.conf.inc}:path to included config to set the buffer mode for the standard ringbuffer levels]}
+
+[is13_energy:cEnergy]
+reader.dmLevel=is13_frame60
+writer.dmLevel=is13_energy
+\\{\\cm[bufferModeRbConf]}
+""",
+    "compare/ComParE_2016_core.func.conf.inc": """
+[componentInstances:cComponentManager]
+instance[is13_functionalsA].type=cFunctionals
+
+[is13_functionalsA:cFunctionals]
+reader.dmLevel=is13_energy
+writer.dmLevel=is13_functionalsA
+\\{\\cm[bufferModeRbConf]}
+\\{\\cm[frameModeFunctionalsConf{../shared/FrameModeFunctionals.conf.inc}:path to included config to set frame mode for all functionals]}
+""",
+}
+
+EGEMAPS = {
+    "egemaps/v02/eGeMAPSv02.conf": """
+[componentInstances:cComponentManager]
+instance[dataMemory].type=cDataMemory
+
+\\{\\cm[source{../../shared/standard_wave_input.conf.inc}:path to included config to set up waveform input]}
+\\{../../gemaps/v01b/GeMAPSv01b_core.lld.conf.inc}
+\\{eGeMAPSv02_core.lld.conf.inc}
+\\{eGeMAPSv02_core.func.conf.inc}
+""",
+    "gemaps/v01b/GeMAPSv01b_core.lld.conf.inc": """
+[componentInstances:cComponentManager]
+instance[gemapsv01b_frame60].type=cFramer
+
+[gemapsv01b_frame60:cFramer]
+reader.dmLevel=wave
+writer.dmLevel=gemapsv01b_frame60
+\\{\\cm[bufferModeRbConf{../../shared/BufferModeRb.conf.inc}:path to included config to set the buffer mode for the standard ringbuffer levels]}
+\\{\\cm[bufferModeRbLagConf{../../shared/BufferModeRbLag.conf.inc}:path to included config to set the buffer mode for lagged levels]}
+""",
+    "egemaps/v02/eGeMAPSv02_core.lld.conf.inc": """
+[componentInstances:cComponentManager]
+instance[egemapsv02_energy].type=cEnergy
+
+[egemapsv02_energy:cEnergy]
+reader.dmLevel=gemapsv01b_frame60
+writer.dmLevel=egemapsv02_energy
+\\{\\cm[bufferModeRbLagConf]}
+""",
+    "egemaps/v02/eGeMAPSv02_core.func.conf.inc": """
+[componentInstances:cComponentManager]
+instance[egemapsv02_functionals].type=cFunctionals
+
+[egemapsv02_functionals:cFunctionals]
+reader.dmLevel=egemapsv02_energy
+writer.dmLevel=egemapsv02_functionals
+\\{\\cm[bufferModeRbConf]}
+\\{\\cm[frameModeFunctionalsConf]}
+""",
+}
+
+
+def _write_tree(root, files):
+    for rel_path, text in files.items():
+        path = os.path.join(root, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+
+def test_compare_reuses_include_defaults_by_name(tmp_path):
+    _write_tree(tmp_path, {**SHARED, **COMPARE})
+
+    _, instances, sections = parse_config(os.path.join(tmp_path, "compare", "ComParE_2016.conf"))
+
+    # sink{?}: include saltato, nessun componente di output
+    assert list(instances) == ['dataMemory', 'waveIn', 'is13_frame60', 'is13_energy', 'is13_functionalsA']
+    # Default dichiarato in lld.conf.inc, riusato dai riferimenti \cm[bufferModeRbConf] successivi
+    for name in ('is13_frame60', 'is13_energy', 'is13_functionalsA'):
+        assert 'writer.levelconf.isRb = 1' in sections[name]
+    assert 'frameMode = full' in sections['is13_functionalsA']
+
+
+def test_egemaps_skips_options_without_default(tmp_path):
+    _write_tree(tmp_path, {**SHARED, **EGEMAPS})
+
+    _, instances, sections = parse_config(os.path.join(tmp_path, "egemaps", "v02", "eGeMAPSv02.conf"))
+
+    assert 'egemapsv02_functionals' in instances
+    # Default dichiarati in gemaps/v01b, riusati per nome da egemaps/v02
+    assert 'writer.levelconf.nT = 500' in sections['egemapsv02_energy']
+    assert 'writer.levelconf.isRb = 1' in sections['egemapsv02_functionals']
+    # frameModeFunctionalsConf non ha mai un default: include saltato
+    assert not any(line.startswith('frameMode') for line in sections['egemapsv02_functionals'])
+
+
+def test_first_declared_default_wins(tmp_path):
+    files = {**SHARED, **COMPARE}
+    files["compare/ComParE_2016_core.func.conf.inc"] = files["compare/ComParE_2016_core.func.conf.inc"].replace(
+        "\\{\\cm[bufferModeRbConf]}",
+        "\\{\\cm[bufferModeRbConf{../shared/BufferModeRbLag.conf.inc}:redeclared]}")
+    _write_tree(tmp_path, files)
+
+    _, _, sections = parse_config(os.path.join(tmp_path, "compare", "ComParE_2016.conf"))
+
+    assert 'writer.levelconf.growDyn = 0' in sections['is13_functionalsA']
+    assert 'writer.levelconf.nT = 500' not in sections['is13_functionalsA']
+
+
+def _probe(calls, fail):
+    def validator(path):
+        calls.append(path)
+        if fail:
+            raise RuntimeError("probe fallita")
+    return validator
+
+
+def test_failed_config_retried_when_binary_changes(tmp_path):
+    smile = tmp_path / "SMILExtract"
+    smile.write_bytes(b"v1")
+    cache_dir = str(tmp_path / "cache")
+    calls = []
+
+    assert _cached_config("cfg", 'x', _probe(calls, True), cache_dir, "cfg", str(smile)) is None
+    assert _cached_config("cfg", 'x', _probe(calls, False), cache_dir, "cfg", str(smile)) is None
+    assert len(calls) == 1
+
+    # Binario aggiornato: il .failed non vale più, il config viene riprovato
+    smile.write_bytes(b"v2-updated")
+    path = _cached_config("cfg", 'x', _probe(calls, False), cache_dir, "cfg", str(smile))
+    assert path is not None and len(calls) == 2
+    assert not os.path.exists(path + ".failed")
+    assert _cached_config("cfg", 'x', _probe(calls, True), cache_dir, "cfg", str(smile)) == path
+    assert len(calls) == 2
+
+
+def test_failed_config_expires(tmp_path, monkeypatch):
+    smile = tmp_path / "SMILExtract"
+    smile.write_bytes(b"v1")
+    cache_dir = str(tmp_path / "cache")
+    calls = []
+
+    assert _cached_config("cfg", 'x', _probe(calls, True), cache_dir, "cfg", str(smile)) is None
+    monkeypatch.setattr(smile_config, 'FAILED_RETRY_SECONDS', 0)
+    assert _cached_config("cfg", 'x', _probe(calls, False), cache_dir, "cfg", str(smile)) is not None
+    assert len(calls) == 2
@@ -1,7 +1,10 @@
 import os
 import re
+import time
+import sqlite3
 import pandas as pd
 import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 def generate_id_from_filename(s: str, base: int = 131, mod: int = 2**31 - 1) -> int:
     """
@@ -25,55 +28,177 @@ def generate_id_from_filename(s: str, base: int = 131, mod: int = 2**31 - 1) ->
         h = (h * base + ord(ch)) % mod
     return h
 
-def main(root_dir, output_excel):
-    if os.path.isdir(output_excel):
-        output_excel = os.path.join(output_excel, "dataset_index.xlsx")
+# ===============================================
+# INDICE INCREMENTALE (SQLite)
+# ===============================================
+INDEX_TABLE = "dataset_index"
+INDEX_COLUMNS = ["FileName", "ID", "Tipo audio", "Tipo soggetto"]
+SQLITE_EXTENSIONS = ('.sqlite', '.sqlite3', '.db')
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {INDEX_TABLE} (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    "FileName" TEXT NOT NULL,
+    "ID" TEXT NOT NULL,
+    "Tipo audio" TEXT NOT NULL,
+    "Tipo soggetto" TEXT NOT NULL
+)
+"""
+
+
+def _is_indexed_wav(file):
+    # Considera solo i file che finiscono con ".wav" e non iniziano con "old_"
+    lower = file.lower()
+    return lower.endswith(".wav") and not lower.startswith("old_")
+
+
+def _scan_dir(directory):
+    """Una directory con os.scandir: ([(path, size, mtime_ns)], [sottocartelle])."""
+    wavs, subdirs = [], []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif _is_indexed_wav(entry.name) and entry.is_file():
+                        st = entry.stat()
+                        wavs.append((entry.path, st.st_size, st.st_mtime_ns))
+                except OSError as e:
+                    print(f"⚠️  Salto {entry.path}: {e}")
+    except OSError as e:
+        print(f"⚠️  Cartella non leggibile {directory}: {e}")
+    return wavs, subdirs
+
+
+def scan_wavs(root_dir, workers=None):
+    """
+    Elenca i WAV sotto root_dir con (path, size, mtime_ns). Le sottocartelle sono
+    visitate in parallelo (thread: lo scan è dominato dall'I/O del filesystem).
+    """
+    wavs = []
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as executor:
+        pending = {executor.submit(_scan_dir, root_dir)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                found, subdirs = future.result()
+                wavs.extend(found)
+                pending.update(executor.submit(_scan_dir, d) for d in subdirs)
+    return wavs
+
+
+def make_record(path):
+    """Riga dell'indice (colonne INDEX_COLUMNS) per un WAV."""
+    file = os.path.basename(path)
+    name = os.path.splitext(file)[0]  # senza estensione
+
+    # ---- Estrazione Type ----
+    tipo = "Free" if name.startswith("D") else "Read"
+
+    # ---- Generazione Subject ID usando hash ----
+    # Usa il base_name completo (senza estensione) per generare un ID univoco
+    subject_id = str(generate_id_from_filename(name))
+
+    # ---- Tipo soggetto (Paziente/Controllo) ----
+    folder = os.path.dirname(path).upper()
+    if "PAZIENTI" in folder:
+        tipo_soggetto = "Paziente"
+    elif "CONTROLLI" in folder:
+        tipo_soggetto = "Controllo"
     else:
-        base, ext = os.path.splitext(output_excel)
-        if ext == "":
-            output_excel = base + ".xlsx"
-    
-    # lista per raccogliere i dati
-    records = []
-    
-    for root, _, files in os.walk(root_dir):
-        for file in files:
-            # Considera solo i file che finiscono con ".wav" e non iniziano con "old_"
-            if file.lower().endswith(".wav") and not file.lower().startswith("old_"):
-                name = os.path.splitext(file)[0]  # senza estensione
-                
-                # ---- Estrazione Type ----
-                tipo = "Free" if name.startswith("D") else "Read"
-            
-                # ---- Generazione Subject ID usando hash ----
-                # Usa il base_name completo (senza estensione) per generare un ID univoco
-                subject_id = str(generate_id_from_filename(name))
-                
-                # ---- Tipo soggetto (Paziente/Controllo) ----
-                if "PAZIENTI" in root.upper():
-                    tipo_soggetto = "Paziente"
-                elif "CONTROLLI" in root.upper():
-                    tipo_soggetto = "Controllo"
-                else:
-                    tipo_soggetto = "?"
-                
-                # Aggiungi il record alla lista
-                records.append({
-                    "FileName": file,
-                    "ID": subject_id,
-                    "Tipo audio": tipo,
-                    "Tipo soggetto": tipo_soggetto
-                })
-    
-    # ---- Salvataggio in Excel ----
-    df = pd.DataFrame(records)
-    df.to_excel(output_excel, index=False)
-    print(f"✅ File Excel creato: {output_excel}")
-    print(f"📊 Totale record: {len(records)}")
+        tipo_soggetto = "?"
+
+    return file, subject_id, tipo, tipo_soggetto
+
+
+def update_index(root_dir, index_db, workers=None):
+    """
+    Aggiorna l'indice SQLite: solo i WAV nuovi o modificati (size/mtime) vengono
+    rielaborati, quelli spariti dal disco vengono rimossi.
+
+    Returns:
+        dict con 'total', 'added', 'updated', 'removed', 'unchanged'
+    """
+    root_dir = os.path.abspath(root_dir)
+    wavs = scan_wavs(root_dir, workers)
+
+    with sqlite3.connect(index_db) as conn:
+        conn.execute(_SCHEMA)
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in
+                 conn.execute(f"SELECT path, size, mtime_ns FROM {INDEX_TABLE}")}
+
+        changed = [(path, size, mtime_ns) for path, size, mtime_ns in wavs
+                   if known.get(path) != (size, mtime_ns)]
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {INDEX_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((path, size, mtime_ns) + make_record(path) for path, size, mtime_ns in changed)
+        )
+
+        # Rimuovi i WAV di root_dir non più presenti (le altre radici restano)
+        on_disk = {path for path, _, _ in wavs}
+        prefix = os.path.join(root_dir, "")
+        removed = [(path,) for path in known if path.startswith(prefix) and path not in on_disk]
+        conn.executemany(f"DELETE FROM {INDEX_TABLE} WHERE path = ?", removed)
+
+    added = sum(1 for path, _, _ in changed if path not in known)
+    return {
+        'total': len(wavs),
+        'added': added,
+        'updated': len(changed) - added,
+        'removed': len(removed),
+        'unchanged': len(wavs) - len(changed),
+    }
+
+
+def read_index(index_db):
+    """Indice SQLite come DataFrame con le colonne INDEX_COLUMNS (ordinato per path)."""
+    columns = ", ".join(f'"{c}"' for c in INDEX_COLUMNS)
+    with sqlite3.connect(index_db) as conn:
+        return pd.read_sql_query(f"SELECT {columns} FROM {INDEX_TABLE} ORDER BY path", conn)
+
+
+def main(root_dir, output, excel_output=None, workers=None):
+    """
+    Aggiorna l'indice del corpus e, se richiesto, ne esporta la vista Excel.
+
+    output: file SQLite (.sqlite/.db), cartella (-> dataset_index.sqlite) oppure,
+    per compatibilità, un file .xlsx: in quel caso l'indice SQLite è salvato
+    accanto (stesso nome, .sqlite) e l'Excel viene rigenerato come vista.
+    """
+    if os.path.isdir(output):
+        index_db = os.path.join(output, "dataset_index.sqlite")
+    else:
+        base, ext = os.path.splitext(output)
+        if ext.lower() in SQLITE_EXTENSIONS:
+            index_db = output
+        else:
+            index_db = base + ".sqlite"
+            excel_output = excel_output or base + ".xlsx"
+
+    start = time.perf_counter()
+    stats = update_index(root_dir, index_db, workers)
+    print(f"✅ Indice aggiornato: {index_db} ({time.perf_counter() - start:.1f}s)")
+    print(f"📊 Totale record: {stats['total']} | nuovi: {stats['added']} | modificati: {stats['updated']} | "
+          f"rimossi: {stats['removed']} | invariati: {stats['unchanged']}")
+
+    if excel_output:
+        changed = stats['added'] or stats['updated'] or stats['removed']
+        if changed or not os.path.exists(excel_output):
+            # ---- Vista Excel ----
+            df = read_index(index_db)
+            df.to_excel(excel_output, index=False)
+            print(f"✅ File Excel creato: {excel_output}")
+        else:
+            print(f"Excel invariato: {excel_output}")
+    return index_db
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="Crea un file Excel di indice dei file audio nella cartella specificata."
+        description="Crea/aggiorna l'indice (SQLite, con vista Excel opzionale) dei file audio nella cartella specificata."
     )
     
     parser.add_argument(
@@ -87,12 +212,28 @@ if __name__ == "__main__":
         "--output",
         type=str,
         required=True,
-        help="Percorso del file Excel di output."
+        help="Indice SQLite (.sqlite/.db) o cartella; con un .xlsx l'indice è salvato accanto e l'Excel rigenerato."
+    )
+
+    parser.add_argument(
+        "--excel",
+        type=str,
+        default=None,
+        help="Esporta anche la vista Excel dell'indice in questo file."
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Thread per la scansione delle cartelle (default: 4 x core, max 32)."
     )
     
     args = parser.parse_args()
     
     main(
         root_dir=args.root,
-        output_excel=args.output
+        output=args.output,
+        excel_output=args.excel,
+        workers=args.workers
     )
@@ -0,0 +1,70 @@
+import importlib
+
+# ============================================
+# MODEL CONFIGURATIONS
+# ============================================
+# Le classi sono indicate come path 'modulo.Classe' e importate solo quando
+# servono (load_model_class): la GUI può leggere la configurazione senza
+# caricare sklearn all'avvio.
+MODEL_CONFIGS = {
+    'random_forest': {
+        'class_path': 'sklearn.ensemble.RandomForestClassifier',
+        'param_name': 'n_estimators',
+        'default_params': {
+            'random_state': 42,
+            'n_jobs': -1,
+        },
+        'default_grid': [100, 150, 200, 300],
+        'display_name': 'Random Forest'
+    },
+    'gradient_boosting': {
+        'class_path': 'sklearn.ensemble.GradientBoostingClassifier',
+        'param_name': 'n_estimators',
+        'default_params': {
+            'random_state': 42,
+            'learning_rate': 0.05,
+        },
+        'default_grid': [50, 75, 100, 150],
+        'display_name': 'Gradient Boosting'
+    },
+    'svm': {
+        'class_path': 'sklearn.svm.SVC',
+        'param_name': 'C',
+        'default_params': {
+            'random_state': 42,
+            'kernel': 'rbf',
+            'gamma': 'scale',
+            'probability': True
+        },
+        'default_grid': [0.1, 0.5, 1.0, 5.0, 10.0],
+        'display_name': 'Support Vector Machine'
+    },
+    'logistic_regression': {
+        'class_path': 'sklearn.linear_model.LogisticRegression',
+        'param_name': 'C',
+        'default_params': {
+            'random_state': 42,
+            'max_iter': 5000,
+            'n_jobs': -1,
+        },
+        'default_grid': [0.01, 0.1, 0.5, 1.0, 5.0],
+        'display_name': 'Logistic Regression'
+    },
+    'mlp': {
+        'class_path': 'sklearn.neural_network.MLPClassifier',
+        'param_name': 'alpha',
+        'default_params': {
+            'random_state': 42,
+            'max_iter': 2000,
+            'hidden_layer_sizes': (20,)
+        },
+        'default_grid': [0.1, 0.5, 1.0, 2.0],
+        'display_name': 'Multi-Layer Perceptron'
+    }
+}
+
+
+def load_model_class(model_config):
+    """Importa e restituisce la classe del modello indicata da 'class_path'."""
+    module_name, class_name = model_config['class_path'].rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
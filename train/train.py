@@ -1,10 +1,6 @@
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split, StratifiedShuffleSplit
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.svm import SVC
-from sklearn.linear_model import LogisticRegression
-from sklearn.neural_network import MLPClassifier
 from sklearn.metrics import classification_report, balanced_accuracy_score
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 from sklearn.base import clone
@@ -12,78 +8,80 @@ from imblearn.over_sampling import SMOTE
 import joblib
 import argparse
 import os
+import sys
 import json
 
-# ============================================
-# MODEL CONFIGURATIONS
-# ============================================
-MODEL_CONFIGS = {
-    'random_forest': {
-        'class': RandomForestClassifier,
-        'param_name': 'n_estimators',
-        'default_params': {
-            'random_state': 42,
-            'n_jobs': -1,
-        },
-        'default_grid': [100, 150, 200, 300],
-        'display_name': 'Random Forest'
-    },
-    'gradient_boosting': {
-        'class': GradientBoostingClassifier,
-        'param_name': 'n_estimators',
-        'default_params': {
-            'random_state': 42,
-            'learning_rate': 0.05,
-        },
-        'default_grid': [50, 75, 100, 150],
-        'display_name': 'Gradient Boosting'
-    },
-    'svm': {
-        'class': SVC,
-        'param_name': 'C',
-        'default_params': {
-            'random_state': 42,
-            'kernel': 'rbf',
-            'gamma': 'scale',
-            'probability': True
-        },
-        'default_grid': [0.1, 0.5, 1.0, 5.0, 10.0],
-        'display_name': 'Support Vector Machine'
-    },
-    'logistic_regression': {
-        'class': LogisticRegression,
-        'param_name': 'C',
-        'default_params': {
-            'random_state': 42,
-            'max_iter': 5000,
-            'n_jobs': -1,
-        },
-        'default_grid': [0.01, 0.1, 0.5, 1.0, 5.0],
-        'display_name': 'Logistic Regression'
-    },
-    'mlp': {
-        'class': MLPClassifier,
-        'param_name': 'alpha',
-        'default_params': {
-            'random_state': 42,
-            'max_iter': 2000,
-            'hidden_layer_sizes': (20,)
-        },
-        'default_grid': [0.1, 0.5, 1.0, 2.0],
-        'display_name': 'Multi-Layer Perceptron'
-    }
-}
+# Backend out-of-core condiviso con la feature selection (e catalogo degli estrattori)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'feature_selection'))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from feature_matrix import (FeatureMatrix, iter_dataset_chunks, iter_merged_chunks, read_dataset_index,
+                            DEFAULT_CHUNK_ROWS)
 
+# Configurazioni dei modelli (classi importate al primo uso)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from model_configs import MODEL_CONFIGS, load_model_class
 
-def mc_cv_balanced_accuracy(estimator, X_tr, y_tr, test_size=0.20, n_splits=50, seed=42):
+
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+
+
+class TrainingStopped(Exception):
+    """Sollevata quando should_stop() richiede l'interruzione del training."""
+
+
+def load_merged_dataset(path, target_column, columns=None):
+    """
+    Carica un dataset già merged (feature + target).
+
+    I file .parquet (scritti da feature_selection con --output-format parquet)
+    sono letti in formato binario tipizzato e, se `columns` è indicato, solo
+    quelle colonne vengono lette dal disco. Gli altri file sono CSV con ';'.
+    """
+    usecols = None
+    if columns is not None:
+        usecols = list(dict.fromkeys(list(columns) + [target_column]))
+
+    if os.path.splitext(path)[1].lower() in PARQUET_EXTENSIONS:
+        return pd.read_parquet(path, columns=usecols)
+    return pd.read_csv(path, delimiter=';', usecols=usecols)
+
+
+def build_feature_matrix(directory, target_column, merged_dataset_path=None, feature_columns=None,
+                         dataset_custom_path=None, dataset_egemaps_path=None, dataset_index_path=None,
+                         chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Scrive il dataset (merged, oppure custom + eGeMAPS + index) a blocchi
+    in una FeatureMatrix memory-mapped in `directory`.
+    """
+    if merged_dataset_path is not None:
+        def chunks():
+            for chunk in iter_dataset_chunks(merged_dataset_path, chunk_rows):
+                if feature_columns is not None:
+                    chunk = chunk[list(dict.fromkeys(list(feature_columns) + [target_column]))]
+                yield chunk
+        source = chunks()
+    else:
+        source = iter_merged_chunks(dataset_custom_path, dataset_egemaps_path, dataset_index_path,
+                                    chunk_rows=chunk_rows)
+    return FeatureMatrix.from_chunks(source, directory, target_column)
+
+
+def mc_cv_balanced_accuracy(estimator, X_tr, y_tr, test_size=0.20, n_splits=50, seed=42,
+                            fold_callback=None, should_stop=None):
     """
     Monte-Carlo CV: esegue n_splits split 80–20 stratificati sul TRAIN,
     applica SMOTE SOLO sullo split di train, allena e valuta balanced accuracy sul 20% di validazione.
     Ritorna l'array degli score.
+
+    fold_callback(fold, score): chiamata dopo ogni fold (fold da 1 a n_splits).
+    should_stop(): controllata prima di ogni fold; se True solleva TrainingStopped.
     """
     sss = StratifiedShuffleSplit(n_splits=n_splits, test_size=test_size, random_state=seed)
     scores = []
-    for tr_idx, val_idx in sss.split(X_tr, y_tr):
+    for fold, (tr_idx, val_idx) in enumerate(sss.split(X_tr, y_tr), start=1):
+        if should_stop is not None and should_stop():
+            raise TrainingStopped("Training interrotto dall'utente")
+
         X_tr_i, X_val_i = X_tr.iloc[tr_idx], X_tr.iloc[val_idx]
         y_tr_i, y_val_i = y_tr.iloc[tr_idx], y_tr.iloc[val_idx]
 
@@ -96,6 +94,8 @@ def mc_cv_balanced_accuracy(estimator, X_tr, y_tr, test_size=0.20, n_splits=50,
         est.fit(X_tr_bal, y_tr_bal)
         y_hat = est.predict(X_val_i)
         scores.append(balanced_accuracy_score(y_val_i, y_hat))
+        if fold_callback is not None:
+            fold_callback(fold, scores[-1])
 
     scores = np.array(scores, dtype=float)
     print(f"\n[Monte-Carlo {n_splits}× (80–20 strat.)] balanced acc:"
@@ -117,7 +117,13 @@ def main(
     grid_param_list=None,
     model_type='random_forest',
     merged_dataset_path=None,
-    target_column='Tipo soggetto'
+    target_column='Tipo soggetto',
+    feature_columns=None,
+    out_of_core=False,
+    chunksize=DEFAULT_CHUNK_ROWS,
+    fold_callback=None,
+    should_stop=None,
+    catalog_path=None
 ):
     """
     Main training function with support for multiple models.
@@ -135,6 +141,32 @@ def main(
         If provided, bypasses the merge process.
     target_column : str
         Name of the target column in the dataset.
+    feature_columns : list, optional
+        Subset of feature columns to load from the merged dataset
+        (column projection, read directly from disk for parquet files).
+    out_of_core : bool
+        Load and merge the data in chunks into a memory-mapped numeric
+        feature matrix (next to model_path) instead of an in-memory pandas
+        merge; categorical columns are integer-coded while writing. Only the
+        loading is out-of-core: the estimators and SMOTE fit in memory, so
+        the train and test rows are materialized at the split.
+    chunksize : int
+        Rows per chunk in out-of-core mode.
+    fold_callback : callable, optional
+        Called with a dict for every Monte-Carlo event, as soon as it happens:
+        {'event': 'fold', 'param_name', 'param_value', 'fold', 'n_splits', 'score'}
+        after each fold and {'event': 'param_finished', 'param_name',
+        'param_value', 'mean', 'std', 'p10', 'p90'} after each grid value.
+        It runs in the training thread: GUI consumers should hand the event
+        over to their own thread (e.g. through a queue).
+    should_stop : callable, optional
+        Polled before every fold; returning True raises TrainingStopped.
+    catalog_path : str, optional
+        SQLite catalog written by the extractors (feature_extractors/catalog.py).
+        Features and target are read from it with indexed lookups instead of
+        merging the CSV files; if dataset_index_path is also given, its labels
+        are imported into the catalog first. Takes precedence over the other
+        sources (in-memory only).
     """
     # Validate model type
     if model_type not in MODEL_CONFIGS:
@@ -169,10 +201,41 @@ def main(
     # ======================
     # Load the data
     # ======================
-    if merged_dataset_path is not None:
+    if catalog_path is not None:
+        # Catalogo SQLite: feature eGeMAPS + custom e target per registrazione
+        from feature_extractors.catalog import Catalog
+        print(f"Loading features from catalog: {catalog_path}")
+        with Catalog(catalog_path) as catalog:
+            if dataset_index_path:
+                labelled = catalog.import_labels(read_dataset_index(dataset_index_path))
+                print(f"  ✓ Labels imported for {labelled} recordings")
+            merged_df = catalog.feature_frame(label=target_column)
+        if feature_columns is not None:
+            merged_df = merged_df[list(feature_columns) + [target_column]]
+        X = merged_df.drop(columns=[target_column])
+        y = merged_df[target_column]
+        print(f"  ✓ {len(merged_df)} recordings, {X.shape[1]} features")
+    elif out_of_core:
+        matrix_dir = os.path.join(os.path.dirname(model_path), 'feature_matrix')
+        print(f"Building out-of-core feature matrix in: {matrix_dir} (chunks of {chunksize} rows)")
+        feature_matrix = build_feature_matrix(
+            matrix_dir, target_column,
+            merged_dataset_path=merged_dataset_path,
+            feature_columns=feature_columns,
+            dataset_custom_path=dataset_custom_path,
+            dataset_egemaps_path=dataset_egemaps_path,
+            dataset_index_path=dataset_index_path,
+            chunk_rows=chunksize
+        )
+        # Vista sul memmap; lo split copia in memoria le righe di train e test
+        # (modelli e SMOTE non lavorano a blocchi)
+        X = feature_matrix.to_frame()
+        y = feature_matrix.target()
+        print(f"  ✓ {feature_matrix.n_rows} rows, {len(feature_matrix.columns)} features")
+    elif merged_dataset_path is not None:
         # Carica il dataset già merged
         print(f"Loading merged dataset from: {merged_dataset_path}")
-        merged_df = pd.read_csv(merged_dataset_path, delimiter=';')
+        merged_df = load_merged_dataset(merged_dataset_path, target_column, columns=feature_columns)
         
         # Features and target (tutte le colonne tranne il target sono feature)
         X = merged_df.drop(columns=[target_column])
@@ -181,7 +244,7 @@ def main(
         # Processo di merge originale
         dataset_custom = pd.read_csv(dataset_custom_path, delimiter=';')
         dataset_egemaps = pd.read_csv(dataset_egemaps_path, delimiter=';')
-        dataset_index = pd.read_excel(dataset_index_path)
+        dataset_index = read_dataset_index(dataset_index_path)
         
         # Standardize filenames (remove everything after "Italian")
         dataset_custom['filename_standard'] = dataset_custom['filename'].apply(
@@ -229,18 +292,22 @@ def main(
         y = merged_df[target_column]
     
     # Encoding categorical variables (if present in the dataset)
+    # (out-of-core: già codificate durante la scrittura della feature matrix)
     le = LabelEncoder()
     categorical_columns = X.select_dtypes(include=['object']).columns
     for col in categorical_columns:
         X[col] = le.fit_transform(X[col])
     
     # Split data into 80% train and 20% test
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y,
+    # (split sulle posizioni: stessi indici di train_test_split(X, y, ...))
+    train_pos, test_pos = train_test_split(
+        np.arange(len(y)),
         test_size=0.2,
         random_state=42,
         stratify=y
     )
+    X_train, X_test = X.iloc[train_pos], X.iloc[test_pos]
+    y_train, y_test = y.iloc[train_pos], y.iloc[test_pos]
     
     # Scaling condizionale
     # Modelli che beneficiano dello scaling dei dati
@@ -277,30 +344,52 @@ def main(
     os.makedirs(os.path.dirname(mc_summary_csv) or ".", exist_ok=True)
     print(f"\nTesting {param_name} values: {grid_param_list}")
     
+    n_splits = 50
     mc_results = []
     for param_value in grid_param_list:
         # Create model with current parameter value
         model_params = model_config['default_params'].copy()
         model_params[param_name] = param_value
-        model = model_config['class'](**model_params)
+        model = load_model_class(model_config)(**model_params)
         
         print(f"\n--- Testing {param_name}={param_value} ---")
+        if fold_callback is not None:
+            on_fold = lambda fold, score, param_value=param_value: fold_callback({
+                'event': 'fold',
+                'param_name': param_name,
+                'param_value': param_value,
+                'fold': fold,
+                'n_splits': n_splits,
+                'score': float(score)
+            })
+        else:
+            on_fold = None
         scores = mc_cv_balanced_accuracy(
             model,
             X_train,
             y_train,
             test_size=0.20,
-            n_splits=50,
-            seed=42
+            n_splits=n_splits,
+            seed=42,
+            fold_callback=on_fold,
+            should_stop=should_stop
         )
         
-        mc_results.append({
+        summary = {
             param_name: param_value,
             "mean": scores.mean(),
             "std": scores.std(),
             "p10": np.percentile(scores, 10),
             "p90": np.percentile(scores, 90)
-        })
+        }
+        mc_results.append(summary)
+        if fold_callback is not None:
+            fold_callback({
+                'event': 'param_finished',
+                'param_name': param_name,
+                'param_value': param_value,
+                **{k: float(summary[k]) for k in ("mean", "std", "p10", "p90")}
+            })
     
     mc_df = pd.DataFrame(mc_results).sort_values("mean", ascending=False)
     print(f"\n=== Monte-Carlo CV — riepilogo per {param_name} ===")
@@ -332,7 +421,7 @@ def main(
     # ==========================
     final_params = model_config['default_params'].copy()
     final_params[param_name] = best_param_value
-    final_model = model_config['class'](**final_params)
+    final_model = load_model_class(model_config)(**final_params)
     final_model.fit(X_train_res, y_train_res)
     
     # Make predictions and evaluate
@@ -383,13 +472,20 @@ if __name__ == "__main__":
         "--dataset-index",
         type=str,
         required=False,
-        help="Percorso al file dataset_index."
+        help="Percorso al dataset_index (.sqlite di build_index, .xlsx o .csv)."
     )
     parser.add_argument(
         "--merged-dataset",
         type=str,
         default=None,
-        help="Percorso al dataset già merged con solo feature e target. Se fornito, bypassa il merge."
+        help="Percorso al dataset già merged con solo feature e target (.csv o .parquet). Se fornito, bypassa il merge."
+    )
+    parser.add_argument(
+        "--feature-columns",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Sottoinsieme di colonne feature da caricare dal dataset merged (default: tutte)."
     )
     parser.add_argument(
         "--target-column",
@@ -448,10 +544,30 @@ if __name__ == "__main__":
         help="Lista di valori del parametro da testare in Monte-Carlo (automatico in base al modello se non specificato)."
     )
     
+    parser.add_argument(
+        "--out-of-core",
+        action="store_true",
+        help="Carica e unisce i dati a blocchi in una feature matrix memory-mapped (corpora molto grandi); "
+             "le righe di train e test sono comunque caricate in memoria per il training."
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=DEFAULT_CHUNK_ROWS,
+        help="Righe per blocco in modalità --out-of-core."
+    )
+    parser.add_argument(
+        "--catalog",
+        type=str,
+        default=None,
+        help="Catalogo SQLite degli estrattori: feature e target letti dal catalogo "
+             "(con --dataset-index le etichette vengono importate prima)."
+    )
+    
     args = parser.parse_args()
     
-    # Validazione: se non c'è merged_dataset, i tre path originali sono obbligatori
-    if args.merged_dataset is None:
+    # Validazione: se non c'è merged_dataset (o catalogo), i tre path originali sono obbligatori
+    if args.merged_dataset is None and args.catalog is None:
         if not all([args.dataset_custom, args.dataset_egemaps, args.dataset_index]):
             parser.error("Se --merged-dataset non è fornito, --dataset-custom, --dataset-egemaps e --dataset-index sono obbligatori.")
     
@@ -487,5 +603,9 @@ if __name__ == "__main__":
         grid_param_list=grid_param_list,
         model_type=args.model_type,
         merged_dataset_path=args.merged_dataset,
-        target_column=args.target_column
+        target_column=args.target_column,
+        feature_columns=args.feature_columns,
+        out_of_core=args.out_of_core,
+        chunksize=args.chunksize,
+        catalog_path=args.catalog
     )